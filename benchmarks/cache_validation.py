@@ -0,0 +1,95 @@
+import argparse
+import os
+from pathlib import Path
+import re
+import subprocess
+import tempfile
+import time
+from workers_scaling import generate_files
+
+
+def last_validation_time(cache_directory):
+    stats = subprocess.run(
+        ["gersemi", "--cache-stats", "--cache-dir", cache_directory],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    match = re.search(r"Last cache validation: (\d+) microseconds", stats)
+    return int(match.group(1)) / 1e6 if match else float("nan")
+
+
+def run(directory, cache_directory, workers):
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            "gersemi",
+            "--check",
+            "--cache-dir",
+            cache_directory,
+            "--workers",
+            str(workers),
+            directory,
+        ],
+        check=False,
+        capture_output=True,
+    )
+    total = time.perf_counter() - start
+    return total, last_validation_time(cache_directory)
+
+
+def measure(directory, cache_directory, workers, repeats):
+    runs = [run(directory, cache_directory, workers) for _ in range(repeats)]
+    return min(total for total, _ in runs), min(validation for _, validation in runs)
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Measure how long cache validation takes when every file is already known
+    to be formatted, with a single worker and with all available workers.
+    Validation time is reported by the backend itself, so it's given next to
+    the run time of the whole process.
+        """,
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=5000,
+        help="Number of generated files. [default: 5000]",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Best of how many runs is reported. [default: 3]",
+    )
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    with tempfile.TemporaryDirectory(prefix="gersemi-") as directory:
+        directory = Path(directory)
+        sources = directory / "sources"
+        sources.mkdir()
+        generate_files(sources, args.files, 1)
+        subprocess.run(["gersemi", "--in-place", "--no-cache", sources], check=True)
+
+        cache_directory = directory / "cache"
+        cold, _ = run(sources, cache_directory, os.cpu_count() or 1)
+        print(f"Cold run: {cold:.3f} s")
+
+        print(f"{'workers':>8} {'seconds':>10} {'validation':>11} {'us/file':>10}")
+        for workers in sorted({1, os.cpu_count() or 1}):
+            seconds, validation = measure(
+                sources, cache_directory, workers, args.repeats
+            )
+            print(
+                f"{workers:>8} {seconds:>10.3f} {validation:>11.3f}"
+                f" {validation / args.files * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+from workers_scaling import generate_files
+
+
+def measure(directory, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            ["gersemi", "--check", "--no-cache", directory],
+            check=False,
+            capture_output=True,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def generate_project(directory, args, with_configuration_files):
+    for index in range(args.directories):
+        subdirectory = directory / f"directory_{index}"
+        subdirectory.mkdir()
+        generate_files(subdirectory, args.files, args.chunks)
+        if with_configuration_files:
+            (subdirectory / ".gersemirc").write_text(
+                f"line_length: {80 + index % 2}\n", encoding="utf-8"
+            )
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Compare formatting time of a project where every directory has its own
+    configuration file with the same project using a single configuration.
+        """,
+    )
+    parser.add_argument(
+        "--directories",
+        type=int,
+        default=200,
+        help="Number of directories with separate configuration. [default: 200]",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=3,
+        help="Number of generated files in each directory. [default: 3]",
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=50,
+        help="Number of repeated code chunks in each file. [default: 50]",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Best of how many runs is reported. [default: 3]",
+    )
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=None,
+        help="""
+    Fail when project with many configuration files takes longer than
+    project with single configuration by more than this factor.
+        """,
+    )
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    seconds = {}
+    for with_configuration_files in (False, True):
+        with tempfile.TemporaryDirectory(prefix="gersemi-") as directory:
+            directory = Path(directory)
+            generate_project(directory, args, with_configuration_files)
+            seconds[with_configuration_files] = measure(directory, args.repeats)
+
+    ratio = seconds[True] / seconds[False]
+    print(f"{'configurations':>14} {'seconds':>10}")
+    print(f"{1:>14} {seconds[False]:>10.3f}")
+    print(f"{args.directories:>14} {seconds[True]:>10.3f}")
+    print(f"Ratio: {ratio:.2f}")
+    if args.max_ratio is not None and ratio > args.max_ratio:
+        print("Many configuration files leave workers idle", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
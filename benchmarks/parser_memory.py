@@ -0,0 +1,76 @@
+import argparse
+import resource
+import subprocess
+import sys
+import gersemi_rust_backend
+from gersemi.configuration import Configuration, ControlConfiguration
+from parser_scaling import generate_code
+
+
+def peak_memory_in_kilobytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(number_of_lines):
+    code = generate_code(number_of_lines)
+    configuration = Configuration(
+        control=ControlConfiguration(respect_ignore_files=False)
+    )
+    formatter = gersemi_rust_backend.Formatter(configuration=configuration)
+    formatter.format("set(FOO BAR)\n")
+
+    before = peak_memory_in_kilobytes()
+    formatter.format(code)
+    after = peak_memory_in_kilobytes()
+    print(len(code), after - before)
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Measure how much peak memory grows while formatting generated files
+    of different sizes. Each measurement runs in a separate process.
+        """,
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=100_000,
+        help="Number of lines in the largest generated file. [default: 100000]",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=4,
+        help="Number of times the file size is halved. [default: 4]",
+    )
+    parser.add_argument("--measure", type=int, default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    if args.measure is not None:
+        measure(args.measure)
+        return
+
+    print(f"{'lines':>10} {'source MB':>10} {'peak MB':>10} {'ratio':>8}")
+    for step in reversed(range(args.steps)):
+        number_of_lines = args.lines >> step
+        completed = subprocess.run(
+            [sys.executable, __file__, "--measure", str(number_of_lines)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        source_size, peak_growth = map(int, completed.stdout.split())
+        source_megabytes = source_size / 2**20
+        peak_megabytes = peak_growth / 2**10
+        print(
+            f"{number_of_lines:>10} {source_megabytes:>10.2f} "
+            f"{peak_megabytes:>10.2f} {peak_megabytes / source_megabytes:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
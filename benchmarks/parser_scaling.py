@@ -0,0 +1,97 @@
+import argparse
+import sys
+import time
+import gersemi_rust_backend
+from gersemi.configuration import Configuration, ControlConfiguration
+
+CHUNK = """function(generated_function_{index} FIRST SECOND)
+    custom_command_{index}(${{FIRST}} "${{SECOND}}" [[bracket]] OPTION)
+endfunction()
+set(VARIABLE_{index} VALUE_{index})
+"""
+LINES_PER_CHUNK = CHUNK.count("\n")
+
+
+def generate_code(number_of_lines):
+    return "".join(
+        CHUNK.format(index=index)
+        for index in range(number_of_lines // LINES_PER_CHUNK)
+    )
+
+
+def measure(formatter, code, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        formatter.format(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Measure how formatting time grows with size of the file. Generated code
+    consists of function definitions and custom commands so positions of
+    most arguments have to be resolved by the parser.
+        """,
+    )
+    parser.add_argument(
+        "--lines",
+        type=int,
+        default=100_000,
+        help="Number of lines in the largest generated file. [default: 100000]",
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=4,
+        help="Number of times the file size is halved. [default: 4]",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Best of how many runs is reported. [default: 3]",
+    )
+    parser.add_argument(
+        "--max-ratio",
+        type=float,
+        default=2.0,
+        help="""
+    Fail when time per line of the largest file exceeds time per line
+    of the smallest file by more than this factor. [default: 2.0]
+        """,
+    )
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    configuration = Configuration(
+        control=ControlConfiguration(respect_ignore_files=False)
+    )
+    formatter = gersemi_rust_backend.Formatter(configuration=configuration)
+
+    sizes = [args.lines >> step for step in reversed(range(args.steps))]
+    per_line = []
+    print(f"{'lines':>10} {'seconds':>10} {'us/line':>10}")
+    for size in sizes:
+        code = generate_code(size)
+        seconds = measure(formatter, code, args.repeats)
+        per_line.append(seconds / size)
+        print(f"{size:>10} {seconds:>10.3f} {per_line[-1] * 1e6:>10.2f}")
+
+    hits, lookups = formatter.memo_statistics()
+    if lookups > 0:
+        print(f"Formatting memo hit rate: {hits / lookups:.1%} of {lookups} lookups")
+
+    ratio = per_line[-1] / per_line[0]
+    print(f"Time per line ratio between largest and smallest file: {ratio:.2f}")
+    if ratio > args.max_ratio:
+        print("Scaling isn't linear", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
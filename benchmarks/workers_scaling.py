@@ -0,0 +1,107 @@
+import argparse
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+CODE = """set(SOURCES_{index} [[first]] [==[second]==] "third" fourth)  # comment
+add_library(library_{index} STATIC ${{SOURCES_{index}}})
+target_link_libraries(library_{index} PUBLIC dependency_{index} PRIVATE other_{index})
+if(FOO_{index} STREQUAL "BAR" AND NOT DEFINED BAZ_{index})
+    message(STATUS "Long message number {index} that has to be wrapped somewhere")
+endif()
+"""
+
+
+def generate_files(directory, number_of_files, chunks_per_file):
+    for file_index in range(number_of_files):
+        code = "".join(
+            CODE.format(index=file_index * chunks_per_file + index)
+            for index in range(chunks_per_file)
+        )
+        (directory / f"file_{file_index}.cmake").write_text(code, encoding="utf-8")
+
+
+def measure(directory, workers, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(
+            ["gersemi", "--check", "--no-cache", "--workers", str(workers), directory],
+            check=False,
+            capture_output=True,
+        )
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Measure how throughput of formatting many files grows with number of workers.
+        """,
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=400,
+        help="Number of generated files. [default: 400]",
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=200,
+        help="Number of repeated code chunks in each file. [default: 200]",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Best of how many runs is reported. [default: 3]",
+    )
+    parser.add_argument(
+        "--min-speedup",
+        type=float,
+        default=None,
+        help="""
+    Fail when throughput with the largest number of workers doesn't exceed
+    throughput of a single worker by at least this factor.
+        """,
+    )
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    max_workers = os.cpu_count() or 1
+    workers = [1]
+    while workers[-1] * 2 <= max_workers:
+        workers.append(workers[-1] * 2)
+    if workers[-1] != max_workers:
+        workers.append(max_workers)
+
+    throughputs = []
+    with tempfile.TemporaryDirectory(prefix="gersemi-") as directory:
+        directory = Path(directory)
+        generate_files(directory, args.files, args.chunks)
+
+        print(f"{'workers':>8} {'seconds':>10} {'files/s':>10} {'speedup':>8}")
+        for number_of_workers in workers:
+            seconds = measure(directory, number_of_workers, args.repeats)
+            throughputs.append(args.files / seconds)
+            speedup = throughputs[-1] / throughputs[0]
+            print(
+                f"{number_of_workers:>8} {seconds:>10.3f} "
+                f"{throughputs[-1]:>10.1f} {speedup:>8.2f}"
+            )
+
+    speedup = throughputs[-1] / throughputs[0]
+    if args.min_speedup is not None and speedup < args.min_speedup:
+        print("Throughput doesn't scale with number of workers", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
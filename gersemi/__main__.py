@@ -13,7 +13,9 @@ from gersemi.configuration import (
     normalize_definitions,
     normalize_extensions,
     normalize_path,
+    percentage_type,
     sanitize_list_expansion,
+    size_in_megabytes_type,
     workers_type,
 )
 from gersemi.print_config_kind import PrintConfigKind, print_config_kind
@@ -95,6 +97,34 @@ def create_argparser():
         paths, otherwise absolute paths are printed.
         Output can be placed in .gersemirc file verbatim.""",
     )
+    modes_group.add_argument(
+        "--lsp",
+        dest="lsp",
+        action="store_true",
+        help="""
+    Run as language server communicating through stdin and stdout.
+    Documents can be formatted as a whole or within selected range.
+    Configuration is determined for each document the same way as for src.
+        """,
+    )
+    modes_group.add_argument(
+        "--cache-stats",
+        dest="cache_stats",
+        action="store_true",
+        help="""
+    Print size of cache, number of entries stored in it and how many files
+    were found in cache during the last run, then exit.
+        """,
+    )
+    modes_group.add_argument(
+        "--cache-prune",
+        dest="cache_prune",
+        action="store_true",
+        help="""
+    Remove entries about files that no longer exist and configurations that
+    weren't used for 30 days from cache, compact cache file, then exit.
+        """,
+    )
     modes_group.add_argument(
         "--version",
         nargs=0,
@@ -143,6 +173,16 @@ def create_argparser():
     [default: skip sanity checks]
             """,
     )
+    outcome_configuration_group.add_argument(
+        "--sanity-check-sampling",
+        metavar="PERCENTAGE",
+        dest="sanity_check_sampling",
+        type=percentage_type,
+        help=f"""
+    {outcome_conf_doc["sanity_check_sampling"]}
+    [default: {OutcomeConfiguration.sanity_check_sampling}]
+        """,
+    )
     outcome_configuration_group.add_argument(
         "--definitions",
         dest="definitions",
@@ -260,12 +300,24 @@ def create_argparser():
         "--cache-dir",
         dest="cache_dir",
         type=pathlib.Path,
+        action="append",
         default=None,
         help=f"""
     {control_conf_doc["cache_dir"]}
     [default: omitted]
         """,
     )
+    control_configuration_group.add_argument(
+        "--cache-max-size",
+        metavar="MEGABYTES",
+        dest="cache_max_size",
+        type=size_in_megabytes_type,
+        default=None,
+        help=f"""
+    {control_conf_doc["cache_max_size"]}
+    [default: omitted]
+        """,
+    )
     control_configuration_group.add_argument(
         "--config",
         dest="configuration_file",
@@ -340,6 +392,11 @@ def postprocess_args(args):
     if args.configuration_file is not None:
         args.configuration_file = normalize_path(args.configuration_file)
 
+    args.read_only_cache_dirs = None
+    if args.cache_dir is not None:
+        args.cache_dir, *read_only_cache_dirs = args.cache_dir
+        args.read_only_cache_dirs = tuple(read_only_cache_dirs)
+
     args.line_ranges = tuple(
         {line_range for arg in args.line_ranges for line_range in arg}
     )
@@ -357,12 +414,17 @@ def error(text):
     sys.exit(FAIL)
 
 
-def main():
+def main(argv=None):
     try:
         argparser = create_argparser()
-        args = argparser.parse_args()
+        args = argparser.parse_args(argv)
         postprocess_args(args)
 
+        if args.lsp:
+            from gersemi.lsp import serve
+
+            sys.exit(serve(args))
+
         app = gersemi_rust_backend.App(args)
         sys.exit(app.run())
     except Exception as exception:  # pylint: disable=broad-exception-caught
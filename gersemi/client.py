@@ -0,0 +1,39 @@
+import socket
+import sys
+from gersemi.daemon import default_socket_path, is_daemon_supported, send_request
+from gersemi.return_codes import INTERNAL_ERROR
+
+
+def connect_to_daemon():
+    if not is_daemon_supported():
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(str(default_socket_path()))
+    except OSError:
+        connection.close()
+        return None
+    return connection
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    connection = None if "--lsp" in argv else connect_to_daemon()
+    if connection is None:
+        from gersemi.__main__ import main as run_in_process
+
+        run_in_process(argv)
+        return
+
+    with connection:
+        try:
+            return_code = send_request(connection, argv)
+        except OSError as exception:
+            print(f"Daemon failed to handle request: {exception}", file=sys.stderr)
+            sys.exit(INTERNAL_ERROR)
+    sys.exit(return_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # ruff: noqa: C408
 from contextlib import contextmanager
-from dataclasses import astuple, dataclass, field, fields
+from dataclasses import astuple, dataclass, field, fields, replace
 from functools import lru_cache
 import os
 from pathlib import Path
@@ -54,6 +54,20 @@ def workers_type(thing) -> Workers:
     return min(max(1, int(thing)), gersemi_rust_backend.max_number_of_workers())
 
 
+Percentage = int
+
+
+def percentage_type(thing) -> Percentage:
+    return min(max(0, int(thing)), 100)
+
+
+SizeInMegabytes = int
+
+
+def size_in_megabytes_type(thing) -> SizeInMegabytes:
+    return max(0, int(thing))
+
+
 class ListExpansion(EnumWithMetadata):
     FavourInlining = dict(
         value="favour-inlining",
@@ -160,6 +174,21 @@ class OutcomeConfiguration:  # pylint: disable=too-many-instance-attributes
         ),
     )
 
+    sanity_check_sampling: Percentage = field(
+        default=100,
+        metadata=dict(
+            title="Sanity check sampling",
+            description=doc(
+                """
+    Percentage of reformatted files verified by sanity checks when they are enabled.
+    Files are sampled based on their content so the same file is either always
+    or never verified. When less than 100 the number of verified files is reported
+    at the end of the run.
+                """
+            ),
+        ),
+    )
+
     definitions: Iterable[Path] = field(
         default=(),
         metadata=dict(
@@ -300,6 +329,38 @@ class ControlConfiguration:  # pylint: disable=too-many-instance-attributes
                 """
     Directory used to store cache file when cache is enabled.
     When omitted platform specific default cache directory will be used instead.
+    It can be specified multiple times. Cache file is stored only in the first
+    directory while cache files found in the remaining directories are only read,
+    for example seed cache prepared for the whole team.
+                """
+            ),
+        ),
+    )
+
+    read_only_cache_dirs: Iterable[Path] = field(
+        default=(),
+        metadata=dict(
+            title="Read-only cache directories",
+            description=doc(
+                """
+    Directories with cache files consulted after cache file in cache directory.
+    These cache files are never modified.
+                """
+            ),
+        ),
+    )
+
+    cache_max_size: Optional[SizeInMegabytes] = field(
+        default=None,
+        metadata=dict(
+            title="Maximum cache size",
+            description=doc(
+                """
+    Maximum size of cache file in megabytes. When cache grows beyond that
+    entries about least recently used configurations are evicted and then
+    least recently used formatted outputs. The limit is best-effort: entries
+    about configurations used in the current run are kept even when cache
+    remains above the limit. When omitted cache size isn't limited.
                 """
             ),
         ),
@@ -517,6 +578,10 @@ def load_configuration_from_file(
                 )
             if "indent" in config:
                 config["indent"] = indent_type(config["indent"])
+            if "sanity_check_sampling" in config:
+                config["sanity_check_sampling"] = percentage_type(
+                    config["sanity_check_sampling"]
+                )
             if "extensions" in config:
                 config["extensions"] = normalize_extensions(config["extensions"])
         return OutcomeConfiguration(**config)
@@ -524,13 +589,14 @@ def load_configuration_from_file(
 
 def override_with_args(configuration, args):
     parameters = [field.name for field in fields(type(configuration))]
+    overrides = {}
     for param in parameters:
         value = getattr(args, param)
         if value is None:
             continue
 
-        setattr(configuration, param, value)
-    return configuration
+        overrides[param] = value
+    return replace(configuration, **overrides)
 
 
 def make_outcome_configuration(configuration_file, args) -> OutcomeConfiguration:
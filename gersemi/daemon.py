@@ -0,0 +1,235 @@
+import argparse
+import array
+from contextlib import contextmanager, suppress
+import json
+import os
+from pathlib import Path
+import signal
+import socket
+import struct
+import sys
+import tempfile
+from gersemi.return_codes import FAIL, SUCCESS
+
+SOCKET_ENVIRONMENT_VARIABLE = "GERSEMI_DAEMON_SOCKET"
+STANDARD_STREAMS = (0, 1, 2)
+HEADER = struct.Struct("!I")
+RETURN_CODE = struct.Struct("!i")
+
+
+def is_daemon_supported():
+    return hasattr(socket, "AF_UNIX") and hasattr(socket.socket, "sendmsg")
+
+
+def default_socket_path() -> Path:
+    if SOCKET_ENVIRONMENT_VARIABLE in os.environ:
+        return Path(os.environ[SOCKET_ENVIRONMENT_VARIABLE])
+
+    from gersemi.__version__ import __title__, __version__
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return (
+        Path(runtime_dir) / f"{__title__}-{os.getuid()}" / f"daemon-{__version__}.sock"
+    )
+
+
+def receive_exactly(connection, size):
+    result = b""
+    while len(result) < size:
+        chunk = connection.recv(size - len(result))
+        if not chunk:
+            raise ConnectionError("Connection closed prematurely")
+        result += chunk
+    return result
+
+
+def send_request(connection, argv):
+    payload = json.dumps({"argv": argv, "cwd": str(Path.cwd())}).encode("utf-8")
+    fds = array.array("i", STANDARD_STREAMS)
+    connection.sendmsg(
+        [HEADER.pack(len(payload)) + payload],
+        [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)],
+    )
+    (return_code,) = RETURN_CODE.unpack(receive_exactly(connection, RETURN_CODE.size))
+    return return_code
+
+
+def receive_request(connection):
+    fds = array.array("i")
+    header, ancillary_data, _, _ = connection.recvmsg(
+        HEADER.size, socket.CMSG_SPACE(len(STANDARD_STREAMS) * fds.itemsize)
+    )
+    for level, kind, data in ancillary_data:
+        if (level, kind) == (socket.SOL_SOCKET, socket.SCM_RIGHTS):
+            fds.frombytes(data[: len(data) - (len(data) % fds.itemsize)])
+
+    try:
+        if len(fds) != len(STANDARD_STREAMS):
+            raise ConnectionError("Client didn't provide standard streams")
+
+        header += receive_exactly(connection, HEADER.size - len(header))
+        (size,) = HEADER.unpack(header)
+        request = json.loads(receive_exactly(connection, size).decode("utf-8"))
+        return request["argv"], request["cwd"], list(fds)
+    except Exception:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def flush_standard_streams():
+    for stream in (sys.stdout, sys.stderr):
+        with suppress(OSError, ValueError):
+            stream.flush()
+
+
+def forget_cached_configuration():
+    from gersemi.configuration import load_configuration_from_file
+    from gersemi.extensions import load_definitions_from_extension
+
+    load_configuration_from_file.cache_clear()
+    load_definitions_from_extension.cache_clear()
+
+
+@contextmanager
+def client_environment(cwd, fds):
+    original_fds = [os.dup(fd) for fd in STANDARD_STREAMS]
+    original_cwd = Path.cwd()
+    flush_standard_streams()
+    try:
+        for source, target in zip(fds, STANDARD_STREAMS):
+            os.dup2(source, target)
+        os.chdir(cwd)
+        forget_cached_configuration()
+        yield
+    finally:
+        flush_standard_streams()
+        for source, target in zip(original_fds, STANDARD_STREAMS):
+            os.dup2(source, target)
+            os.close(source)
+        os.chdir(original_cwd)
+
+
+def run_main(entry_point, argv):
+    try:
+        entry_point(argv)
+    except SystemExit as exit_request:
+        if exit_request.code is None:
+            return SUCCESS
+        if isinstance(exit_request.code, int):
+            return exit_request.code
+        print(exit_request.code, file=sys.stderr)
+        return FAIL
+    return SUCCESS
+
+
+def handle_connection(connection, entry_point):
+    argv, cwd, fds = receive_request(connection)
+    try:
+        with client_environment(cwd, fds):
+            return_code = run_main(entry_point, argv)
+    finally:
+        for fd in fds:
+            os.close(fd)
+    connection.sendall(RETURN_CODE.pack(return_code))
+
+
+def is_daemon_running(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        try:
+            connection.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def prepare_socket_directory(socket_path):
+    directory = socket_path.parent
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    status = directory.stat()
+    if status.st_uid != os.getuid() or (status.st_mode & 0o077) != 0:
+        raise RuntimeError(
+            f"Socket directory {directory} has to be owned by current user and inaccessible to others"  # pylint: disable=line-too-long
+        )
+
+
+def create_server_socket(socket_path):
+    prepare_socket_directory(socket_path)
+    if is_daemon_running(socket_path):
+        raise RuntimeError(f"Daemon is already listening on {socket_path}")
+    if socket_path.exists():
+        socket_path.unlink()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(str(socket_path))
+    finally:
+        os.umask(old_umask)
+    server.listen()
+    return server
+
+
+def serve(socket_path):
+    from gersemi.__main__ import main as entry_point
+
+    server = create_server_socket(socket_path)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Listening on {socket_path}", file=sys.stderr)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    handle_connection(connection, entry_point)
+                except Exception as exception:  # pylint: disable=broad-exception-caught
+                    print(f"Failed to handle request: {exception}", file=sys.stderr)
+    finally:
+        server.close()
+        socket_path.unlink()
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(
+        description="""
+    Keep gersemi loaded in the background and format on behalf of gersemi-client.
+    Configuration files, extensions and definitions are checked for changes
+    on every request. Installed extension modules are loaded only once.
+        """,
+        prog="gersemi-daemon",
+    )
+    parser.add_argument(
+        "--socket",
+        dest="socket_path",
+        type=Path,
+        default=None,
+        help=f"""
+    Path to Unix socket the daemon listens on.
+    [default: value of {SOCKET_ENVIRONMENT_VARIABLE} or path in user runtime directory]
+        """,
+    )
+    return parser
+
+
+def main():
+    args = create_argparser().parse_args()
+    if not is_daemon_supported():
+        print("Daemon mode isn't supported on this platform", file=sys.stderr)
+        sys.exit(FAIL)
+
+    if args.socket_path is None:
+        socket_path = default_socket_path()
+    else:
+        socket_path = args.socket_path.absolute()
+
+    try:
+        serve(socket_path)
+    except KeyboardInterrupt:
+        pass
+    except Exception as exception:  # pylint: disable=broad-exception-caught
+        print(exception, file=sys.stderr)
+        sys.exit(FAIL)
+
+
+if __name__ == "__main__":
+    main()
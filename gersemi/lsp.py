@@ -0,0 +1,326 @@
+from dataclasses import dataclass
+import json
+from pathlib import Path
+import sys
+import time
+from typing import Optional
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+import gersemi_rust_backend
+from gersemi.configuration import (
+    Configuration,
+    LineRange,
+    load_configuration_from_file,
+    make_control_configuration,
+    make_outcome_configuration,
+)
+from gersemi.extensions import load_definitions_from_extension
+from gersemi.return_codes import FAIL, SUCCESS
+
+METHOD_NOT_FOUND = -32601
+INVALID_REQUEST = -32600
+REQUEST_FAILED = -32803
+TEXT_DOCUMENT_SYNC_INCREMENTAL = 2
+MESSAGE_TYPE_LOG = 4
+
+
+def read_message(stream):
+    headers = {}
+    while True:
+        line = stream.readline()
+        if not line:
+            return None
+
+        line = line.decode("ascii").strip()
+        if not line:
+            break
+
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    content_length = int(headers["content-length"])
+    return json.loads(stream.read(content_length).decode("utf-8"))
+
+
+def write_message(stream, message):
+    body = json.dumps(message).encode("utf-8")
+    stream.write(f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+    stream.flush()
+
+
+def uri_to_path(uri):
+    parsed = urlparse(uri)
+    return Path(url2pathname(unquote(parsed.path)))
+
+
+def offset_of(text, line_starts, position):
+    line = position["line"]
+    if line >= len(line_starts):
+        return len(text)
+
+    offset = line_starts[line]
+    remaining = position["character"]
+    while remaining > 0 and offset < len(text) and text[offset] != "\n":
+        remaining -= 2 if ord(text[offset]) > 0xFFFF else 1
+        offset += 1
+    return offset
+
+
+def apply_change(text, change):
+    if "range" not in change:
+        return change["text"]
+
+    line_starts = [0]
+    line_starts.extend(
+        index + 1 for index, character in enumerate(text) if character == "\n"
+    )
+    start = offset_of(text, line_starts, change["range"]["start"])
+    end = offset_of(text, line_starts, change["range"]["end"])
+    return text[:start] + change["text"] + text[end:]
+
+
+def whole_document_edit(before, after):
+    if before == after:
+        return []
+
+    return [
+        {
+            "range": {
+                "start": {"line": 0, "character": 0},
+                "end": {"line": before.count("\n") + 1, "character": 0},
+            },
+            "newText": after,
+        }
+    ]
+
+
+def number_of_lines(text):
+    if not text or text.endswith("\n"):
+        return text.count("\n")
+    return text.count("\n") + 1
+
+
+def find_closest_dot_gersemirc(path):
+    for parent in path.parents:
+        candidate = parent / ".gersemirc"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def stamp(path):
+    if path is None:
+        return None
+
+    try:
+        status = Path(path).stat()
+    except OSError:
+        return None
+    return (status.st_size, status.st_mtime_ns)
+
+
+class RequestFailed(Exception):
+    pass
+
+
+@dataclass
+class OpenDocument:
+    path: Path
+    text: str
+    configuration_file: Optional[Path]
+    configuration_file_stamp: Optional[tuple]
+    configuration: Configuration
+    backend: gersemi_rust_backend.Document
+
+
+class Server:
+    def __init__(self, args, reader, writer):
+        self.args = args
+        self.reader = reader
+        self.writer = writer
+        self.control = make_control_configuration(args)
+        self.documents = {}
+        self.was_shut_down = False
+        self.should_exit = False
+        gersemi_rust_backend.register_warning_sink(self.control.quiet)
+
+    def configuration_file_for(self, path):
+        if self.control.configuration_file is not None:
+            return self.control.configuration_file
+
+        return find_closest_dot_gersemirc(path)
+
+    def open_document(self, uri, text):
+        path = uri_to_path(uri)
+        configuration_file = self.configuration_file_for(path)
+        configuration = Configuration(
+            outcome=make_outcome_configuration(configuration_file, self.args),
+            control=self.control,
+        )
+        self.documents[uri] = OpenDocument(
+            path=path,
+            text=text,
+            configuration_file=configuration_file,
+            configuration_file_stamp=stamp(configuration_file),
+            configuration=configuration,
+            backend=gersemi_rust_backend.Document(configuration, path, text),
+        )
+
+    def document(self, uri):
+        document = self.documents.get(uri)
+        if document is None:
+            raise RequestFailed(f"Document {uri} isn't open")
+
+        if stamp(document.configuration_file) != document.configuration_file_stamp:
+            load_configuration_from_file.cache_clear()
+            load_definitions_from_extension.cache_clear()
+            self.open_document(uri, document.text)
+            document = self.documents[uri]
+
+        return document
+
+    def log(self, message):
+        self.notify("window/logMessage", {"type": MESSAGE_TYPE_LOG, "message": message})
+
+    def log_warnings(self):
+        for warning in gersemi_rust_backend.take_warnings():
+            self.log(warning)
+
+    def notify(self, method, params):
+        message = {"jsonrpc": "2.0", "method": method, "params": params}
+        write_message(self.writer, message)
+
+    def initialize(self, _):
+        from gersemi.__version__ import __title__, __version__
+
+        return {
+            "capabilities": {
+                "textDocumentSync": {
+                    "openClose": True,
+                    "change": TEXT_DOCUMENT_SYNC_INCREMENTAL,
+                },
+                "documentFormattingProvider": True,
+                "documentRangeFormattingProvider": True,
+            },
+            "serverInfo": {"name": __title__, "version": __version__},
+        }
+
+    def shutdown(self, _):
+        self.was_shut_down = True
+
+    def exit_server(self, _):
+        self.should_exit = True
+
+    def did_open(self, params):
+        item = params["textDocument"]
+        self.open_document(item["uri"], item["text"])
+
+    def did_change(self, params):
+        document = self.documents.get(params["textDocument"]["uri"])
+        if document is None:
+            return
+
+        for change in params["contentChanges"]:
+            document.text = apply_change(document.text, change)
+        document.backend.update(document.text)
+
+    def did_close(self, params):
+        self.documents.pop(params["textDocument"]["uri"], None)
+
+    def format_document(self, document, format_code):
+        if document.configuration.outcome.disable_formatting:
+            return []
+
+        try:
+            formatted = format_code(document.backend)
+        except Exception as exception:
+            raise RequestFailed(f"{document.path}: {exception}") from exception
+        return whole_document_edit(document.text, formatted)
+
+    def formatting(self, params):
+        document = self.document(params["textDocument"]["uri"])
+        return self.format_document(document, lambda backend: backend.format())
+
+    def range_formatting(self, params):
+        document = self.document(params["textDocument"]["uri"])
+        start = params["range"]["start"]["line"] + 1
+        end = params["range"]["end"]
+        end = end["line"] + 1 if end["character"] > 0 else end["line"]
+        end = min(max(start, end), number_of_lines(document.text))
+        if start > end:
+            return []
+
+        line_range = LineRange(start=start, end=end)
+        return self.format_document(
+            document, lambda backend: backend.format_lines([line_range])
+        )
+
+    HANDLERS = {
+        "initialize": initialize,
+        "shutdown": shutdown,
+        "exit": exit_server,
+        "textDocument/didOpen": did_open,
+        "textDocument/didChange": did_change,
+        "textDocument/didClose": did_close,
+        "textDocument/formatting": formatting,
+        "textDocument/rangeFormatting": range_formatting,
+    }
+
+    TIMED_METHODS = {"textDocument/formatting", "textDocument/rangeFormatting"}
+
+    def respond(self, message, result=None, error=None):
+        response = {"jsonrpc": "2.0", "id": message["id"]}
+        if error is None:
+            response["result"] = result
+        else:
+            response["error"] = error
+        write_message(self.writer, response)
+
+    def fail(self, message, code, reason):
+        self.respond(message, error={"code": code, "message": reason})
+
+    def handle(self, message):
+        method = message.get("method")
+        is_request = "id" in message
+        handler = self.HANDLERS.get(method)
+        if handler is None:
+            if is_request:
+                self.fail(message, METHOD_NOT_FOUND, f"Unknown method {method}")
+            return
+
+        if self.was_shut_down and method != "exit":
+            if is_request:
+                self.fail(message, INVALID_REQUEST, "Server was shut down")
+            return
+
+        start = time.perf_counter()
+        try:
+            result = handler(self, message.get("params"))
+        except Exception as exception:  # pylint: disable=broad-exception-caught
+            if is_request:
+                self.fail(message, REQUEST_FAILED, str(exception))
+            else:
+                self.log(f"{method} failed: {exception}")
+            return
+        finally:
+            self.log_warnings()
+
+        if is_request:
+            self.respond(message, result=result)
+
+        if method in self.TIMED_METHODS:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.log(f"{method} took {elapsed:.1f} ms")
+
+    def run(self):
+        while not self.should_exit:
+            message = read_message(self.reader)
+            if message is None:
+                break
+            self.handle(message)
+
+        return SUCCESS if self.was_shut_down else FAIL
+
+
+def serve(args):
+    return Server(args, sys.stdin.buffer, sys.stdout.buffer).run()
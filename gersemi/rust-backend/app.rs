@@ -2,21 +2,29 @@ use crate::args::Args;
 use crate::args::Mode;
 use crate::args::PrintConfigKind;
 use crate::cache::file_entry;
-use crate::cache::Cache;
-use crate::configuration::{Configuration, ControlConfiguration, OutcomeConfiguration};
+use crate::cache::{Cache, CacheUsage, FileToFormat};
+use crate::configuration::{Configuration, ControlConfiguration};
+use crate::formatter::{Formatter, UnknownCommandsUsed};
+use crate::formatter_registry::find_formatter;
 use crate::runner::handle_already_formatted_files;
 use crate::runner::handle_files_to_format;
 use crate::runner::is_stdin;
+use crate::runner::Job;
+use crate::runner::SanityCheckReport;
 use crate::runner::{FAIL, SUCCESS};
 use crate::utils::default_report;
+use crate::utils::thread_pool;
 use crate::utils::{
     get_files, make_control_configuration, make_outcome_configuration, print_configuration_report,
 };
-use crate::warning_sink::{flush_warnings, register_warning_sink, WarningSink};
+use crate::warning_sink::{flush_warnings, register_warning_sink, warn, WarningSink};
 use pyo3::exceptions::PyRuntimeError;
 use pyo3::{pyclass, pymethods, Py, PyAny, PyResult, Python};
-use rayon::ThreadPoolBuilder;
+use rayon::iter::{IndexedParallelIterator, IntoParallelIterator, ParallelIterator};
+use std::collections::HashMap;
 use std::path::{Path, PathBuf};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
 
 pub struct StatusCode {
     value: usize,
@@ -38,35 +46,117 @@ pub struct App {
     configuration: ControlConfiguration,
     args: Args,
     status_code: StatusCode,
+    sanity_check_report: Option<SanityCheckReport>,
+    cache_usage: CacheUsage,
 }
 
 fn split_files_by_formatting_state(
-    cache: &mut Cache,
+    cache: &Cache,
     files: Vec<PathBuf>,
-    configuration: &OutcomeConfiguration,
-) -> PyResult<(Vec<PathBuf>, Vec<PathBuf>)> {
-    let mut already_formatted_files = Vec::<PathBuf>::new();
-    let mut files_to_format = Vec::<PathBuf>::new();
-    let configuration_summary = configuration.summarize()?;
-    let known_files = cache.get_files(&configuration_summary);
-
-    for f in files {
-        let Some(known_file_metadata) = known_files.get(&f) else {
-            files_to_format.push(f);
-            continue;
-        };
-
-        let Ok((_, size, modification_time)) = file_entry(&f) else {
-            files_to_format.push(f);
-            continue;
-        };
-        if (size, modification_time) == *known_file_metadata {
-            already_formatted_files.push(f);
-        } else {
-            files_to_format.push(f);
-        }
+    configuration_summary: &str,
+) -> (Vec<(PathBuf, UnknownCommandsUsed)>, Vec<FileToFormat>) {
+    let mut known_files = cache.get_files(configuration_summary);
+    let (already_formatted_files, files_to_format): (Vec<PathBuf>, Vec<PathBuf>) =
+        files.into_par_iter().partition(|f| {
+            known_files
+                .get(f)
+                .is_some_and(|(known_size, known_modification_time, _)| {
+                    file_entry(f).is_ok_and(|(_, size, modification_time)| {
+                        (size, modification_time) == (*known_size, *known_modification_time)
+                    })
+                })
+        });
+    let mut already_formatted_files = already_formatted_files
+        .into_iter()
+        .map(|f| {
+            let unknown_commands_used = known_files
+                .remove(&f)
+                .map(|(_, _, unknown_commands_used)| unknown_commands_used)
+                .unwrap_or_default();
+            (f, unknown_commands_used)
+        })
+        .collect::<Vec<_>>();
+
+    let (known_contents, files_to_format) =
+        cache.split_by_content(configuration_summary, files_to_format);
+    already_formatted_files.extend(known_contents);
+    (already_formatted_files, files_to_format)
+}
+
+struct PreparedBucket {
+    already_formatted_files: Vec<(PathBuf, UnknownCommandsUsed)>,
+    formatter_warnings: Vec<String>,
+    job: Job,
+}
+
+type SharedFormatter = (String, Arc<Formatter>, Vec<String>);
+
+fn share_formatters(
+    buckets: &[(Configuration, Vec<PathBuf>)],
+) -> PyResult<(Vec<SharedFormatter>, Vec<usize>)> {
+    let mut distinct = Vec::<usize>::new();
+    let mut formatter_of_bucket = Vec::<usize>::with_capacity(buckets.len());
+    let mut known = HashMap::<String, usize>::new();
+    for (index, (configuration, _)) in buckets.iter().enumerate() {
+        let formatter_index = *known
+            .entry(format!("{:?}", configuration.outcome))
+            .or_insert_with(|| {
+                distinct.push(index);
+                distinct.len() - 1
+            });
+        formatter_of_bucket.push(formatter_index);
     }
-    Ok((already_formatted_files, files_to_format))
+
+    let formatters = distinct
+        .into_par_iter()
+        .map(|index| {
+            let configuration = &buckets[index].0;
+            Python::attach(|py| find_formatter(py, configuration))
+        })
+        .collect::<PyResult<Vec<_>>>()?;
+    Ok((formatters, formatter_of_bucket))
+}
+
+fn prepare_buckets(
+    cache: &Cache,
+    buckets: Vec<(Configuration, Vec<PathBuf>)>,
+) -> PyResult<(Vec<PreparedBucket>, Duration)> {
+    let (mut formatters, formatter_of_bucket) = share_formatters(&buckets)?;
+    let validation_start = Instant::now();
+    let splits = buckets
+        .into_par_iter()
+        .enumerate()
+        .map(|(index, (configuration, files))| {
+            let formatter_index = formatter_of_bucket[index];
+            let configuration_summary = &formatters[formatter_index].0;
+            (
+                configuration,
+                formatter_index,
+                split_files_by_formatting_state(cache, files, configuration_summary),
+            )
+        })
+        .collect::<Vec<_>>();
+    let validation_time = validation_start.elapsed();
+
+    let prepared_buckets = splits
+        .into_iter()
+        .map(
+            |(configuration, formatter_index, (already_formatted_files, files_to_format))| {
+                let (configuration_summary, formatter, warnings) = &mut formatters[formatter_index];
+                PreparedBucket {
+                    already_formatted_files,
+                    formatter_warnings: std::mem::take(warnings),
+                    job: Job {
+                        configuration,
+                        configuration_summary: configuration_summary.clone(),
+                        formatter: formatter.clone(),
+                        files: files_to_format,
+                    },
+                }
+            },
+        )
+        .collect();
+    Ok((prepared_buckets, validation_time))
 }
 
 pub type Buckets = Vec<(Option<PathBuf>, Vec<PathBuf>)>;
@@ -93,63 +183,144 @@ impl App {
     fn new(args: Py<PyAny>) -> PyResult<Self> {
         let configuration = make_control_configuration(&args)?;
         register_warning_sink(WarningSink::new(configuration.quiet));
-        ThreadPoolBuilder::new()
-            .num_threads(configuration.workers.value())
-            .build_global()
-            .unwrap();
 
         let args = Args::new(args)?;
-        let should_cache = matches!(
-            args.mode,
-            Mode::CheckFormatting | Mode::CheckFormattingAndShowDiff | Mode::RewriteInPlace
-        );
+        let should_cache = !matches!(args.mode, Mode::PrintConfig);
         let cache = Cache::new(
             should_cache && configuration.cache && configuration.line_ranges.is_empty(),
             configuration.cache_dir.as_ref(),
+            &configuration.read_only_cache_dirs,
         );
         Ok(Self {
             cache,
             configuration,
             args,
             status_code: StatusCode::new(),
+            sanity_check_report: None,
+            cache_usage: CacheUsage::default(),
         })
     }
 
-    #[allow(clippy::needless_pass_by_value)]
-    fn handle_files(
-        &mut self,
-        py: Python,
-        configuration_file: Option<PathBuf>,
-        files: Vec<PathBuf>,
-    ) -> PyResult<()> {
-        let outcome = make_outcome_configuration(configuration_file.as_ref(), &self.args.obj)?;
-        if outcome.disable_formatting {
-            return Ok(());
-        }
-
-        let configuration = Configuration {
-            control: self.configuration.clone(),
-            outcome,
-        };
-        let (already_formatted_files, files_to_format) =
-            split_files_by_formatting_state(&mut self.cache, files, &configuration.outcome)?;
-
-        for code in handle_already_formatted_files(
-            &configuration,
-            &self.args.mode,
-            &already_formatted_files,
-        ) {
-            self.status_code.add(code);
+    fn handle_buckets(&mut self, py: Python, buckets: Buckets) -> PyResult<()> {
+        let mut configured_buckets = Vec::with_capacity(buckets.len());
+        for (configuration_file, files) in buckets {
+            let outcome = make_outcome_configuration(configuration_file.as_ref(), &self.args.obj)?;
+            if !outcome.disable_formatting {
+                let configuration = Configuration {
+                    control: self.configuration.clone(),
+                    outcome,
+                };
+                configured_buckets.push((configuration, files));
+            }
         }
 
-        for code in handle_files_to_format(
+        let pool = thread_pool(self.configuration.workers.value())?;
+        let cache = &self.cache;
+        let (prepared_buckets, validation_time) =
+            py.detach(|| pool.install(|| prepare_buckets(cache, configured_buckets)))?;
+        self.cache_usage.add_validation_time(validation_time);
+
+        let mut jobs = Vec::<Job>::with_capacity(prepared_buckets.len());
+        let mut pending_results = Vec::with_capacity(prepared_buckets.len());
+        for bucket in prepared_buckets {
+            pending_results.push((
+                bucket.already_formatted_files.len(),
+                handle_already_formatted_files(
+                    &bucket.job.configuration,
+                    &self.args.mode,
+                    bucket.already_formatted_files,
+                ),
+                bucket.formatter_warnings,
+            ));
+            jobs.push(bucket.job);
+        }
+
+        let results = handle_files_to_format(
             py,
-            &configuration,
             &self.args.mode,
-            &mut self.cache,
-            files_to_format,
-        )? {
-            self.status_code.add(code);
+            &self.cache,
+            &jobs,
+            self.configuration.workers.value(),
+        )?;
+        for (
+            (job, job_results),
+            (already_formatted_count, already_formatted_results, formatter_warnings),
+        ) in jobs.iter().zip(results).zip(pending_results)
+        {
+            let hits = already_formatted_count + job_results.output_cache_hits;
+            let misses = job.files.len() - job_results.output_cache_hits;
+            self.cache_usage
+                .add(&job.configuration_summary, hits, misses);
+            for (code, warnings) in already_formatted_results {
+                self.status_code.add(code);
+                for warning in warnings {
+                    warn(warning);
+                }
+            }
+            for warning in formatter_warnings {
+                warn(warning);
+            }
+
+            let mut sanity_check_report = SanityCheckReport::default();
+            for (code, warnings, report) in job_results.results {
+                self.status_code.add(code);
+                for warning in warnings {
+                    warn(warning);
+                }
+                sanity_check_report.add(report);
+            }
+
+            let outcome = &job.configuration.outcome;
+            if !outcome.disable_sanity_checks && outcome.sanity_check_sampling < 100 {
+                self.sanity_check_report
+                    .get_or_insert_default()
+                    .add(sanity_check_report);
+            }
+        }
+        Ok(())
+    }
+
+    fn print_sanity_check_report(&self) {
+        if self.configuration.quiet {
+            return;
+        }
+
+        if let Some(report) = self.sanity_check_report {
+            eprintln!(
+                "Sanity checks verified {} of {} reformatted files",
+                report.verified, report.reformatted
+            );
+        }
+    }
+
+    fn print_cache_report(&self) {
+        if self.configuration.quiet {
+            return;
+        }
+
+        let (lock_conflicts, dropped_updates) = self.cache.statistics();
+        if dropped_updates > 0 {
+            eprintln!(
+                "Cache updates dropped: {dropped_updates} (lock conflicts with other processes: {lock_conflicts})"
+            );
+        }
+    }
+
+    fn maintain_cache(&self) -> PyResult<()> {
+        if self.args.cache_prune {
+            let (files, configurations) = self
+                .cache
+                .prune()
+                .ok_or_else(|| PyRuntimeError::new_err("Cache couldn't be pruned"))?;
+            println!("Pruned {files} missing files and {configurations} stale configurations");
+        }
+
+        if self.args.cache_stats {
+            let report = self
+                .cache
+                .report()
+                .ok_or_else(|| PyRuntimeError::new_err("Cache couldn't be read"))?;
+            print!("{report}");
         }
         Ok(())
     }
@@ -200,6 +371,11 @@ impl App {
             return Ok(self.status_code());
         }
 
+        if self.args.cache_stats || self.args.cache_prune {
+            self.maintain_cache()?;
+            return Ok(self.status_code());
+        }
+
         if self.args.sources.is_empty() {
             return Ok(self.status_code());
         }
@@ -215,16 +391,19 @@ impl App {
         }
 
         let buckets = self.get_source_file_buckets()?;
-        let is_print_config_mode = matches!(self.args.mode, Mode::PrintConfig);
-        for (configuration_file, files) in buckets {
-            if is_print_config_mode {
+        if matches!(self.args.mode, Mode::PrintConfig) {
+            for (configuration_file, files) in buckets {
                 print_configuration_report(configuration_file, files, &self.args.obj)?;
-            } else {
-                self.handle_files(py, configuration_file, files)?;
             }
+        } else {
+            self.handle_buckets(py, buckets)?;
         }
 
+        self.cache
+            .finish_run(&self.cache_usage, self.configuration.cache_max_size);
         self.handle_warnings();
+        self.print_sanity_check_report();
+        self.print_cache_report();
         Ok(self.status_code())
     }
 }
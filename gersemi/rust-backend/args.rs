@@ -19,6 +19,8 @@ pub struct Args {
     pub definitions: Option<Vec<PathBuf>>,
     pub print_config: Option<PrintConfigKind>,
     pub mode: Mode,
+    pub cache_stats: bool,
+    pub cache_prune: bool,
 }
 
 struct ArgsExtractor<'a> {
@@ -79,12 +81,16 @@ impl Args {
             let mode = get_mode(&args, print_config.as_ref())?;
             let sources = args.value("sources")?;
             let definitions = args.value("definitions")?;
+            let cache_stats = args.value("cache_stats")?;
+            let cache_prune = args.value("cache_prune")?;
             Ok(Self {
                 obj,
                 sources,
                 definitions,
                 print_config,
                 mode,
+                cache_stats,
+                cache_prune,
             })
         })
     }
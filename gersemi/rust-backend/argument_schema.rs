@@ -627,12 +627,192 @@ pub struct CommandSchema {
 
 pub type CommandSchemaMapping = HashMap<String, CommandSchema>;
 
+pub struct SchemaDecoder<'a> {
+    tokens: std::str::Lines<'a>,
+}
+
+impl<'a> SchemaDecoder<'a> {
+    pub fn new(blob: &'a str) -> Self {
+        Self {
+            tokens: blob.lines(),
+        }
+    }
+
+    fn token(&mut self) -> Option<&'a str> {
+        self.tokens.next()
+    }
+
+    fn string(&mut self) -> Option<String> {
+        self.token().map(ToString::to_string)
+    }
+
+    fn count(&mut self) -> Option<usize> {
+        self.token()?.parse().ok()
+    }
+
+    fn flag(&mut self) -> Option<bool> {
+        match self.token()? {
+            "0" => Some(false),
+            "1" => Some(true),
+            _ => None,
+        }
+    }
+
+    fn optional_string(&mut self) -> Option<Option<String>> {
+        if self.flag()? {
+            Some(Some(self.string()?))
+        } else {
+            Some(None)
+        }
+    }
+
+    fn matcher_with_tag(&mut self, tag: &str) -> Option<KeywordMatcher> {
+        let first = self.string()?;
+        let second = match tag {
+            "1" => None,
+            "2" => Some(SecondKeyword::String(self.string()?)),
+            "*" => Some(SecondKeyword::Any),
+            _ => return None,
+        };
+        Some(KeywordMatcher { first, second })
+    }
+
+    fn matcher(&mut self) -> Option<KeywordMatcher> {
+        let tag = self.token()?;
+        self.matcher_with_tag(tag)
+    }
+
+    fn matchers(&mut self) -> Option<Vec<KeywordMatcher>> {
+        (0..self.count()?).map(|_| self.matcher()).collect()
+    }
+
+    fn strings(&mut self) -> Option<Vec<String>> {
+        (0..self.count()?).map(|_| self.string()).collect()
+    }
+
+    fn keyword_kinds<T>(&mut self, from_str: fn(&str) -> Option<T>) -> Option<HashMap<String, T>> {
+        (0..self.count()?)
+            .map(|_| Some((self.string()?, from_str(self.token()?)?)))
+            .collect()
+    }
+
+    fn schema(&mut self) -> Option<ArgumentSchema> {
+        Some(ArgumentSchema {
+            options: self.matchers()?,
+            one_value_keywords: self.matchers()?,
+            multi_value_keywords: self.matchers()?,
+            front_positional_arguments: self.strings()?,
+            back_positional_arguments: self.strings()?,
+            sections: (0..self.count()?)
+                .map(|_| Some((self.matcher()?, self.schema()?)))
+                .collect::<Option<_>>()?,
+            keyword_preprocessors: self.keyword_kinds(KeywordPreprocessor::from_str)?,
+            keyword_formatters: self.keyword_kinds(KeywordFormatter::from_str)?,
+        })
+    }
+
+    fn signature(&mut self) -> Option<Option<KeywordMatcher>> {
+        match self.token()? {
+            "0" => Some(None),
+            tag => Some(Some(self.matcher_with_tag(tag)?)),
+        }
+    }
+
+    fn details(&mut self) -> Option<CommandSchemaDetails> {
+        match self.token()? {
+            "specialized" => Some(CommandSchemaDetails::SpecializedCommand {
+                specialization: self.string()?,
+            }),
+            "standard" => Some(CommandSchemaDetails::StandardCommand {
+                schema: self.schema()?,
+                signatures: (0..self.count()?)
+                    .map(|_| Some((self.signature()?, self.schema()?)))
+                    .collect::<Option<_>>()?,
+                two_words_keywords: self
+                    .matchers()?
+                    .into_iter()
+                    .map(|matcher| Some(TwoWordKeywordMatcher::new(matcher.first, matcher.second?)))
+                    .collect::<Option<_>>()?,
+            }),
+            _ => None,
+        }
+    }
+
+    fn command(&mut self) -> Option<CommandSchema> {
+        Some(CommandSchema {
+            block_end: self.optional_string()?,
+            canonical_name: self.optional_string()?,
+            inhibit_favour_expansion: self.flag()?,
+            details: self.details()?,
+        })
+    }
+
+    pub fn command_schemas(mut self) -> Option<CommandSchemaMapping> {
+        let result = (0..self.count()?)
+            .map(|_| Some((self.string()?, self.command()?)))
+            .collect::<Option<_>>()?;
+        if self.tokens.next().is_some() {
+            return None;
+        }
+        Some(result)
+    }
+}
+
+pub type BlockEnds = HashMap<String, String>;
+
+fn find_block_ends<'a>(schemas: impl Iterator<Item = &'a CommandSchema>) -> BlockEnds {
+    let mut result = BlockEnds::new();
+    for schema in schemas {
+        if let CommandSchema {
+            canonical_name: Some(canonical_name),
+            block_end: Some(block_end),
+            ..
+        } = schema
+        {
+            result
+                .entry(canonical_name.trim().to_lowercase())
+                .or_insert_with(|| block_end.to_lowercase());
+        }
+    }
+    result
+}
+
+fn builtin_block_ends() -> &'static BlockEnds {
+    static RESULT: LazyLock<BlockEnds> =
+        LazyLock::new(|| find_block_ends(builtin_schemas().values()));
+    &RESULT
+}
+
 pub struct CommandSchemas {
     pub definition_schemas: CommandSchemaMapping,
     pub extension_schemas: CommandSchemaMapping,
+    block_ends: BlockEnds,
 }
 
 impl CommandSchemas {
+    pub fn new(
+        definition_schemas: CommandSchemaMapping,
+        extension_schemas: CommandSchemaMapping,
+    ) -> Self {
+        let block_ends = find_block_ends(
+            definition_schemas
+                .values()
+                .chain(extension_schemas.values()),
+        );
+        CommandSchemas {
+            definition_schemas,
+            extension_schemas,
+            block_ends,
+        }
+    }
+
+    pub fn block_end(&self, block_start: &str) -> Option<&str> {
+        self.block_ends
+            .get(block_start)
+            .or_else(|| builtin_block_ends().get(block_start))
+            .map(String::as_str)
+    }
+
     pub fn get(&self, key: &str) -> Option<&CommandSchema> {
         self.definition_schemas.get(key).or_else(|| {
             self.extension_schemas
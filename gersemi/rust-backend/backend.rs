@@ -5,7 +5,9 @@ mod cache;
 mod configuration;
 mod custom_command_definition_finder;
 mod diff;
+mod document;
 mod formatter;
+mod formatter_registry;
 mod keyword_preprocessor;
 mod node;
 mod parser;
@@ -29,23 +31,17 @@ mod gersemi_rust_backend {
     #[pyfunction]
     #[allow(clippy::needless_pass_by_value)]
     fn validate(text: String) -> Result<(), Error> {
-        let schemas = CommandSchemas {
-            definition_schemas: HashMap::new(),
-            extension_schemas: HashMap::new(),
-        };
-        let parser = Parser::new(text, &schemas);
+        let schemas = CommandSchemas::new(HashMap::new(), HashMap::new());
+        let parser = Parser::new(&text, &schemas);
         parser.start().and(Ok(()))
     }
 
     #[pyfunction]
     #[allow(clippy::needless_pass_by_value)]
     fn check_code_equivalence(before: String, after: String) -> Result<bool, Error> {
-        let schemas = CommandSchemas {
-            definition_schemas: HashMap::new(),
-            extension_schemas: HashMap::new(),
-        };
-        let before = Parser::new(before, &schemas).start()?;
-        let after = Parser::new(after, &schemas).start()?;
+        let schemas = CommandSchemas::new(HashMap::new(), HashMap::new());
+        let before = Parser::new(&before, &schemas).start()?;
+        let after = Parser::new(&after, &schemas).start()?;
 
         Ok(check_equivalence(before, after))
     }
@@ -56,11 +52,24 @@ mod gersemi_rust_backend {
     #[pymodule_export]
     use crate::app::App;
 
+    #[pymodule_export]
+    use crate::document::Document;
+
     #[pyfunction]
     pub fn warn(s: String) {
         crate::warning_sink::warn(s);
     }
 
+    #[pyfunction]
+    pub fn register_warning_sink(quiet: bool) {
+        crate::warning_sink::register_warning_sink(crate::warning_sink::WarningSink::new(quiet));
+    }
+
+    #[pyfunction]
+    pub fn take_warnings() -> Vec<String> {
+        crate::warning_sink::take_warnings()
+    }
+
     #[pyfunction]
     fn version() -> &'static str {
         static RESULT: &str = env!("CARGO_VERSION");
@@ -1,13 +1,165 @@
+use std::env;
+use std::fs;
+use std::path::{Path, PathBuf};
 use std::process::Command;
 
-fn main() {
-    let version = match Command::new("cargo").arg("--version").output() {
+const BUILTIN_SCHEMAS_GENERATOR: &str = r#"
+import sys
+from gersemi.argument_schema import SpecializedCommand
+from gersemi.builtin_commands import _builtin_commands
+
+tokens = []
+
+
+def emit(value):
+    value = str(value)
+    if "\n" in value or "\r" in value:
+        raise ValueError(f"Unsupported token: {value!r}")
+    tokens.append(value)
+
+
+def emit_optional_string(value):
+    if value is None:
+        emit(0)
+    else:
+        emit(1)
+        emit(value)
+
+
+def emit_matcher(matcher):
+    if isinstance(matcher, str):
+        emit(1)
+        emit(matcher)
+    elif isinstance(matcher[1], str):
+        emit(2)
+        emit(matcher[0])
+        emit(matcher[1])
+    else:
+        emit("*")
+        emit(matcher[0])
+
+
+def emit_matchers(matchers):
+    emit(len(matchers))
+    for matcher in matchers:
+        emit_matcher(matcher)
+
+
+def emit_strings(values):
+    emit(len(values))
+    for value in values:
+        emit(value)
+
+
+def emit_keyword_kinds(kinds):
+    emit(len(kinds))
+    for keyword, kind in kinds.items():
+        emit(keyword)
+        emit(kind.value)
+
+
+def emit_schema(schema):
+    emit_matchers(schema.options)
+    emit_matchers(schema.one_value_keywords)
+    emit_matchers(schema.multi_value_keywords)
+    emit_strings(schema.front_positional_arguments)
+    emit_strings(schema.back_positional_arguments)
+    emit(len(schema.sections))
+    for matcher, section in schema.sections.items():
+        emit_matcher(matcher)
+        emit_schema(section)
+    emit_keyword_kinds(schema.keyword_preprocessors)
+    emit_keyword_kinds(schema.keyword_formatters)
+
+
+def emit_command(command):
+    emit_optional_string(command.block_end)
+    emit_optional_string(command.canonical_name)
+    emit(int(command.inhibit_favour_expansion))
+    details = command.details
+    if isinstance(details, SpecializedCommand):
+        emit("specialized")
+        emit(details.impl)
+        return
+
+    emit("standard")
+    emit_schema(details.schema)
+    emit(len(details.signatures))
+    for signature, schema in details.signatures.items():
+        if signature is None:
+            emit(0)
+        else:
+            emit_matcher(signature)
+        emit_schema(schema)
+    emit_matchers(details.two_words_keywords)
+
+
+emit(len(_builtin_commands))
+for name, command in _builtin_commands.items():
+    emit(name)
+    emit_command(command)
+
+with open(sys.argv[1], "w", encoding="utf-8", newline="\n") as f:
+    f.write("\n".join(tokens))
+"#;
+
+fn cargo_version() -> String {
+    match Command::new("cargo").arg("--version").output() {
         Ok(output) => match String::from_utf8(output.stdout) {
             Ok(value) => value.trim().to_string(),
             Err(_) => "cargo (unknown)".to_string(),
         },
         Err(_) => "cargo (unknown)".to_string(),
-    };
+    }
+}
 
+fn python_candidates() -> Vec<String> {
+    match env::var("PYO3_PYTHON") {
+        Ok(python) => vec![python],
+        Err(_) => vec!["python3".to_string(), "python".to_string()],
+    }
+}
+
+fn generate_builtin_schemas(package_root: &Path, output: &Path) -> bool {
+    for python in python_candidates() {
+        let status = Command::new(&python)
+            .arg("-c")
+            .arg(BUILTIN_SCHEMAS_GENERATOR)
+            .arg(output)
+            .env("PYTHONPATH", package_root)
+            .env("PYTHONDONTWRITEBYTECODE", "1")
+            .status();
+        if matches!(status, Ok(status) if status.success()) {
+            return true;
+        }
+    }
+    false
+}
+
+fn main() {
+    let version = cargo_version();
     println!("cargo::rustc-env=CARGO_VERSION={version}");
+
+    let manifest_dir = PathBuf::from(env::var("CARGO_MANIFEST_DIR").unwrap());
+    let package_root = manifest_dir.join("..").join("..");
+    for module in [
+        "argument_schema.py",
+        "builtin_commands.py",
+        "immutable.py",
+        "keyword_kind.py",
+        "keywords.py",
+    ] {
+        let path = package_root.join("gersemi").join(module);
+        println!("cargo::rerun-if-changed={}", path.display());
+    }
+    println!("cargo::rerun-if-changed=build.rs");
+    println!("cargo::rerun-if-env-changed=PYO3_PYTHON");
+
+    let output = PathBuf::from(env::var("OUT_DIR").unwrap()).join("builtin_schemas.txt");
+    if !generate_builtin_schemas(&package_root, &output) {
+        println!(
+            "cargo::warning=Failed to generate builtin command schemas, they will be loaded from Python at runtime"
+        );
+        fs::write(&output, "").unwrap();
+    }
 }
@@ -1,13 +1,327 @@
+use crate::formatter::UnknownCommandsUsed;
+use crate::runner::is_stdin;
 use pyo3::PyResult;
-use rusqlite::{params, Connection};
+use rayon::iter::{IntoParallelIterator, IntoParallelRefIterator, ParallelIterator};
+use rusqlite::{params, Connection, ErrorCode, OpenFlags, OptionalExtension, TransactionBehavior};
 use std::collections::HashMap;
+use std::fmt::Write;
 use std::path::{Path, PathBuf};
 use std::str::FromStr;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::mpsc::{Receiver, RecvTimeoutError};
 use std::sync::Mutex;
-use std::time::UNIX_EPOCH;
+use std::time::{Duration, Instant, UNIX_EPOCH};
+use xxhash_rust::xxh3::xxh3_128;
+
+const SCHEMA_VERSION: i64 = 2;
+const BUSY_TIMEOUT: Duration = Duration::from_secs(2);
+const RETRY_DELAY: Duration = Duration::from_millis(20);
+const MAX_ATTEMPTS: u32 = 5;
+const BATCH_SIZE: usize = 256;
+const OUTPUTS_EVICTED_AT_ONCE: i64 = 256;
+const BATCH_INTERVAL: Duration = Duration::from_millis(500);
+const STALE_SUMMARY_AGE: Duration = Duration::from_secs(30 * 24 * 60 * 60);
+
+const CREATE_TABLES: &str = "
+    CREATE TABLE IF NOT EXISTS paths (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        size INTEGER NOT NULL,
+        modification_time INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS summaries (
+        id INTEGER PRIMARY KEY,
+        configuration_summary TEXT NOT NULL UNIQUE,
+        last_used INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS formatted (
+        path_id INTEGER NOT NULL REFERENCES paths (id) ON DELETE CASCADE,
+        summary_id INTEGER NOT NULL REFERENCES summaries (id) ON DELETE CASCADE,
+        unknown_commands_used TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (path_id, summary_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS formatted_by_summary ON formatted (summary_id, path_id);
+    CREATE TABLE IF NOT EXISTS contents (
+        hash TEXT NOT NULL,
+        summary_id INTEGER NOT NULL REFERENCES summaries (id) ON DELETE CASCADE,
+        unknown_commands_used TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (hash, summary_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS outputs (
+        hash TEXT NOT NULL,
+        summary_id INTEGER NOT NULL REFERENCES summaries (id) ON DELETE CASCADE,
+        formatted_code TEXT,
+        unknown_commands_used TEXT NOT NULL,
+        verified INTEGER NOT NULL,
+        last_used INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hash, summary_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS outputs_by_last_used ON outputs (last_used);
+    CREATE TABLE IF NOT EXISTS last_run (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        hits INTEGER NOT NULL,
+        misses INTEGER NOT NULL,
+        validation_time INTEGER NOT NULL
+    );
+";
+
+const MIGRATE_FROM_VERSION_1: &str = "
+    DROP TABLE IF EXISTS contents;
+    DROP TABLE formatted;
+    DROP TABLE files;
+";
+
+#[derive(Default)]
+struct CacheStatistics {
+    lock_conflicts: AtomicUsize,
+    dropped_updates: AtomicUsize,
+}
+
+#[derive(Default)]
+pub struct CacheUsage {
+    summaries: Vec<String>,
+    hits: usize,
+    misses: usize,
+    validation_time: Duration,
+}
+
+impl CacheUsage {
+    pub fn add(&mut self, configuration_summary: &str, hits: usize, misses: usize) {
+        if !self.summaries.iter().any(|s| s == configuration_summary) {
+            self.summaries.push(configuration_summary.to_string());
+        }
+        self.hits += hits;
+        self.misses += misses;
+    }
+
+    pub fn add_validation_time(&mut self, validation_time: Duration) {
+        self.validation_time += validation_time;
+    }
+}
+
+fn encode_unknown_commands(unknown_commands_used: &UnknownCommandsUsed) -> String {
+    unknown_commands_used
+        .iter()
+        .fold(String::new(), |mut output, (name, line, column)| {
+            let _ = writeln!(output, "{name} {line} {column}");
+            output
+        })
+}
+
+fn decode_unknown_commands(unknown_commands_used: &str) -> UnknownCommandsUsed {
+    unknown_commands_used
+        .lines()
+        .filter_map(|line| {
+            let mut parts = line.split(' ');
+            Some((
+                parts.next()?.to_string(),
+                parts.next()?.parse().ok()?,
+                parts.next()?.parse().ok()?,
+            ))
+        })
+        .collect()
+}
+
+pub struct CachedOutput {
+    formatted_code: Option<String>,
+    unknown_commands_used: String,
+    verified: bool,
+}
+
+impl CachedOutput {
+    pub fn new(
+        code: &str,
+        formatted_code: &str,
+        unknown_commands_used: &UnknownCommandsUsed,
+        verified: bool,
+    ) -> Self {
+        Self {
+            formatted_code: (code != formatted_code).then(|| formatted_code.to_string()),
+            unknown_commands_used: encode_unknown_commands(unknown_commands_used),
+            verified,
+        }
+    }
+
+    pub fn restore(self, code: &str) -> (String, UnknownCommandsUsed, bool) {
+        (
+            self.formatted_code.unwrap_or_else(|| code.to_string()),
+            decode_unknown_commands(&self.unknown_commands_used),
+            self.verified,
+        )
+    }
+}
+
+pub type KnownFile = (i64, i64, UnknownCommandsUsed);
+
+#[derive(Clone)]
+pub struct FileFingerprint {
+    size: i64,
+    modification_time: i64,
+    hash: String,
+}
+
+impl FileFingerprint {
+    pub fn new(file: &Path) -> Option<Self> {
+        if is_stdin(file) {
+            return None;
+        }
+
+        let (_, size, modification_time) = file_entry(file).ok()?;
+        let content = std::fs::read(file).ok()?;
+        Some(Self {
+            size,
+            modification_time,
+            hash: content_hash(&content),
+        })
+    }
+
+    pub fn of_content(
+        (size, modification_time): (i64, i64),
+        content: &str,
+        known: Option<&Self>,
+    ) -> Self {
+        match known {
+            Some(known) if (known.size, known.modification_time) == (size, modification_time) => {
+                known.clone()
+            }
+            _ => Self {
+                size,
+                modification_time,
+                hash: content_hash(content.as_bytes()),
+            },
+        }
+    }
+
+    fn entry<'a>(&self, file: &'a Path) -> (&'a str, i64, i64) {
+        (
+            file.to_str().unwrap_or("---"),
+            self.size,
+            self.modification_time,
+        )
+    }
+}
+
+pub type FileToFormat = (PathBuf, Option<FileFingerprint>);
+
+pub enum CacheUpdate {
+    FormattedFile(PathBuf, FileFingerprint, UnknownCommandsUsed),
+    Output(String, CachedOutput),
+    UsedOutput(String),
+}
+
+type SummaryUpdates<'a> = (
+    &'a str,
+    Vec<(PathBuf, FileFingerprint, UnknownCommandsUsed)>,
+    Vec<(String, CachedOutput)>,
+    Vec<String>,
+);
+
+fn group_by_summary(updates: Vec<(&str, CacheUpdate)>) -> Vec<SummaryUpdates<'_>> {
+    let mut result = Vec::<SummaryUpdates>::new();
+    for (configuration_summary, update) in updates {
+        let index = match result
+            .iter()
+            .position(|(summary, _, _, _)| *summary == configuration_summary)
+        {
+            Some(index) => index,
+            None => {
+                result.push((configuration_summary, Vec::new(), Vec::new(), Vec::new()));
+                result.len() - 1
+            }
+        };
+        match update {
+            CacheUpdate::FormattedFile(file, fingerprint, unknown_commands_used) => {
+                result[index]
+                    .1
+                    .push((file, fingerprint, unknown_commands_used));
+            }
+            CacheUpdate::Output(hash, output) => result[index].2.push((hash, output)),
+            CacheUpdate::UsedOutput(hash) => result[index].3.push(hash),
+        }
+    }
+    result
+}
+
+pub fn output_key(code: &str) -> String {
+    format!("{:X}", xxh3_128(code.as_bytes()))
+}
+
+pub struct CacheReport {
+    size: i64,
+    files: i64,
+    configurations: i64,
+    formatted: i64,
+    contents: i64,
+    outputs: i64,
+    last_run: Option<(i64, i64, i64)>,
+}
+
+impl std::fmt::Display for CacheReport {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        writeln!(f, "Size: {} bytes", self.size)?;
+        writeln!(f, "Files: {}", self.files)?;
+        writeln!(f, "Configurations: {}", self.configurations)?;
+        writeln!(f, "Files known to be formatted: {}", self.formatted)?;
+        writeln!(f, "Known contents: {}", self.contents)?;
+        writeln!(f, "Formatted outputs: {}", self.outputs)?;
+        match self.last_run {
+            Some((hits, misses, _)) if hits + misses > 0 => writeln!(
+                f,
+                "Last run: {hits} hits, {misses} misses ({}% hit rate)",
+                hits * 100 / (hits + misses)
+            )?,
+            Some((hits, misses, _)) => writeln!(f, "Last run: {hits} hits, {misses} misses")?,
+            None => writeln!(f, "Last run: unknown")?,
+        }
+        match self.last_run {
+            Some((_, _, validation_time)) => {
+                writeln!(f, "Last cache validation: {validation_time} microseconds")
+            }
+            None => writeln!(f, "Last cache validation: unknown"),
+        }
+    }
+}
+
+struct ConnectionPool {
+    cache_dir: PathBuf,
+    open: fn(&Path) -> Option<Connection>,
+    idle: Mutex<Vec<Connection>>,
+}
+
+impl ConnectionPool {
+    fn new(cache_dir: &Path, open: fn(&Path) -> Option<Connection>) -> Option<Self> {
+        let connection = open(cache_dir)?;
+        Some(Self {
+            cache_dir: cache_dir.to_path_buf(),
+            open,
+            idle: Mutex::new(vec![connection]),
+        })
+    }
+
+    fn read<T>(
+        &self,
+        statistics: &CacheStatistics,
+        operation: impl Fn(&Connection) -> rusqlite::Result<T>,
+    ) -> Option<T> {
+        let idle = self.idle.lock().ok()?.pop();
+        let mut connection = idle.or_else(|| (self.open)(&self.cache_dir))?;
+        let result = run_in_transaction(
+            &mut connection,
+            TransactionBehavior::Deferred,
+            statistics,
+            operation,
+        );
+        if let Ok(mut idle) = self.idle.lock() {
+            idle.push(connection);
+        }
+        result
+    }
+}
 
 pub struct Cache {
     connection: Option<Mutex<Connection>>,
+    readers: Vec<ConnectionPool>,
+    statistics: CacheStatistics,
 }
 
 pub fn file_entry(file: &Path) -> PyResult<(&str, i64, i64)> {
@@ -19,143 +333,836 @@ pub fn file_entry(file: &Path) -> PyResult<(&str, i64, i64)> {
     Ok((name, size, modification_time))
 }
 
-fn store_file_entries(connection: &Connection, files: &[PathBuf]) {
-    let Ok(mut statement) = connection.prepare("INSERT OR REPLACE INTO files VALUES (?, ?, ?)")
-    else {
-        return;
-    };
+fn content_hash(content: &[u8]) -> String {
+    format!("{:X}", xxh3_128(content))
+}
+
+fn is_lock_conflict(error: &rusqlite::Error) -> bool {
+    matches!(
+        error,
+        rusqlite::Error::SqliteFailure(
+            rusqlite::ffi::Error {
+                code: ErrorCode::DatabaseBusy | ErrorCode::DatabaseLocked,
+                ..
+            },
+            _
+        )
+    )
+}
 
-    for file in files {
-        if let Ok((name, size, modification_time)) = file_entry(file) {
-            let _ = statement.execute(params![name, size, modification_time]);
+fn run_in_transaction<T>(
+    connection: &mut Connection,
+    behavior: TransactionBehavior,
+    statistics: &CacheStatistics,
+    operation: impl Fn(&Connection) -> rusqlite::Result<T>,
+) -> Option<T> {
+    for attempt in 1..=MAX_ATTEMPTS {
+        let result = connection
+            .transaction_with_behavior(behavior)
+            .and_then(|tx| {
+                let value = operation(&tx)?;
+                tx.commit()?;
+                Ok(value)
+            });
+        match result {
+            Ok(value) => return Some(value),
+            Err(error) if is_lock_conflict(&error) => {
+                statistics.lock_conflicts.fetch_add(1, Ordering::Relaxed);
+                if attempt < MAX_ATTEMPTS {
+                    std::thread::sleep(RETRY_DELAY * attempt);
+                }
+            }
+            Err(_) => break,
         }
     }
+    None
+}
+
+fn find_summary_id(
+    connection: &Connection,
+    configuration_summary: &str,
+) -> rusqlite::Result<Option<i64>> {
+    connection
+        .query_row(
+            "SELECT id FROM summaries WHERE configuration_summary = (?)",
+            params![configuration_summary],
+            |row| row.get::<usize, i64>(0),
+        )
+        .optional()
+}
+
+fn store_summary(connection: &Connection, configuration_summary: &str) -> rusqlite::Result<i64> {
+    connection.execute(
+        "
+        INSERT OR IGNORE INTO summaries (configuration_summary, last_used)
+        VALUES (?, unixepoch())",
+        params![configuration_summary],
+    )?;
+    connection.query_row(
+        "SELECT id FROM summaries WHERE configuration_summary = (?)",
+        params![configuration_summary],
+        |row| row.get::<usize, i64>(0),
+    )
+}
+
+fn store_file_entries(
+    connection: &Connection,
+    entries: &[(&str, i64, i64)],
+) -> rusqlite::Result<Vec<i64>> {
+    let mut select =
+        connection.prepare("SELECT id, size, modification_time FROM paths WHERE path = (?)")?;
+    let mut insert =
+        connection.prepare("INSERT INTO paths (path, size, modification_time) VALUES (?, ?, ?)")?;
+    let mut update = connection
+        .prepare("UPDATE paths SET size = (?), modification_time = (?) WHERE id = (?)")?;
+    let mut forget = connection.prepare("DELETE FROM formatted WHERE path_id = (?)")?;
+
+    let mut path_ids = Vec::<i64>::with_capacity(entries.len());
+    for &(name, size, modification_time) in entries {
+        let stored = select
+            .query_row(params![name], |row| {
+                Ok((
+                    row.get::<usize, i64>(0)?,
+                    row.get::<usize, i64>(1)?,
+                    row.get::<usize, i64>(2)?,
+                ))
+            })
+            .optional()?;
+        if let Some((id, stored_size, stored_modification_time)) = stored {
+            if (stored_size, stored_modification_time) != (size, modification_time) {
+                update.execute(params![size, modification_time, id])?;
+                forget.execute(params![id])?;
+            }
+            path_ids.push(id);
+        } else {
+            insert.execute(params![name, size, modification_time])?;
+            path_ids.push(connection.last_insert_rowid());
+        }
+    }
+    Ok(path_ids)
 }
 
 fn store_configuration_summary(
+    connection: &Connection,
+    summary_id: i64,
+    path_ids: &[i64],
+    unknown_commands_used: &[String],
+) -> rusqlite::Result<()> {
+    let mut statement = connection.prepare(
+        "
+        INSERT OR REPLACE INTO formatted (path_id, summary_id, unknown_commands_used)
+        VALUES (?, ?, ?)",
+    )?;
+    for (path_id, unknown_commands_used) in path_ids.iter().zip(unknown_commands_used) {
+        statement.execute(params![path_id, summary_id, unknown_commands_used])?;
+    }
+    Ok(())
+}
+
+fn store_content_hashes(
+    connection: &Connection,
+    summary_id: i64,
+    hashes: &[(String, String)],
+) -> rusqlite::Result<()> {
+    let mut statement = connection.prepare(
+        "
+        INSERT OR IGNORE INTO contents (hash, summary_id, unknown_commands_used)
+        VALUES (?, ?, ?)",
+    )?;
+    for (hash, unknown_commands_used) in hashes {
+        statement.execute(params![hash, summary_id, unknown_commands_used])?;
+    }
+    Ok(())
+}
+
+fn store_outputs(
+    connection: &Connection,
+    summary_id: i64,
+    outputs: &[(String, CachedOutput)],
+) -> rusqlite::Result<()> {
+    let mut statement = connection.prepare(
+        "
+        INSERT OR REPLACE INTO outputs
+            (hash, summary_id, formatted_code, unknown_commands_used, verified, last_used)
+        VALUES (?, ?, ?, ?, ?, unixepoch())",
+    )?;
+    for (hash, output) in outputs {
+        statement.execute(params![
+            hash,
+            summary_id,
+            output.formatted_code,
+            output.unknown_commands_used,
+            output.verified
+        ])?;
+    }
+    Ok(())
+}
+
+fn touch_outputs(
+    connection: &Connection,
+    summary_id: i64,
+    hashes: &[String],
+) -> rusqlite::Result<()> {
+    let mut statement = connection.prepare(
+        "UPDATE outputs SET last_used = unixepoch() WHERE hash = (?) AND summary_id = (?)",
+    )?;
+    for hash in hashes {
+        statement.execute(params![hash, summary_id])?;
+    }
+    Ok(())
+}
+
+fn get_output(
     connection: &Connection,
     configuration_summary: &str,
-    files: &[PathBuf],
-) {
-    let Ok(mut statement) = connection.prepare("INSERT OR REPLACE INTO formatted VALUES (?, ?)")
-    else {
-        return;
+    hash: &str,
+) -> rusqlite::Result<Option<CachedOutput>> {
+    connection
+        .query_row(
+            "
+            SELECT outputs.formatted_code, outputs.unknown_commands_used, outputs.verified
+            FROM outputs
+            WHERE outputs.hash = (?) AND outputs.summary_id = (
+                SELECT summaries.id
+                FROM summaries
+                WHERE summaries.configuration_summary = (?)
+            )",
+            params![hash, configuration_summary],
+            |row| {
+                Ok(CachedOutput {
+                    formatted_code: row.get::<usize, Option<String>>(0)?,
+                    unknown_commands_used: row.get::<usize, String>(1)?,
+                    verified: row.get::<usize, bool>(2)?,
+                })
+            },
+        )
+        .optional()
+}
+
+fn find_known_contents(
+    connection: &Connection,
+    configuration_summary: &str,
+    hashes: &[Option<String>],
+) -> rusqlite::Result<Vec<Option<String>>> {
+    let Some(summary_id) = find_summary_id(connection, configuration_summary)? else {
+        return Ok(vec![None; hashes.len()]);
     };
+    let mut statement = connection.prepare(
+        "
+        SELECT contents.unknown_commands_used
+        FROM contents
+        WHERE contents.hash = (?) AND contents.summary_id = (?)",
+    )?;
 
-    for file in files {
-        let name = file.to_str().unwrap_or("---");
-        let _ = statement.execute(params![name, configuration_summary]);
+    let mut result = Vec::<Option<String>>::with_capacity(hashes.len());
+    for hash in hashes {
+        let known = match hash {
+            Some(hash) => statement
+                .query_row(params![hash, summary_id], |row| row.get::<usize, String>(0))
+                .optional()?,
+            None => None,
+        };
+        result.push(known);
     }
+    Ok(result)
 }
 
-fn get_files(connection: &Connection, configuration_summary: &str) -> HashMap<PathBuf, (i64, i64)> {
-    let Ok(mut statement) = connection.prepare(
+fn get_files(
+    connection: &Connection,
+    configuration_summary: &str,
+) -> rusqlite::Result<HashMap<PathBuf, KnownFile>> {
+    let mut statement = connection.prepare(
         "
-        SELECT *
-        FROM files
-        WHERE files.path IN (
-            SELECT formatted.path
-            FROM formatted
-            WHERE formatted.configuration_summary = (?)
+        SELECT paths.path, paths.size, paths.modification_time, formatted.unknown_commands_used
+        FROM formatted
+        JOIN paths ON paths.id = formatted.path_id
+        WHERE formatted.summary_id = (
+            SELECT summaries.id
+            FROM summaries
+            WHERE summaries.configuration_summary = (?)
         )",
-    ) else {
-        return HashMap::default();
-    };
+    )?;
 
-    let Ok(values) = statement.query_map(params![configuration_summary], |row| {
+    let values = statement.query_map(params![configuration_summary], |row| {
         Ok((
             row.get::<usize, String>(0)?,
             row.get::<usize, i64>(1)?,
             row.get::<usize, i64>(2)?,
+            row.get::<usize, String>(3)?,
         ))
-    }) else {
-        return HashMap::default();
-    };
+    })?;
 
-    let mut result = HashMap::<PathBuf, (i64, i64)>::new();
+    let mut result = HashMap::<PathBuf, KnownFile>::new();
     for value in values {
-        let Ok((path, size, modification_time)) = value else {
-            continue;
-        };
+        let (path, size, modification_time, unknown_commands_used) = value?;
         let Ok(path) = PathBuf::from_str(&path);
-        result.insert(path, (size, modification_time));
+        result.insert(
+            path,
+            (
+                size,
+                modification_time,
+                decode_unknown_commands(&unknown_commands_used),
+            ),
+        );
     }
-    result
+    Ok(result)
 }
 
-fn create_connection(enable_cache: bool, cache_dir: Option<&PathBuf>) -> Option<Connection> {
+fn touch_summaries(connection: &Connection, summaries: &[String]) -> rusqlite::Result<()> {
+    let mut statement = connection.prepare(
+        "
+        INSERT INTO summaries (configuration_summary, last_used)
+        VALUES (?, unixepoch())
+        ON CONFLICT (configuration_summary) DO UPDATE SET last_used = excluded.last_used",
+    )?;
+    for summary in summaries {
+        statement.execute(params![summary])?;
+    }
+    Ok(())
+}
+
+fn pragma_value(connection: &Connection, name: &str) -> rusqlite::Result<i64> {
+    connection.pragma_query_value(None, name, |row| row.get::<usize, i64>(0))
+}
+
+fn used_size(connection: &Connection) -> rusqlite::Result<i64> {
+    let used_pages =
+        pragma_value(connection, "page_count")? - pragma_value(connection, "freelist_count")?;
+    Ok(used_pages * pragma_value(connection, "page_size")?)
+}
+
+fn delete_orphaned_paths(connection: &Connection) -> rusqlite::Result<usize> {
+    connection.execute(
+        "DELETE FROM paths WHERE id NOT IN (SELECT path_id FROM formatted)",
+        [],
+    )
+}
+
+fn evict_least_recently_used(
+    connection: &Connection,
+    max_size: i64,
+    summaries_in_use: &[String],
+) -> rusqlite::Result<usize> {
+    let mut evicted = 0;
+    if used_size(connection)? <= max_size {
+        return Ok(evicted);
+    }
+
+    let mut statement =
+        connection.prepare("SELECT id, configuration_summary FROM summaries ORDER BY last_used")?;
+    let candidates = statement
+        .query_map([], |row| {
+            Ok((row.get::<usize, i64>(0)?, row.get::<usize, String>(1)?))
+        })?
+        .collect::<rusqlite::Result<Vec<_>>>()?;
+    for (id, summary) in candidates {
+        if summaries_in_use.contains(&summary) {
+            continue;
+        }
+
+        connection.execute("DELETE FROM summaries WHERE id = (?)", params![id])?;
+        delete_orphaned_paths(connection)?;
+        evicted += 1;
+        if used_size(connection)? <= max_size {
+            return Ok(evicted);
+        }
+    }
+
+    let mut statement = connection.prepare(
+        "
+        DELETE FROM outputs
+        WHERE (hash, summary_id) IN (
+            SELECT hash, summary_id FROM outputs ORDER BY last_used LIMIT (?)
+        )",
+    )?;
+    while used_size(connection)? > max_size {
+        let evicted_outputs = statement.execute(params![OUTPUTS_EVICTED_AT_ONCE])?;
+        if evicted_outputs == 0 {
+            break;
+        }
+        evicted += evicted_outputs;
+    }
+    Ok(evicted)
+}
+
+fn get_paths(connection: &Connection) -> rusqlite::Result<Vec<(i64, String)>> {
+    let mut statement = connection.prepare("SELECT id, path FROM paths")?;
+    let values = statement.query_map([], |row| {
+        Ok((row.get::<usize, i64>(0)?, row.get::<usize, String>(1)?))
+    })?;
+    values.collect()
+}
+
+fn make_report(connection: &Connection) -> rusqlite::Result<CacheReport> {
+    let (files, configurations, formatted, contents, outputs) = connection.query_row(
+        "
+        SELECT
+            (SELECT COUNT(*) FROM paths),
+            (SELECT COUNT(*) FROM summaries),
+            (SELECT COUNT(*) FROM formatted),
+            (SELECT COUNT(*) FROM contents),
+            (SELECT COUNT(*) FROM outputs)",
+        [],
+        |row| {
+            Ok((
+                row.get::<usize, i64>(0)?,
+                row.get::<usize, i64>(1)?,
+                row.get::<usize, i64>(2)?,
+                row.get::<usize, i64>(3)?,
+                row.get::<usize, i64>(4)?,
+            ))
+        },
+    )?;
+    let last_run = connection
+        .query_row(
+            "SELECT hits, misses, validation_time FROM last_run",
+            [],
+            |row| {
+                Ok((
+                    row.get::<usize, i64>(0)?,
+                    row.get::<usize, i64>(1)?,
+                    row.get::<usize, i64>(2)?,
+                ))
+            },
+        )
+        .optional()?;
+    Ok(CacheReport {
+        size: pragma_value(connection, "page_count")? * pragma_value(connection, "page_size")?,
+        files,
+        configurations,
+        formatted,
+        contents,
+        outputs,
+        last_run,
+    })
+}
+
+fn has_table(connection: &Connection, name: &str) -> rusqlite::Result<bool> {
+    connection
+        .query_row(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = (?)",
+            params![name],
+            |row| row.get::<usize, i64>(0),
+        )
+        .map(|count| count > 0)
+}
+
+fn schema_version(connection: &Connection) -> rusqlite::Result<i64> {
+    connection.pragma_query_value(None, "user_version", |row| row.get::<usize, i64>(0))
+}
+
+fn initialize_schema(connection: &Connection) -> rusqlite::Result<bool> {
+    match schema_version(connection)? {
+        SCHEMA_VERSION => return Ok(true),
+        0 => {}
+        _ => return Ok(false),
+    }
+
+    if has_table(connection, "files")? {
+        connection.execute_batch(MIGRATE_FROM_VERSION_1)?;
+    }
+    connection.execute_batch(CREATE_TABLES)?;
+    connection.pragma_update(None, "user_version", SCHEMA_VERSION)?;
+    Ok(true)
+}
+
+fn create_connection(
+    enable_cache: bool,
+    cache_dir: Option<&PathBuf>,
+    statistics: &CacheStatistics,
+) -> Option<Connection> {
     if !enable_cache {
         return None;
     }
 
     let cache_path = cache_dir?.join("cache.db");
 
-    let Ok(connection) = Connection::open(cache_path) else {
+    let Ok(mut connection) = Connection::open(cache_path) else {
         return None;
     };
-    let Ok(_) = connection.execute("PRAGMA foreign_keys = 1", []) else {
+    let Ok(()) = connection.busy_timeout(BUSY_TIMEOUT) else {
         return None;
     };
-    let Ok(_) = connection.execute(
-        "
-        CREATE TABLE IF NOT EXISTS files (
-            path TEXT PRIMARY KEY,
-            size INTEGER NOT NULL,
-            modification_time INTEGER NOT NULL
-        )",
-        [],
-    ) else {
+    let _ = connection.query_row("PRAGMA journal_mode = WAL", [], |row| {
+        row.get::<usize, String>(0)
+    });
+    let _ = connection.pragma_update(None, "synchronous", "NORMAL");
+    let Ok(_) = connection.execute("PRAGMA foreign_keys = 1", []) else {
         return None;
     };
-    let Ok(_) = connection.execute(
-        "
-        CREATE TABLE IF NOT EXISTS formatted (
-            path TEXT PRIMARY KEY,
-            configuration_summary TEXT NOT NULL,
-            FOREIGN KEY (path) REFERENCES files (path)
-        )",
-        [],
-    ) else {
+    if schema_version(&connection).ok()? != SCHEMA_VERSION {
+        let is_initialized = run_in_transaction(
+            &mut connection,
+            TransactionBehavior::Immediate,
+            statistics,
+            initialize_schema,
+        )?;
+        if !is_initialized {
+            return None;
+        }
+    }
+
+    Some(connection)
+}
+
+fn immutable_database_uri(cache_path: &Path) -> Option<String> {
+    let path = cache_path.to_str()?;
+    let path = if cfg!(windows) {
+        path.replace('\\', "/")
+    } else {
+        path.to_string()
+    };
+    let path = path
+        .replace('%', "%25")
+        .replace('?', "%3f")
+        .replace('#', "%23");
+    Some(format!("file:{path}?immutable=1"))
+}
+
+fn has_current_schema(connection: &Connection) -> bool {
+    schema_version(connection).is_ok_and(|version| version == SCHEMA_VERSION)
+}
+
+fn open_read_only_connection(cache_dir: &Path, immutable: bool) -> Option<Connection> {
+    let cache_path = cache_dir.join("cache.db");
+    if !cache_path.is_file() {
+        return None;
+    }
+
+    let flags = OpenFlags::SQLITE_OPEN_READ_ONLY | OpenFlags::SQLITE_OPEN_NO_MUTEX;
+    let connection = Connection::open_with_flags(&cache_path, flags)
+        .ok()
+        .filter(has_current_schema)
+        .or_else(|| {
+            if !immutable {
+                return None;
+            }
+            Connection::open_with_flags(
+                immutable_database_uri(&cache_path)?,
+                flags | OpenFlags::SQLITE_OPEN_URI,
+            )
+            .ok()
+            .filter(has_current_schema)
+        })?;
+    let Ok(()) = connection.busy_timeout(BUSY_TIMEOUT) else {
         return None;
     };
 
     Some(connection)
 }
 
+fn create_lookup_connection(cache_dir: &Path) -> Option<Connection> {
+    open_read_only_connection(cache_dir, false)
+}
+
+fn create_read_only_connection(cache_dir: &Path) -> Option<Connection> {
+    open_read_only_connection(cache_dir, true)
+}
+
 impl Cache {
-    pub fn new(enable_cache: bool, cache_dir: Option<&PathBuf>) -> Self {
+    pub fn new(
+        enable_cache: bool,
+        cache_dir: Option<&PathBuf>,
+        read_only_cache_dirs: &[PathBuf],
+    ) -> Self {
+        let statistics = CacheStatistics::default();
+        let connection = create_connection(enable_cache, cache_dir, &statistics).map(Mutex::new);
+        let local_reader = connection
+            .as_ref()
+            .and(cache_dir)
+            .and_then(|cache_dir| ConnectionPool::new(cache_dir, create_lookup_connection));
+        let readers = if enable_cache {
+            local_reader
+                .into_iter()
+                .chain(read_only_cache_dirs.iter().filter_map(|cache_dir| {
+                    ConnectionPool::new(cache_dir, create_read_only_connection)
+                }))
+                .collect()
+        } else {
+            Vec::new()
+        };
         Self {
-            connection: create_connection(enable_cache, cache_dir).map(Mutex::new),
+            connection,
+            readers,
+            statistics,
         }
     }
 
-    pub fn store_files(&self, configuration_summary: &str, files: &[PathBuf]) {
+    pub fn statistics(&self) -> (usize, usize) {
+        (
+            self.statistics.lock_conflicts.load(Ordering::Relaxed),
+            self.statistics.dropped_updates.load(Ordering::Relaxed),
+        )
+    }
+
+    fn run_in_transaction<T>(
+        &self,
+        behavior: TransactionBehavior,
+        operation: impl Fn(&Connection) -> rusqlite::Result<T>,
+    ) -> Option<T> {
         let Some(ref connection) = self.connection else {
-            return;
+            return None;
         };
-
         let Ok(mut connection) = connection.lock() else {
-            return;
+            return None;
         };
 
-        let Ok(tx) = connection.transaction() else {
-            return;
-        };
+        run_in_transaction(&mut connection, behavior, &self.statistics, operation)
+    }
 
-        store_file_entries(&tx, files);
-        store_configuration_summary(&tx, configuration_summary, files);
-        let _ = tx.commit();
+    fn update<T>(&self, operation: impl Fn(&Connection) -> rusqlite::Result<T>) -> Option<T> {
+        let result = self.run_in_transaction(TransactionBehavior::Immediate, operation);
+        if result.is_none() {
+            self.statistics
+                .dropped_updates
+                .fetch_add(1, Ordering::Relaxed);
+        }
+        result
     }
 
-    pub fn get_files(&self, configuration_summary: &str) -> HashMap<PathBuf, (i64, i64)> {
+    fn vacuum(&self) {
         let Some(ref connection) = self.connection else {
-            return HashMap::default();
+            return;
         };
 
-        let Ok(connection) = connection.lock() else {
-            return HashMap::default();
-        };
+        if let Ok(connection) = connection.lock() {
+            let _ = connection.execute_batch("VACUUM");
+        }
+    }
 
-        get_files(&connection, configuration_summary)
+    pub fn finish_run(&self, usage: &CacheUsage, max_size_in_megabytes: Option<u64>) {
+        if self.connection.is_none() || usage.summaries.is_empty() {
+            return;
+        }
+
+        let max_size = max_size_in_megabytes
+            .map(|megabytes| i64::try_from(megabytes.saturating_mul(1 << 20)).unwrap_or(i64::MAX));
+        let validation_time = i64::try_from(usage.validation_time.as_micros()).unwrap_or(i64::MAX);
+        let evicted = self.update(|tx| {
+            touch_summaries(tx, &usage.summaries)?;
+            tx.execute(
+                "
+                INSERT OR REPLACE INTO last_run (id, hits, misses, validation_time)
+                VALUES (0, ?, ?, ?)",
+                params![usage.hits, usage.misses, validation_time],
+            )?;
+            match max_size {
+                Some(max_size) => evict_least_recently_used(tx, max_size, &usage.summaries),
+                None => Ok(0),
+            }
+        });
+        if evicted.is_some_and(|evicted| evicted > 0) {
+            self.vacuum();
+        }
+    }
+
+    pub fn prune(&self) -> Option<(usize, usize)> {
+        let paths = self.run_in_transaction(TransactionBehavior::Deferred, get_paths)?;
+        let missing_paths = paths
+            .into_par_iter()
+            .filter_map(|(id, path)| (!Path::new(&path).exists()).then_some(id))
+            .collect::<Vec<_>>();
+        let stale_summary_age = i64::try_from(STALE_SUMMARY_AGE.as_secs()).unwrap_or(i64::MAX);
+        let result = self.update(|tx| {
+            let mut statement = tx.prepare("DELETE FROM paths WHERE id = (?)")?;
+            for id in &missing_paths {
+                statement.execute(params![id])?;
+            }
+            let stale_summaries = tx.execute(
+                "DELETE FROM summaries WHERE last_used < unixepoch() - (?)",
+                params![stale_summary_age],
+            )?;
+            delete_orphaned_paths(tx)?;
+            Ok((missing_paths.len(), stale_summaries))
+        })?;
+        self.vacuum();
+        Some(result)
+    }
+
+    pub fn report(&self) -> Option<CacheReport> {
+        self.run_in_transaction(TransactionBehavior::Deferred, make_report)
+    }
+
+    pub fn is_enabled(&self) -> bool {
+        !self.readers.is_empty()
+    }
+
+    pub fn get_output(&self, configuration_summary: &str, hash: &str) -> Option<CachedOutput> {
+        self.readers.iter().find_map(|reader| {
+            reader
+                .read(&self.statistics, |tx| {
+                    get_output(tx, configuration_summary, hash)
+                })
+                .flatten()
+        })
+    }
+
+    fn store(&self, updates: Vec<(&str, CacheUpdate)>) {
+        if self.connection.is_none() || updates.is_empty() {
+            return;
+        }
+
+        let updates = group_by_summary(updates);
+        let updates = updates
+            .iter()
+            .map(|(configuration_summary, files, outputs, used_outputs)| {
+                let unknown_commands_used = files
+                    .iter()
+                    .map(|(_, _, unknown_commands_used)| {
+                        encode_unknown_commands(unknown_commands_used)
+                    })
+                    .collect::<Vec<_>>();
+                let entries = files
+                    .iter()
+                    .map(|(file, fingerprint, _)| fingerprint.entry(file))
+                    .collect::<Vec<_>>();
+                let hashes = files
+                    .iter()
+                    .zip(&unknown_commands_used)
+                    .map(|((_, fingerprint, _), unknown_commands_used)| {
+                        (fingerprint.hash.clone(), unknown_commands_used.clone())
+                    })
+                    .collect::<Vec<_>>();
+                (
+                    *configuration_summary,
+                    entries,
+                    unknown_commands_used,
+                    hashes,
+                    outputs,
+                    used_outputs,
+                )
+            })
+            .collect::<Vec<_>>();
+        self.update(|tx| {
+            for (
+                configuration_summary,
+                entries,
+                unknown_commands_used,
+                hashes,
+                outputs,
+                used_outputs,
+            ) in &updates
+            {
+                let summary_id = store_summary(tx, configuration_summary)?;
+                let path_ids = store_file_entries(tx, entries)?;
+                store_configuration_summary(tx, summary_id, &path_ids, unknown_commands_used)?;
+                store_content_hashes(tx, summary_id, hashes)?;
+                store_outputs(tx, summary_id, outputs)?;
+                touch_outputs(tx, summary_id, used_outputs)?;
+            }
+            Ok(())
+        });
+    }
+
+    pub fn store_in_batches(&self, updates: &Receiver<(&str, CacheUpdate)>) {
+        let mut batch = Vec::<(&str, CacheUpdate)>::with_capacity(BATCH_SIZE);
+        let mut deadline = Instant::now() + BATCH_INTERVAL;
+        loop {
+            match updates.recv_timeout(deadline.saturating_duration_since(Instant::now())) {
+                Ok(update) => batch.push(update),
+                Err(RecvTimeoutError::Timeout) => {}
+                Err(RecvTimeoutError::Disconnected) => break,
+            }
+
+            if batch.len() >= BATCH_SIZE || Instant::now() >= deadline {
+                self.store(std::mem::take(&mut batch));
+                deadline = Instant::now() + BATCH_INTERVAL;
+            }
+        }
+        self.store(batch);
+    }
+
+    pub fn split_by_content(
+        &self,
+        configuration_summary: &str,
+        files: Vec<PathBuf>,
+    ) -> (Vec<(PathBuf, UnknownCommandsUsed)>, Vec<FileToFormat>) {
+        if !self.is_enabled() {
+            return (Vec::new(), files.into_iter().map(|f| (f, None)).collect());
+        }
+
+        let fingerprints = files
+            .par_iter()
+            .map(|file| FileFingerprint::new(file))
+            .collect::<Vec<_>>();
+        let mut hashes = fingerprints
+            .iter()
+            .map(|fingerprint| fingerprint.as_ref().map(|f| f.hash.clone()))
+            .collect::<Vec<_>>();
+        let mut known = vec![None; files.len()];
+        for reader in &self.readers {
+            let Some(found) = reader.read(&self.statistics, |tx| {
+                find_known_contents(tx, configuration_summary, &hashes)
+            }) else {
+                continue;
+            };
+
+            for ((hash, known), found) in hashes.iter_mut().zip(&mut known).zip(found) {
+                if found.is_some() {
+                    *hash = None;
+                    *known = found;
+                }
+            }
+            if hashes.iter().all(Option::is_none) {
+                break;
+            }
+        }
+
+        let mut known_files = Vec::<(PathBuf, FileFingerprint, String)>::new();
+        let mut unknown_files = Vec::<FileToFormat>::new();
+        for ((file, fingerprint), known) in files.into_iter().zip(fingerprints).zip(known) {
+            match (fingerprint, known) {
+                (Some(fingerprint), Some(unknown_commands_used)) => {
+                    known_files.push((file, fingerprint, unknown_commands_used));
+                }
+                (fingerprint, _) => unknown_files.push((file, fingerprint)),
+            }
+        }
+
+        if self.connection.is_some() && !known_files.is_empty() {
+            let entries = known_files
+                .iter()
+                .map(|(file, fingerprint, _)| fingerprint.entry(file))
+                .collect::<Vec<_>>();
+            let unknown_commands_used = known_files
+                .iter()
+                .map(|(_, _, unknown_commands_used)| unknown_commands_used.clone())
+                .collect::<Vec<_>>();
+            let known_hashes = known_files
+                .iter()
+                .map(|(_, fingerprint, unknown_commands_used)| {
+                    (fingerprint.hash.clone(), unknown_commands_used.clone())
+                })
+                .collect::<Vec<_>>();
+            self.update(|tx| {
+                let summary_id = store_summary(tx, configuration_summary)?;
+                let path_ids = store_file_entries(tx, &entries)?;
+                store_configuration_summary(tx, summary_id, &path_ids, &unknown_commands_used)?;
+                store_content_hashes(tx, summary_id, &known_hashes)
+            });
+        }
+        let known_files = known_files
+            .into_iter()
+            .map(|(file, _, unknown_commands_used)| {
+                (file, decode_unknown_commands(&unknown_commands_used))
+            })
+            .collect();
+        (known_files, unknown_files)
+    }
+
+    pub fn get_files(&self, configuration_summary: &str) -> HashMap<PathBuf, KnownFile> {
+        let mut result = HashMap::<PathBuf, KnownFile>::new();
+        for reader in &self.readers {
+            let Some(files) =
+                reader.read(&self.statistics, |tx| get_files(tx, configuration_summary))
+            else {
+                continue;
+            };
+
+            for (path, entry) in files {
+                result.entry(path).or_insert(entry);
+            }
+        }
+        result
     }
 }
@@ -1,3 +1,6 @@
+use crate::custom_command_definition_finder::{
+    conflicting_definitions, used_definitions, Definitions,
+};
 use crate::gersemi_rust_backend::max_number_of_workers;
 use crate::utils::load_definitions_from_extensions;
 use pyo3::exceptions::PyRuntimeError;
@@ -18,7 +21,7 @@ fn string_enum_value(obj: Borrowed<'_, '_, PyAny>) -> Result<String, PyErr> {
     Ok(value.cast::<PyString>()?.str()?.to_string())
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum KeywordFormatter {
     CommandLine,
     Pairs,
@@ -46,7 +49,7 @@ impl FromPyObject<'_, '_> for KeywordFormatter {
     }
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum KeywordPreprocessor {
     Sort,
     Unique,
@@ -177,13 +180,14 @@ pub struct OutcomeConfiguration {
     pub sort_order: SortOrder,
     #[pyo3(attribute("unsafe"))]
     pub disable_sanity_checks: bool,
+    pub sanity_check_sampling: u64,
     pub warn_about_unknown_commands: bool,
     pub extensions: Vec<Extension>,
     pub definitions: Vec<PathBuf>,
     pub disable_formatting: bool,
 }
 
-#[derive(Clone, FromPyObject)]
+#[derive(Clone, Debug, FromPyObject)]
 pub struct LineRange {
     pub start: usize,
     pub end: usize,
@@ -227,6 +231,8 @@ pub struct ControlConfiguration {
     pub line_ranges: Vec<LineRange>,
     pub cache: bool,
     pub cache_dir: Option<PathBuf>,
+    pub read_only_cache_dirs: Vec<PathBuf>,
+    pub cache_max_size: Option<u64>,
     pub quiet: bool,
     pub warnings_as_errors: bool,
     pub configuration_file: Option<PathBuf>,
@@ -239,10 +245,18 @@ pub struct Configuration {
     pub control: ControlConfiguration,
 }
 
-impl OutcomeConfiguration {
-    pub fn summarize(&self) -> PyResult<String> {
-        let extension_schemas = load_definitions_from_extensions(&self.extensions)?;
-        let summary = format!("{self:?};{extension_schemas:?}");
+impl Configuration {
+    pub fn summarize(&self, definitions: &Definitions) -> PyResult<String> {
+        let extension_schemas = load_definitions_from_extensions(&self.outcome.extensions)?;
+        let outcome = OutcomeConfiguration {
+            definitions: Vec::new(),
+            ..self.outcome.clone()
+        };
+        let summary = format!(
+            "{outcome:?};{extension_schemas:?};{:?};{:?}",
+            used_definitions(definitions),
+            conflicting_definitions(definitions)
+        );
         Ok(format!("{:X}", xxh3_128(summary.as_bytes())))
     }
 }
@@ -1,17 +1,17 @@
 use crate::argument_schema::CommandSchemas;
 use crate::configuration::Configuration;
-use crate::gersemi_rust_backend::warn;
 use crate::node::{
     Argument, Arguments, ArgumentsAtom, ArgumentsNode, BracketArgument, Command, CommandInvocation,
     FileElement, Position, Start,
 };
 use crate::parser::Parser;
-use crate::utils::{get_files, normalize_newlines, read_code};
+use crate::utils::{get_files, normalize_newlines, read_code, thread_pool};
 use pyo3::{PyResult, Python};
 use rayon::iter::{IntoParallelIterator, ParallelIterator};
 use std::collections::HashMap;
 use std::fmt::Write;
 
+#[derive(Debug)]
 pub struct Keywords {
     pub options: Vec<String>,
     pub one_value_keywords: Vec<String>,
@@ -19,6 +19,7 @@ pub struct Keywords {
     pub hints: Vec<String>,
 }
 
+#[derive(Debug)]
 pub struct CustomCommandContent {
     pub canonical_name: String,
     pub positional_arguments: Vec<String>,
@@ -295,11 +296,8 @@ pub fn find_custom_command_definitions(
         return Ok(HashMap::new());
     }
 
-    let schemas = CommandSchemas {
-        definition_schemas: HashMap::new(),
-        extension_schemas: HashMap::new(),
-    };
-    let parser = Parser::new(text, &schemas);
+    let schemas = CommandSchemas::new(HashMap::new(), HashMap::new());
+    let parser = Parser::new(&text, &schemas);
 
     let mut interpreter = CustomCommandInterpreter {
         stack: HashMap::new(),
@@ -311,9 +309,31 @@ pub fn find_custom_command_definitions(
     Ok(interpreter.found_commands)
 }
 
-type Definitions = Vec<(String, Vec<CustomCommand>)>;
+pub type Definitions = Vec<(String, Vec<CustomCommand>)>;
+
+pub fn used_definitions(definitions: &Definitions) -> Vec<(&str, &CustomCommandContent)> {
+    let mut result = definitions
+        .iter()
+        .filter_map(|(name, info)| {
+            let (content, _) = info.iter().min_by(|a, b| a.1.cmp(&b.1))?;
+            Some((name.as_str(), content))
+        })
+        .collect::<Vec<_>>();
+    result.sort_by_key(|(name, _)| *name);
+    result
+}
+
+pub fn conflicting_definitions(definitions: &Definitions) -> Vec<&str> {
+    let mut result = definitions
+        .iter()
+        .filter(|(_, info)| info.len() > 1)
+        .map(|(name, _)| name.as_str())
+        .collect::<Vec<_>>();
+    result.sort_unstable();
+    result
+}
 
-fn check_conflicting_definitions(defs: &Definitions) {
+fn check_conflicting_definitions(defs: &Definitions, warnings: &mut Vec<String>) {
     for (name, info) in defs {
         if info.len() <= 1 {
             continue;
@@ -327,46 +347,50 @@ fn check_conflicting_definitions(defs: &Definitions) {
             let kind = if index == 0 { "(used)   " } else { "(ignored)" };
             let _ = write!(warning, "\n{kind} {location}");
         }
-        warn(warning);
+        warnings.push(warning);
     }
 }
 
 pub fn find_all_custom_command_definitions(
     py: Python,
     configuration: &Configuration,
-) -> PyResult<Definitions> {
+) -> PyResult<(Definitions, Vec<String>)> {
     let mut result = Definitions::new();
+    let mut warnings = Vec::<String>::new();
 
     let files = get_files(
         configuration.outcome.definitions.clone(),
         configuration.control.respect_ignore_files,
     )?;
+    let pool = thread_pool(configuration.control.workers.value())?;
     let all_defs = py.detach(|| {
-        files
-            .into_par_iter()
-            .panic_fuse()
-            .map(|f| {
-                Python::attach(|py| py.check_signals().unwrap());
-
-                let path = f.to_str().unwrap_or("---").to_string();
-                match read_code(&f) {
-                    Ok(code) => {
-                        let code = normalize_newlines(&code);
-                        match find_custom_command_definitions(code, path.clone()) {
-                            Ok(def) => Ok(def),
-                            Err(err) => Err((path, err)),
+        pool.install(|| {
+            files
+                .into_par_iter()
+                .panic_fuse()
+                .map(|f| {
+                    Python::attach(|py| py.check_signals().unwrap());
+
+                    let path = f.to_str().unwrap_or("---").to_string();
+                    match read_code(&f) {
+                        Ok(code) => {
+                            let code = normalize_newlines(&code);
+                            match find_custom_command_definitions(code, path.clone()) {
+                                Ok(def) => Ok(def),
+                                Err(err) => Err((path, err)),
+                            }
                         }
+                        Err(err) => Err((path, err)),
                     }
-                    Err(err) => Err((path, err)),
-                }
-            })
-            .collect::<Vec<_>>()
+                })
+                .collect::<Vec<_>>()
+        })
     });
 
     for defs in all_defs {
         let defs = match defs {
             Err((path, err)) => {
-                warn(format!(
+                warnings.push(format!(
                     "{path}:{}",
                     Python::attach(|py| err.value(py).to_string())
                 ));
@@ -389,7 +413,7 @@ pub fn find_all_custom_command_definitions(
         }
     }
 
-    check_conflicting_definitions(&result);
+    check_conflicting_definitions(&result, &mut warnings);
 
-    Ok(result)
+    Ok((result, warnings))
 }
@@ -0,0 +1,98 @@
+use crate::configuration::{Configuration, LineRange};
+use crate::formatter::{Formatter, UnknownCommandsUsed};
+use crate::formatter_registry::get_formatter;
+use crate::node::Start;
+use crate::runner::warnings_about_unknown_commands;
+use crate::utils::normalize_newlines;
+use crate::warning_sink::warn;
+use pyo3::{pyclass, pymethods, PyResult, Python};
+use std::path::PathBuf;
+use std::sync::Arc;
+
+#[pyclass]
+pub struct Document {
+    configuration: Configuration,
+    path: PathBuf,
+    formatter: Arc<Formatter>,
+    text: String,
+    newlines_style: &'static str,
+    tree: Option<Start>,
+}
+
+impl Document {
+    fn refresh_formatter(&mut self, py: Python) -> PyResult<()> {
+        let formatter = get_formatter(py, &self.configuration)?;
+        if !Arc::ptr_eq(&formatter, &self.formatter) {
+            self.tree = formatter.parse(&self.text).ok();
+            self.formatter = formatter;
+        }
+        Ok(())
+    }
+
+    fn warn_about_unknown_commands(&self, unknown_commands_used: UnknownCommandsUsed) {
+        for warning in
+            warnings_about_unknown_commands(&self.configuration, &self.path, unknown_commands_used)
+        {
+            warn(warning);
+        }
+    }
+
+    fn restore_newlines(&self, code: &str) -> String {
+        if self.newlines_style == "\n" {
+            code.to_string()
+        } else {
+            code.replace('\n', self.newlines_style)
+        }
+    }
+}
+
+#[pymethods]
+impl Document {
+    #[new]
+    pub fn new(
+        py: Python,
+        configuration: Configuration,
+        path: PathBuf,
+        text: String,
+    ) -> PyResult<Self> {
+        let formatter = get_formatter(py, &configuration)?;
+        let mut result = Self {
+            configuration,
+            path,
+            formatter,
+            text: String::new(),
+            newlines_style: "\n",
+            tree: None,
+        };
+        result.update(text);
+        Ok(result)
+    }
+
+    #[allow(clippy::needless_pass_by_value)]
+    pub fn update(&mut self, text: String) {
+        self.newlines_style = if text.contains("\r\n") { "\r\n" } else { "\n" };
+        self.text = normalize_newlines(&text);
+        self.tree = self.formatter.parse(&self.text).ok();
+    }
+
+    pub fn format(&mut self, py: Python) -> PyResult<String> {
+        self.refresh_formatter(py)?;
+        let tree = match &self.tree {
+            Some(tree) => tree.clone(),
+            None => self.formatter.parse(&self.text)?,
+        };
+        let (result, unknown_commands_used, _) = self.formatter.format_parsed(&self.text, tree)?;
+        self.warn_about_unknown_commands(unknown_commands_used);
+        Ok(self.restore_newlines(&result))
+    }
+
+    #[allow(clippy::needless_pass_by_value)]
+    pub fn format_lines(&mut self, py: Python, line_ranges: Vec<LineRange>) -> PyResult<String> {
+        self.refresh_formatter(py)?;
+        let (result, unknown_commands_used, _) = self
+            .formatter
+            .format_lines(self.text.clone(), &line_ranges)?;
+        self.warn_about_unknown_commands(unknown_commands_used);
+        Ok(self.restore_newlines(&result))
+    }
+}
@@ -7,7 +7,7 @@ use crate::configuration::{
     OutcomeConfiguration, SortOrder,
 };
 use crate::custom_command_definition_finder::{
-    find_all_custom_command_definitions, CustomCommand, CustomCommandContent, Keywords,
+    find_all_custom_command_definitions, CustomCommandContent, Definitions, Keywords,
 };
 use crate::keyword_preprocessor::{
     keep_unique_arguments, sort_and_keep_unique_arguments, sort_arguments,
@@ -17,19 +17,24 @@ use crate::node::{
     CommentedArgumentComment, FileElement, InlineHintKind, LineComment, Position,
     RefinedArgumentsAtom, RefinedArgumentsNode, Start,
 };
-use crate::parser::{quoted_argument_pattern, regex, Parser};
-use crate::sanity_checker::check_equivalence;
+use crate::parser::{quoted_argument_pattern, regex, BracketRegexes, Error, Parser};
+use crate::sanity_checker::{describe_element, fingerprint, first_difference, Difference};
 use crate::two_words_keyword_isolator::TwoWordKeywordMatcher;
 use crate::utils::load_definitions_from_extensions;
+use crate::warning_sink::warn;
 use pyo3::exceptions::PyRuntimeError;
 use pyo3::{pyclass, pymethods, PyErr, PyResult, Python};
 use regex::Regex;
 use rust_yaml::{Value, Yaml};
 use std::cell::RefCell;
 use std::collections::HashMap;
+use std::hash::{Hash, Hasher};
 use std::iter::zip;
+use std::rc::Rc;
 use std::str::SplitInclusive;
+use std::sync::atomic::{AtomicUsize, Ordering};
 use std::sync::LazyLock;
+use xxhash_rust::xxh3::{xxh3_64, Xxh3Default};
 
 pub type UnknownCommandsUsed = Vec<(String, usize, usize)>;
 
@@ -38,14 +43,73 @@ struct FormatterImpl<'a> {
     active_schema: Option<&'a ArgumentSchema>,
     active_command: Option<&'a CommandSchema>,
     favour_expansion: bool,
-    indent_symbol: String,
+    indent_symbol: Rc<str>,
 
     unknown_commands_used: &'a RefCell<UnknownCommandsUsed>,
+    memo: &'a RefCell<Memo>,
 
     configuration: &'a OutcomeConfiguration,
     schemas: &'a CommandSchemas,
 }
 
+#[derive(Eq, Hash, PartialEq)]
+struct MemoKey {
+    atom: u128,
+    indent_symbol: Rc<str>,
+    favour_expansion: bool,
+    active_schema: Option<*const ArgumentSchema>,
+    active_command: Option<*const CommandSchema>,
+}
+
+#[derive(Default)]
+struct Memo {
+    results: HashMap<MemoKey, String>,
+    hashes: HashMap<*const RefinedArgumentsAtom, u128>,
+    hashed: Vec<*const RefinedArgumentsAtom>,
+    lookups: usize,
+    hits: usize,
+}
+
+impl Memo {
+    fn get(&mut self, key: &MemoKey) -> Option<String> {
+        self.lookups += 1;
+        let result = self.results.get(key).cloned();
+        if result.is_some() {
+            self.hits += 1;
+        }
+        result
+    }
+
+    fn known_hash(&self, atom: &RefinedArgumentsAtom) -> Option<u128> {
+        self.hashes.get(&std::ptr::from_ref(atom)).copied()
+    }
+
+    fn remember_hash(&mut self, atom: &RefinedArgumentsAtom, hash: u128) {
+        let address = std::ptr::from_ref(atom);
+        self.hashes.insert(address, hash);
+        self.hashed.push(address);
+    }
+
+    fn forget_hashes_since(&mut self, checkpoint: usize) {
+        for address in self.hashed.drain(checkpoint..) {
+            self.hashes.remove(&address);
+        }
+    }
+}
+
+#[derive(Default)]
+struct MemoStatistics {
+    lookups: AtomicUsize,
+    hits: AtomicUsize,
+}
+
+impl MemoStatistics {
+    fn add(&self, memo: &Memo) {
+        self.lookups.fetch_add(memo.lookups, Ordering::Relaxed);
+        self.hits.fetch_add(memo.hits, Ordering::Relaxed);
+    }
+}
+
 fn remove_common_beginning(s: &str, other: &str) -> String {
     let mut index = 0;
     for (lhs, rhs) in zip(s.chars(), other.chars()) {
@@ -91,8 +155,7 @@ fn ends_with_line_comment(s: &str) -> bool {
     }
 }
 
-fn flat_split(pattern: &str, s: &str) -> (String, Option<[String; 2]>) {
-    let re = regex(pattern);
+fn flat_split(re: &Regex, s: &str) -> (String, Option<[String; 2]>) {
     match re.find(s) {
         None => (s.to_string(), None),
         Some(m) => (
@@ -103,16 +166,21 @@ fn flat_split(pattern: &str, s: &str) -> (String, Option<[String; 2]>) {
 }
 
 fn split_by_line_comment(s: &str) -> (String, Option<[String; 2]>) {
-    flat_split(r"\s*#", s)
+    static RE: LazyLock<Regex> = LazyLock::new(|| regex(r"\s*#"));
+    flat_split(&RE, s)
+}
+
+fn bracket_arguments_pattern(number_of_equal_signs: usize) -> String {
+    let equal_signs = "=".repeat(number_of_equal_signs);
+    format!(r"\[{equal_signs}\[([\s\S]+?)\]{equal_signs}\]")
 }
 
 fn split_by_bracket_arguments(s: &str) -> (String, Option<[String; 2]>) {
-    let regex_start = regex(r"\[(=*)\[");
-    if let Some(captures) = regex_start.captures(s) {
+    static RE_START: LazyLock<Regex> = LazyLock::new(|| regex(r"\[(=*)\["));
+    static BRACKET_ARGUMENTS: BracketRegexes = BracketRegexes::new(bracket_arguments_pattern);
+    if let Some(captures) = RE_START.captures(s) {
         if let Some(matched_left_bracket) = captures.get(1) {
-            let equal_signs = "=".repeat(matched_left_bracket.len());
-            let pattern = format!(r"\[{equal_signs}\[([\s\S]+?)\]{equal_signs}\]");
-            return flat_split(&pattern, s);
+            return flat_split(&BRACKET_ARGUMENTS.get(matched_left_bracket.len()), s);
         }
     }
 
@@ -120,10 +188,10 @@ fn split_by_bracket_arguments(s: &str) -> (String, Option<[String; 2]>) {
 }
 
 fn split_by_quoted_arguments(s: &String) -> Vec<String> {
-    let re = regex(quoted_argument_pattern());
+    static RE: LazyLock<Regex> = LazyLock::new(|| regex(quoted_argument_pattern()));
     let mut s: &str = s;
     let mut result = Vec::<String>::new();
-    while let Some(matched) = re.find(s) {
+    while let Some(matched) = RE.find(s) {
         result.push(s[..matched.start()].to_string());
         result.push(s[matched.range()].to_string());
         s = &s[matched.end()..];
@@ -172,15 +240,15 @@ fn indent<Predicate: Fn(&str) -> bool>(
     indent_symbol: &str,
     predicate: Predicate,
 ) -> String {
-    s.split_inclusive('\n')
-        .map(|line| {
-            if predicate(line) {
-                format!("{indent_symbol}{line}")
-            } else {
-                line.to_string()
-            }
-        })
-        .collect::<String>()
+    let lines = s.bytes().filter(|&c| c == b'\n').count() + 1;
+    let mut result = String::with_capacity(s.len() + lines * indent_symbol.len());
+    for line in s.split_inclusive('\n') {
+        if predicate(line) {
+            result.push_str(indent_symbol);
+        }
+        result.push_str(line);
+    }
+    result
 }
 
 fn indent_segment(segment: &str, indent_symbol: &str) -> String {
@@ -196,10 +264,11 @@ fn indent_segment(segment: &str, indent_symbol: &str) -> String {
 }
 
 fn safe_indent(s: &str, indent_symbol: &str) -> String {
-    split_into_segments(s)
-        .into_iter()
-        .map(|x| indent_segment(&x, indent_symbol))
-        .collect::<String>()
+    let mut result = String::with_capacity(s.len());
+    for segment in split_into_segments(s) {
+        result.push_str(&indent_segment(&segment, indent_symbol));
+    }
+    result
 }
 
 trait HasLineComment {
@@ -282,6 +351,120 @@ impl HasLineComment for &&str {
     }
 }
 
+trait MinimalFlatWidth {
+    fn minimal_flat_width(&self) -> Option<usize>;
+}
+
+fn verbatim_width(value: &str) -> Option<usize> {
+    if value.contains('\n') {
+        None
+    } else {
+        Some(value.chars().count())
+    }
+}
+
+fn sum_of_minimal_flat_widths<T: MinimalFlatWidth>(items: &[T]) -> Option<usize> {
+    items.iter().map(MinimalFlatWidth::minimal_flat_width).sum()
+}
+
+fn max_of_minimal_flat_widths<T: MinimalFlatWidth>(items: &[T]) -> Option<usize> {
+    items
+        .iter()
+        .map(MinimalFlatWidth::minimal_flat_width)
+        .try_fold(0, |result, width| Some(result.max(width?)))
+}
+
+impl MinimalFlatWidth for Argument {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        match self {
+            Argument::Bracket(arg) => Some(verbatim_width(&arg.value)? + 2 * arg.bracket_width + 4),
+            Argument::Complex { arguments } => Some(sum_of_minimal_flat_widths(arguments)? + 2),
+            Argument::Quoted { value, .. } => Some(verbatim_width(value)? + 2),
+            Argument::Unquoted { value, .. } => verbatim_width(value),
+            Argument::InlineHint { value, .. } => Some(verbatim_width(value)? + 1),
+        }
+    }
+}
+
+impl MinimalFlatWidth for ArgumentsAtom {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        match self {
+            Self::Argument(argument) | Self::CommentedArgument { argument, .. } => {
+                argument.minimal_flat_width()
+            }
+            Self::BracketComment(_) | Self::LineComment(_) => Some(0),
+        }
+    }
+}
+
+impl MinimalFlatWidth for Box<RefinedArgumentsAtom> {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        self.as_ref().minimal_flat_width()
+    }
+}
+
+impl MinimalFlatWidth for RefinedArgumentsAtom {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        (&self).minimal_flat_width()
+    }
+}
+
+impl MinimalFlatWidth for &RefinedArgumentsAtom {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        match self {
+            RefinedArgumentsAtom::Atom(atom) => atom.minimal_flat_width(),
+            RefinedArgumentsAtom::BinaryOperation {
+                lhs,
+                operation,
+                rhs,
+            } => Some(
+                lhs.minimal_flat_width()?
+                    + operation.minimal_flat_width()?
+                    + rhs.minimal_flat_width()?,
+            ),
+            RefinedArgumentsAtom::UnaryOperation { operation, operand } => Some(
+                operation.minimal_flat_width()?
+                    + match operand {
+                        None => 0,
+                        Some(operand) => operand.minimal_flat_width()?,
+                    },
+            ),
+            RefinedArgumentsAtom::OptionArgument { keyword } => keyword.minimal_flat_width(),
+            RefinedArgumentsAtom::OneValueArgument {
+                keyword: first,
+                arguments: rest,
+            }
+            | RefinedArgumentsAtom::Pair { first, rest } => {
+                Some(first.minimal_flat_width()? + sum_of_minimal_flat_widths(rest)?)
+            }
+            RefinedArgumentsAtom::MultiValueArgument {
+                keyword: first,
+                arguments: rest,
+            }
+            | RefinedArgumentsAtom::Section {
+                header: first,
+                values: rest,
+            } => Some(first.minimal_flat_width()? + max_of_minimal_flat_widths(rest)?),
+            RefinedArgumentsAtom::PositionalArguments(args) => sum_of_minimal_flat_widths(args),
+            RefinedArgumentsAtom::KeywordArgument {
+                first,
+                in_between,
+                second,
+            } => Some(
+                first.minimal_flat_width()?
+                    + sum_of_minimal_flat_widths(in_between)?
+                    + second.minimal_flat_width()?,
+            ),
+        }
+    }
+}
+
+impl MinimalFlatWidth for &&str {
+    fn minimal_flat_width(&self) -> Option<usize> {
+        verbatim_width(self)
+    }
+}
+
 fn is_line_comment_in_any_of(arguments: &RefinedArgumentsNode) -> bool {
     arguments.iter().any(HasLineComment::has_line_comment)
 }
@@ -361,28 +544,28 @@ fn preprocess_content(content: &str) -> String {
 impl FormatterImpl<'_> {
     fn not_indented(&self) -> Self {
         let mut result = self.clone();
-        result.indent_symbol = String::new();
+        result.indent_symbol = Rc::from("");
         result
     }
 
     fn indented(&self) -> Self {
         let mut result = self.clone();
-        result.indent_symbol = format!(
+        result.indent_symbol = Rc::from(format!(
             "{}{}",
             self.configuration.indent_type.as_string(),
             self.indent_symbol
-        );
+        ));
         result
     }
 
     fn dedented(&self) -> Self {
         let indent_type = self.configuration.indent_type.as_string();
         let mut result = self.clone();
-        result.indent_symbol = self
-            .indent_symbol
-            .strip_prefix(&indent_type)
-            .get_or_insert("")
-            .to_string();
+        if let Some(indent_symbol) = self.indent_symbol.strip_prefix(&indent_type) {
+            result.indent_symbol = Rc::from(indent_symbol);
+        } else {
+            result.indent_symbol = Rc::from("");
+        }
         result
     }
 
@@ -893,7 +1076,95 @@ impl FormatterImpl<'_> {
         }
     }
 
+    fn structural_hash(&self, atom: &RefinedArgumentsAtom) -> u128 {
+        if let Some(hash) = self.memo.borrow().known_hash(atom) {
+            return hash;
+        }
+
+        let mut hasher = Xxh3Default::new();
+        std::mem::discriminant(atom).hash(&mut hasher);
+        let mut add_children = |children: &[&RefinedArgumentsAtom]| {
+            hasher.write_usize(children.len());
+            for child in children {
+                hasher.write_u128(self.structural_hash(child));
+            }
+        };
+        match atom {
+            RefinedArgumentsAtom::Atom(atom) => atom.hash(&mut hasher),
+            RefinedArgumentsAtom::KeywordArgument {
+                first,
+                in_between,
+                second,
+            } => (first, in_between, second).hash(&mut hasher),
+            RefinedArgumentsAtom::BinaryOperation {
+                lhs,
+                operation,
+                rhs,
+            } => add_children(&[lhs, operation, rhs]),
+            RefinedArgumentsAtom::UnaryOperation { operation, operand } => match operand {
+                Some(operand) => add_children(&[operation, operand]),
+                None => add_children(&[operation]),
+            },
+            RefinedArgumentsAtom::OptionArgument { keyword } => add_children(&[keyword]),
+            RefinedArgumentsAtom::PositionalArguments(arguments) => {
+                add_children(&arguments.iter().collect::<Vec<_>>());
+            }
+            RefinedArgumentsAtom::OneValueArgument {
+                keyword: first,
+                arguments: rest,
+            }
+            | RefinedArgumentsAtom::MultiValueArgument {
+                keyword: first,
+                arguments: rest,
+            }
+            | RefinedArgumentsAtom::Section {
+                header: first,
+                values: rest,
+            }
+            | RefinedArgumentsAtom::Pair { first, rest } => {
+                add_children(
+                    &std::iter::once(first.as_ref())
+                        .chain(rest)
+                        .collect::<Vec<_>>(),
+                );
+            }
+        }
+        let hash = hasher.digest128();
+        self.memo.borrow_mut().remember_hash(atom, hash);
+        hash
+    }
+
+    fn memo_key(&self, atom: &RefinedArgumentsAtom) -> MemoKey {
+        MemoKey {
+            atom: self.structural_hash(atom),
+            indent_symbol: self.indent_symbol.clone(),
+            favour_expansion: self.favour_expansion,
+            active_schema: self.active_schema.map(std::ptr::from_ref),
+            active_command: self.active_command.map(std::ptr::from_ref),
+        }
+    }
+
     fn arguments_atom(&mut self, atom: &RefinedArgumentsAtom) -> String {
+        if let RefinedArgumentsAtom::Atom(_) = atom {
+            return self.format_arguments_atom(atom);
+        }
+
+        let checkpoint = self.memo.borrow().hashed.len();
+        let key = self.memo_key(atom);
+        let memoized = self.memo.borrow_mut().get(&key);
+        let result = match memoized {
+            Some(result) => result,
+            None => {
+                let result = self.format_arguments_atom(atom);
+                self.memo.borrow_mut().results.insert(key, result.clone());
+                result
+            }
+        };
+        self.memo.borrow_mut().forget_hashes_since(checkpoint);
+        result
+    }
+
+    fn format_arguments_atom(&mut self, atom: &RefinedArgumentsAtom) -> String {
         match atom {
             RefinedArgumentsAtom::Atom(atom) => match atom {
                 ArgumentsAtom::Argument(argument) => self.argument(argument),
@@ -1139,7 +1410,7 @@ impl FormatterImpl<'_> {
     }
 
     fn try_to_format_into_single_line<
-        Part: HasLineComment,
+        Part: HasLineComment + MinimalFlatWidth,
         Visitor: Fn(&mut FormatterImpl, &Part) -> String,
     >(
         &self,
@@ -1158,9 +1429,17 @@ impl FormatterImpl<'_> {
 
         let reserved_space =
             prefix.chars().count() + postfix.chars().count() + self.indent_symbol.chars().count();
+        let separators = parts.len().saturating_sub(1);
+        match sum_of_minimal_flat_widths(parts) {
+            Some(width)
+                if reserved_space + width + separators <= self.configuration.line_length => {}
+            _ => return None,
+        }
+
         {
             let mut f = self.not_indented();
-            let mut result = self.indent_symbol.clone();
+            let mut result = String::with_capacity(self.configuration.line_length + 1);
+            result.push_str(&self.indent_symbol);
             result.push_str(prefix);
             let mut line_length = reserved_space;
 
@@ -1251,7 +1530,12 @@ impl FormatterImpl<'_> {
                 ref formatted_node,
                 ref position,
                 ..
-            } => self.custom_command(indentation, identifier, formatted_node, position),
+            } => self.custom_command(
+                indentation,
+                identifier.to_string(),
+                formatted_node,
+                position,
+            ),
         }
     }
 
@@ -1320,16 +1604,15 @@ impl FormatterImpl<'_> {
                 }
                 result
             }
-            FileElement::NewlineOrGap { value } => value,
+            FileElement::NewlineOrGap { value } => value.to_string(),
         }
     }
 
-    fn start(&self, node: Start) -> String {
-        let mut result = node
-            .children
-            .into_iter()
-            .map(|x| self.file_element(x))
-            .collect::<String>();
+    fn start(&self, node: Start, capacity: usize) -> String {
+        let mut result = String::with_capacity(capacity);
+        for element in node.children {
+            result.push_str(&self.file_element(element));
+        }
         if !result.ends_with('\n') {
             result.push('\n');
         }
@@ -1339,21 +1622,26 @@ impl FormatterImpl<'_> {
 
 fn format(
     node: Start,
+    capacity: usize,
     configuration: &OutcomeConfiguration,
     schemas: &CommandSchemas,
+    memo_statistics: &MemoStatistics,
 ) -> (String, UnknownCommandsUsed) {
     let unknown_commands_used: RefCell<UnknownCommandsUsed> = UnknownCommandsUsed::new().into();
+    let memo = RefCell::new(Memo::default());
     let formatter = FormatterImpl {
         active_schema: None,
         active_command: None,
         favour_expansion: false,
-        indent_symbol: String::new(),
+        indent_symbol: Rc::from(""),
 
         unknown_commands_used: &unknown_commands_used,
+        memo: &memo,
         configuration,
         schemas,
     };
-    let formatted_code = formatter.start(node);
+    let formatted_code = formatter.start(node, capacity);
+    memo_statistics.add(&memo.into_inner());
     (formatted_code, unknown_commands_used.into_inner())
 }
 
@@ -1362,6 +1650,7 @@ pub struct Formatter {
     configuration: OutcomeConfiguration,
     schemas: CommandSchemas,
     lines_to_format: Vec<LineRange>,
+    memo_statistics: MemoStatistics,
 }
 
 const GERSEMI_OFF: &str = "# gersemi: off";
@@ -1491,16 +1780,13 @@ fn reconstruct_disabled_formatting_zones(original: &str, formatted: String) -> S
     result.into_iter().collect::<String>()
 }
 
-fn line_range_fence_regex() -> Regex {
-    let off_pattern = format!("[ \t]*{GERSEMI_OFF}\\n{BUG}\\n");
-    let on_pattern = format!("{BUG}\\n[ \t]*{GERSEMI_ON}\\n");
-    let pattern = format!("{off_pattern}|{on_pattern}");
-    regex(&pattern)
-}
-
 fn remove_line_range_fences(formatted_code: &str) -> String {
-    let pattern = line_range_fence_regex();
-    pattern.replace_all(formatted_code, "").to_string()
+    static RE: LazyLock<Regex> = LazyLock::new(|| {
+        let off_pattern = format!("[ \t]*{GERSEMI_OFF}\\n{BUG}\\n");
+        let on_pattern = format!("{BUG}\\n[ \t]*{GERSEMI_ON}\\n");
+        regex(&format!("{off_pattern}|{on_pattern}"))
+    });
+    RE.replace_all(formatted_code, "").to_string()
 }
 
 fn get_keyword_transformers(
@@ -1565,7 +1851,7 @@ fn create_command_schema(content: CustomCommandContent) -> CommandSchema {
     }
 }
 
-fn get_just_schemas(definitions: Vec<(String, Vec<CustomCommand>)>) -> CommandSchemaMapping {
+fn get_just_schemas(definitions: Definitions) -> CommandSchemaMapping {
     let mut result = CommandSchemaMapping::new();
     for (name, mut info) in definitions {
         info.sort_by(|a, b| a.1.cmp(&b.1));
@@ -1576,49 +1862,121 @@ fn get_just_schemas(definitions: Vec<(String, Vec<CustomCommand>)>) -> CommandSc
     result
 }
 
-#[pymethods]
 impl Formatter {
-    #[new]
-    pub fn new(py: Python, configuration: Configuration) -> PyResult<Self> {
-        let definitions = find_all_custom_command_definitions(py, &configuration)?;
+    pub fn build(py: Python, configuration: Configuration) -> PyResult<(Self, Vec<String>)> {
+        let (definitions, warnings) = find_all_custom_command_definitions(py, &configuration)?;
+        Self::from_definitions(configuration, definitions, warnings)
+    }
+
+    pub fn from_definitions(
+        configuration: Configuration,
+        definitions: Definitions,
+        warnings: Vec<String>,
+    ) -> PyResult<(Self, Vec<String>)> {
         let definition_schemas = get_just_schemas(definitions);
         let extension_schemas =
             load_definitions_from_extensions(&configuration.outcome.extensions)?;
-        Ok(Self {
+        let formatter = Self {
             configuration: configuration.outcome,
-            schemas: CommandSchemas {
-                definition_schemas,
-                extension_schemas,
-            },
+            schemas: CommandSchemas::new(definition_schemas, extension_schemas),
             lines_to_format: configuration.control.line_ranges,
-        })
+            memo_statistics: MemoStatistics::default(),
+        };
+        Ok((formatter, warnings))
+    }
+}
+
+#[pymethods]
+impl Formatter {
+    #[new]
+    pub fn new(py: Python, configuration: Configuration) -> PyResult<Self> {
+        let (formatter, warnings) = Self::build(py, configuration)?;
+        for warning in warnings {
+            warn(warning);
+        }
+        Ok(formatter)
     }
 
     pub fn format(&self, text: String) -> Result<(String, UnknownCommandsUsed), PyErr> {
-        let text = add_line_range_fences(text, &self.lines_to_format);
-        let node = Parser::new(text.clone(), &self.schemas).start()?;
-        let before = if self.configuration.disable_sanity_checks {
-            None
+        let (result, warnings, _) = self.format_lines(text, &self.lines_to_format)?;
+        Ok((result, warnings))
+    }
+
+    pub fn memo_statistics(&self) -> (usize, usize) {
+        (
+            self.memo_statistics.hits.load(Ordering::Relaxed),
+            self.memo_statistics.lookups.load(Ordering::Relaxed),
+        )
+    }
+}
+
+impl Formatter {
+    pub fn parse(&self, text: &str) -> Result<Start, Error> {
+        Parser::new(text, &self.schemas).start()
+    }
+
+    pub fn format_file(&self, text: String) -> Result<(String, UnknownCommandsUsed, bool), PyErr> {
+        self.format_lines(text, &self.lines_to_format)
+    }
+
+    fn is_sampled_for_sanity_check(&self, text: &str) -> bool {
+        !self.configuration.disable_sanity_checks
+            && xxh3_64(text.as_bytes()) % 100 < self.configuration.sanity_check_sampling
+    }
+
+    pub fn format_parsed(
+        &self,
+        text: &str,
+        node: Start,
+    ) -> Result<(String, UnknownCommandsUsed, bool), PyErr> {
+        let before = if self.is_sampled_for_sanity_check(text) {
+            Some(fingerprint(&node))
         } else {
-            Some(node.clone())
+            None
         };
 
-        let (result, warnings) = format(node, &self.configuration, &self.schemas);
+        let (result, warnings) = format(
+            node,
+            text.len() + text.len() / 8,
+            &self.configuration,
+            &self.schemas,
+            &self.memo_statistics,
+        );
+        let before = before.filter(|_| result != text);
+        let verified = before.is_some();
         if let Some(before) = before {
-            let after = Parser::new(result.clone(), &self.schemas).start()?;
-            if !check_equivalence(before, after) {
-                return Err(PyRuntimeError::new_err(
-                    "Reformatting doesn't produce equivalent code.",
-                ));
+            let after_node = self.parse(&result)?;
+            if let Some(difference) = first_difference(&before, &fingerprint(&after_node)) {
+                let difference = match difference {
+                    Difference::Before(index) => describe_element(&self.parse(text)?, index),
+                    Difference::After(index) => describe_element(&after_node, index),
+                };
+                return Err(PyRuntimeError::new_err(format!(
+                    "Reformatting doesn't produce equivalent code. First difference: {difference}."
+                )));
             }
         }
 
-        let result = reconstruct_disabled_formatting_zones(&text, result);
-        let result = if self.lines_to_format.is_empty() {
+        Ok((
+            reconstruct_disabled_formatting_zones(text, result),
+            warnings,
+            verified,
+        ))
+    }
+
+    pub fn format_lines(
+        &self,
+        text: String,
+        lines_to_format: &[LineRange],
+    ) -> Result<(String, UnknownCommandsUsed, bool), PyErr> {
+        let text = add_line_range_fences(text, lines_to_format);
+        let node = self.parse(&text)?;
+        let (result, warnings, verified) = self.format_parsed(&text, node)?;
+        let result = if lines_to_format.is_empty() {
             result
         } else {
             remove_line_range_fences(&result)
         };
-        Ok((result, warnings))
+        Ok((result, warnings, verified))
     }
 }
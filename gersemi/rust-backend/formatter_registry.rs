@@ -0,0 +1,111 @@
+use crate::configuration::Configuration;
+use crate::custom_command_definition_finder::find_all_custom_command_definitions;
+use crate::formatter::Formatter;
+use crate::warning_sink::warn;
+use pyo3::exceptions::PyRuntimeError;
+use pyo3::{PyResult, Python};
+use std::collections::HashMap;
+use std::sync::{Arc, LazyLock, Mutex};
+
+const MAX_NUMBER_OF_FORMATTERS: usize = 16;
+
+struct Entry {
+    formatter: Arc<Formatter>,
+    warnings: Vec<String>,
+    last_used: u64,
+}
+
+#[derive(Default)]
+struct Registry {
+    entries: HashMap<String, Entry>,
+    clock: u64,
+}
+
+fn registry() -> &'static Mutex<Registry> {
+    static REGISTRY: LazyLock<Mutex<Registry>> = LazyLock::new(|| Mutex::new(Registry::default()));
+    &REGISTRY
+}
+
+fn registry_key(
+    configuration: &Configuration,
+    configuration_summary: &str,
+    definition_warnings: &[String],
+) -> String {
+    format!(
+        "{configuration_summary};{:?};{};{definition_warnings:?}",
+        configuration.control.line_ranges, configuration.control.respect_ignore_files
+    )
+}
+
+fn lookup(key: &str) -> PyResult<Option<(Arc<Formatter>, Vec<String>)>> {
+    let mut registry = registry()
+        .lock()
+        .map_err(|_| PyRuntimeError::new_err("Formatter registry is unavailable"))?;
+    registry.clock += 1;
+    let clock = registry.clock;
+    let Some(entry) = registry.entries.get_mut(key) else {
+        return Ok(None);
+    };
+
+    entry.last_used = clock;
+    Ok(Some((entry.formatter.clone(), entry.warnings.clone())))
+}
+
+fn insert(key: String, entry: Entry) -> PyResult<()> {
+    let mut registry = registry()
+        .lock()
+        .map_err(|_| PyRuntimeError::new_err("Formatter registry is unavailable"))?;
+    if registry.entries.len() >= MAX_NUMBER_OF_FORMATTERS {
+        let least_recently_used = registry
+            .entries
+            .iter()
+            .min_by_key(|(_, entry)| entry.last_used)
+            .map(|(key, _)| key.clone());
+        if let Some(least_recently_used) = least_recently_used {
+            registry.entries.remove(&least_recently_used);
+        }
+    }
+
+    registry.clock += 1;
+    let entry = Entry {
+        last_used: registry.clock,
+        ..entry
+    };
+    registry.entries.insert(key, entry);
+    Ok(())
+}
+
+pub fn find_formatter(
+    py: Python,
+    configuration: &Configuration,
+) -> PyResult<(String, Arc<Formatter>, Vec<String>)> {
+    let (definitions, definition_warnings) =
+        find_all_custom_command_definitions(py, configuration)?;
+    let configuration_summary = configuration.summarize(&definitions)?;
+    let key = registry_key(configuration, &configuration_summary, &definition_warnings);
+
+    if let Some((formatter, warnings)) = lookup(&key)? {
+        return Ok((configuration_summary, formatter, warnings));
+    }
+
+    let (formatter, warnings) =
+        Formatter::from_definitions(configuration.clone(), definitions, definition_warnings)?;
+    let formatter = Arc::new(formatter);
+    insert(
+        key,
+        Entry {
+            formatter: formatter.clone(),
+            warnings: warnings.clone(),
+            last_used: 0,
+        },
+    )?;
+    Ok((configuration_summary, formatter, warnings))
+}
+
+pub fn get_formatter(py: Python, configuration: &Configuration) -> PyResult<Arc<Formatter>> {
+    let (_, formatter, warnings) = find_formatter(py, configuration)?;
+    for warning in warnings {
+        warn(warning);
+    }
+    Ok(formatter)
+}
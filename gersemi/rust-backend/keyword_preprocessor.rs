@@ -15,7 +15,7 @@ fn get_argument_value(argument: &Argument) -> String {
             )
         }
         Argument::Quoted { value, .. } => format!("\"{value}\""),
-        Argument::Unquoted { value, .. } | Argument::InlineHint { value, .. } => value.clone(),
+        Argument::Unquoted { value, .. } | Argument::InlineHint { value, .. } => value.to_string(),
     }
 }
 
@@ -33,7 +33,7 @@ fn get_atom_value(atom: &ArgumentsAtom) -> String {
         }
         ArgumentsAtom::Argument(argument) => get_argument_value(argument),
         ArgumentsAtom::BracketComment(BracketComment { value })
-        | ArgumentsAtom::LineComment(LineComment { value }) => value.clone(),
+        | ArgumentsAtom::LineComment(LineComment { value }) => value.to_string(),
     }
 }
 
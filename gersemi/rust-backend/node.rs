@@ -1,15 +1,112 @@
 use crate::configuration::{KeywordFormatter, KeywordPreprocessor};
+use std::cmp::Ordering;
+use std::fmt;
+use std::hash::{Hash, Hasher};
+use std::ops::{Deref, Range};
+use std::sync::Arc;
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone)]
+pub struct Span {
+    source: Arc<str>,
+    start: usize,
+    end: usize,
+}
+
+impl Span {
+    pub fn new(source: &Arc<str>, range: Range<usize>) -> Self {
+        Span {
+            source: source.clone(),
+            start: range.start,
+            end: range.end,
+        }
+    }
+
+    pub fn empty() -> Self {
+        Span::from("")
+    }
+
+    pub fn as_str(&self) -> &str {
+        &self.source[self.start..self.end]
+    }
+
+    pub fn without_trailing_whitespace(&self) -> Self {
+        Span {
+            source: self.source.clone(),
+            start: self.start,
+            end: self.start + self.as_str().trim_end().len(),
+        }
+    }
+}
+
+impl Deref for Span {
+    type Target = str;
+
+    fn deref(&self) -> &str {
+        self.as_str()
+    }
+}
+
+impl From<&str> for Span {
+    fn from(value: &str) -> Self {
+        Span::new(&Arc::from(value), 0..value.len())
+    }
+}
+
+impl From<String> for Span {
+    fn from(value: String) -> Self {
+        let end = value.len();
+        Span::new(&Arc::from(value), 0..end)
+    }
+}
+
+impl PartialEq for Span {
+    fn eq(&self, other: &Self) -> bool {
+        self.as_str() == other.as_str()
+    }
+}
+
+impl Eq for Span {}
+
+impl PartialOrd for Span {
+    fn partial_cmp(&self, other: &Self) -> Option<Ordering> {
+        Some(self.cmp(other))
+    }
+}
+
+impl Ord for Span {
+    fn cmp(&self, other: &Self) -> Ordering {
+        self.as_str().cmp(other.as_str())
+    }
+}
+
+impl Hash for Span {
+    fn hash<H: Hasher>(&self, state: &mut H) {
+        self.as_str().hash(state);
+    }
+}
+
+impl fmt::Debug for Span {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        fmt::Debug::fmt(self.as_str(), f)
+    }
+}
+
+impl fmt::Display for Span {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        fmt::Display::fmt(self.as_str(), f)
+    }
+}
+
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub struct Position {
     pub line: usize,
     pub column: usize,
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub struct BracketArgument {
     pub bracket_width: usize,
-    pub value: String,
+    pub value: Span,
     pub position: Option<Position>,
 }
 
@@ -20,30 +117,30 @@ impl BracketArgument {
     }
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum InlineHintKind {
     KeywordPreprocessor(KeywordPreprocessor),
     KeywordFormatter(KeywordFormatter),
     AsCommand { command: String },
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum Argument {
     Bracket(BracketArgument),
     Complex {
         arguments: ArgumentsNode,
     },
     Quoted {
-        value: String,
+        value: Span,
         position: Option<Position>,
     },
     Unquoted {
-        value: String,
+        value: Span,
         position: Option<Position>,
     },
     InlineHint {
         kind: InlineHintKind,
-        value: String,
+        value: Span,
     },
 }
 
@@ -66,21 +163,18 @@ impl Argument {
             Self::Bracket(BracketArgument { value, .. })
             | Self::Quoted { value, .. }
             | Self::Unquoted { value, .. }
-            | Self::InlineHint { value, .. } => value.clone(),
+            | Self::InlineHint { value, .. } => value.to_string(),
         }
     }
 }
 
-#[derive(Clone, Debug, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Debug, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum CommentedArgumentComment {
     BracketComment(BracketComment),
-    LineComment {
-        comment: LineComment,
-        newline: String,
-    },
+    LineComment { comment: LineComment, newline: Span },
 }
 
-#[derive(Debug, Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Debug, Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum ArgumentsAtom {
     CommentedArgument {
         argument: Argument,
@@ -110,22 +204,22 @@ impl ArgumentsAtom {
 
 pub type ArgumentsNode = Vec<ArgumentsAtom>;
 
-#[derive(Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum CommandInvocation {
     KnownCommand {
-        identifier: String,
+        identifier: Span,
         arguments: ArgumentsNode,
     },
     CustomCommand {
-        indentation: String,
-        identifier: String,
+        indentation: Span,
+        identifier: Span,
         arguments: ArgumentsNode,
-        formatted_node: String,
+        formatted_node: Span,
         position: Position,
     },
 }
 
-#[derive(Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum Command {
     Element {
         command_invocation: CommandInvocation,
@@ -148,17 +242,17 @@ impl Command {
     }
 }
 
-#[derive(Clone, Debug, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Debug, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub struct BracketComment {
-    pub value: String,
+    pub value: Span,
 }
 
-#[derive(Clone, Debug, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Debug, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub struct LineComment {
-    pub value: String,
+    pub value: Span,
 }
 
-#[derive(Clone, Eq, Ord, PartialEq, PartialOrd)]
+#[derive(Clone, Eq, Hash, Ord, PartialEq, PartialOrd)]
 pub enum FileElement {
     Block {
         start: Command,
@@ -167,14 +261,14 @@ pub enum FileElement {
     },
     Command(Command),
     StandaloneIdentifier {
-        value: String,
+        value: Span,
     },
     NonCommandElement {
         bracket_comments: Vec<BracketComment>,
         line_comment: Option<LineComment>,
     },
     NewlineOrGap {
-        value: String,
+        value: &'static str,
     },
 }
 
@@ -218,7 +312,7 @@ pub struct Start {
     pub children: Vec<FileElement>,
 }
 
-#[derive(Debug, Clone)]
+#[derive(Debug, Clone, Eq, Hash, PartialEq)]
 pub enum RefinedArgumentsAtom {
     Atom(ArgumentsAtom),
     BinaryOperation {
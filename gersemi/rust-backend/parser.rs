@@ -1,25 +1,20 @@
-use crate::argument_schema::{CommandSchema, CommandSchemas};
+use crate::argument_schema::CommandSchemas;
 use crate::configuration::{KeywordFormatter, KeywordPreprocessor};
 use crate::node::{
     Argument, ArgumentsAtom, ArgumentsNode, BracketArgument, BracketComment, Command,
     CommandInvocation, CommentedArgumentComment, FileElement, InlineHintKind, LineComment,
-    Position, Start,
+    Position, Span, Start,
 };
-use crate::utils::builtin_schemas;
 use pyo3::exceptions::PyRuntimeError;
 use pyo3::PyErr;
 use regex::Regex;
-use std::collections::HashMap;
-use std::sync::{LazyLock, Mutex};
-
-pub struct BlockCommand {
-    re: regex::Regex,
-}
+use std::borrow::Cow;
+use std::ops::Range;
+use std::sync::{Arc, LazyLock, OnceLock};
 
 pub struct Parser<'a> {
-    text: String,
+    text: Arc<str>,
     line_offsets: Vec<usize>,
-    blocks: Vec<(String, BlockCommand)>,
     schemas: &'a CommandSchemas,
 }
 
@@ -74,43 +69,61 @@ fn bracket_argument_pattern(number_of_equal_signs: usize) -> String {
 }
 
 pub fn regex(pattern: &str) -> Regex {
-    static REGEXES: LazyLock<Mutex<HashMap<String, Regex>>> =
-        LazyLock::new(|| Mutex::new(HashMap::<String, Regex>::new()));
-
-    let mut regexes = REGEXES.lock().unwrap();
-    regexes
-        .entry(pattern.to_string())
-        .or_insert_with(|| Regex::new(pattern).unwrap())
-        .clone()
+    Regex::new(pattern).unwrap()
+}
+
+const MAX_NUMBER_OF_CACHED_EQUAL_SIGNS: usize = 16;
+
+pub struct BracketRegexes {
+    make_pattern: fn(usize) -> String,
+    regexes: [OnceLock<Regex>; MAX_NUMBER_OF_CACHED_EQUAL_SIGNS],
+}
+
+impl BracketRegexes {
+    pub const fn new(make_pattern: fn(usize) -> String) -> Self {
+        BracketRegexes {
+            make_pattern,
+            regexes: [const { OnceLock::new() }; MAX_NUMBER_OF_CACHED_EQUAL_SIGNS],
+        }
+    }
+
+    pub fn get(&self, number_of_equal_signs: usize) -> Cow<'_, Regex> {
+        let make = || regex(&(self.make_pattern)(number_of_equal_signs));
+        match self.regexes.get(number_of_equal_signs) {
+            Some(cell) => Cow::Borrowed(cell.get_or_init(make)),
+            None => Cow::Owned(make()),
+        }
+    }
 }
 
 impl Parser<'_> {
-    pub fn new(text: String, schemas: &CommandSchemas) -> Parser<'_> {
+    pub fn new<'a>(text: &str, schemas: &'a CommandSchemas) -> Parser<'a> {
         let line_offsets = text
-            .chars()
+            .bytes()
             .enumerate()
-            .filter(|(_, c)| *c == '\n')
+            .filter(|(_, c)| *c == b'\n')
             .map(|(i, _)| i)
             .collect::<Vec<_>>();
         Parser {
-            text,
+            text: Arc::from(text),
             line_offsets,
-            blocks: schemas.prepare_blocks(),
             schemas,
         }
     }
 
+    fn span(&self, range: Range<usize>) -> Span {
+        Span::new(&self.text, range)
+    }
+
     fn line(&self, offset: usize) -> usize {
         self.line_offsets
-            .iter()
-            .take_while(|&line_offset| *line_offset < offset)
-            .count()
+            .partition_point(|&line_offset| line_offset < offset)
     }
 
-    fn column(&self, offset: usize) -> usize {
-        match self.text[..offset].rfind('\n') {
-            None => offset + 1,
-            Some(value) => offset - value,
+    fn column(&self, line: usize, offset: usize) -> usize {
+        match line {
+            0 => offset + 1,
+            line => offset - self.line_offsets[line - 1],
         }
     }
 
@@ -119,7 +132,7 @@ impl Parser<'_> {
         let column = if line == 0 {
             offset
         } else {
-            self.column(offset)
+            self.column(line, offset)
         };
         let faulty_line = self.text.lines().nth(line).unwrap_or("");
         let explanation = format!("{}\n{}^\n", faulty_line, " ".repeat(column));
@@ -148,9 +161,31 @@ impl Parser<'_> {
     }
 
     fn position(&self, offset: usize) -> Position {
+        let line = self.line(offset);
         Position {
-            line: self.line(offset) + 1,
-            column: self.column(offset),
+            line: line + 1,
+            column: self.column(line, offset),
+        }
+    }
+
+    fn bracket(&self, offset: usize) -> Result<Option<(usize, Range<usize>)>, Error> {
+        static RE_START: LazyLock<Regex> = LazyLock::new(|| regex(r"^\[=*\["));
+        static BRACKET_ARGUMENTS: BracketRegexes = BracketRegexes::new(bracket_argument_pattern);
+        let Some(matched_left_bracket) = RE_START.find(&self.text[offset..]) else {
+            return Ok(None);
+        };
+
+        let bracket_width = matched_left_bracket.len() - 2;
+        let offset = offset + bracket_width + 2;
+        match BRACKET_ARGUMENTS
+            .get(bracket_width)
+            .find(&self.text[offset..])
+        {
+            None => Err(self.unbalanced_brackets(offset)),
+            Some(value) => Ok(Some((
+                bracket_width,
+                offset..offset + value.len() - bracket_width - 2,
+            ))),
         }
     }
 
@@ -159,41 +194,31 @@ impl Parser<'_> {
         offset: usize,
         compute_position: bool,
     ) -> Result<Option<(Argument, usize)>, Error> {
-        static RE_START: LazyLock<Regex> = LazyLock::new(|| regex(r"^\[=*\["));
-        match RE_START.find(&self.text[offset..]) {
-            None => Ok(None),
-            Some(matched_left_bracket) => {
-                let bracket_width = matched_left_bracket.len() - 2;
-                let re_pattern = bracket_argument_pattern(bracket_width);
-                let re = regex(re_pattern.as_str());
-                let offset = offset + bracket_width + 2;
-                match re.find(&self.text[offset..]) {
-                    None => Err(self.unbalanced_brackets(offset)),
-                    Some(value) => Ok(Some((
-                        Argument::Bracket(BracketArgument {
-                            bracket_width,
-                            value: value.as_str()[..value.len() - bracket_width - 2].to_string(),
-                            position: {
-                                if compute_position {
-                                    Some(self.position(offset))
-                                } else {
-                                    None
-                                }
-                            },
-                        }),
-                        self.skip_space(offset + value.len()),
-                    ))),
-                }
-            }
-        }
+        Ok(self.bracket(offset)?.map(|(bracket_width, value)| {
+            let end = value.end + bracket_width + 2;
+            (
+                Argument::Bracket(BracketArgument {
+                    bracket_width,
+                    position: {
+                        if compute_position {
+                            Some(self.position(value.start))
+                        } else {
+                            None
+                        }
+                    },
+                    value: self.span(value),
+                }),
+                self.skip_space(end),
+            )
+        }))
     }
 
-    fn raw_terminal(&self, re: &regex::Regex, offset: usize) -> Option<(String, usize)> {
+    fn raw_terminal(&self, re: &regex::Regex, offset: usize) -> Option<(Span, usize)> {
         match re.captures(&self.text[offset..]) {
             None => None,
             Some(captures) => captures.get(1).map(|matched| {
                 (
-                    matched.as_str().to_string(),
+                    self.span(offset + matched.start()..offset + matched.end()),
                     offset + captures.get_match().len(),
                 )
             }),
@@ -231,7 +256,7 @@ impl Parser<'_> {
         }
     }
 
-    fn newline(&self, offset: usize) -> Option<(String, usize)> {
+    fn newline(&self, offset: usize) -> Option<(Span, usize)> {
         let mut result = offset;
         while self.text[result..].starts_with('\n') {
             result += 1;
@@ -241,21 +266,12 @@ impl Parser<'_> {
             return None;
         }
 
-        let s = self.text[offset..result].to_string();
-        Some((s, self.skip_space(result)))
-    }
-
-    fn element_t(
-        &self,
-        command: &BlockCommand,
-        offset: usize,
-    ) -> Result<Option<(Command, usize)>, Error> {
-        self.command_element_t(&command.re, offset)
+        Some((self.span(offset..result), self.skip_space(result)))
     }
 
     fn block_body(
         &self,
-        end_command: &BlockCommand,
+        end_command: &str,
         mut offset: usize,
     ) -> Result<(Vec<FileElement>, Option<Command>, usize), Error> {
         if let Some((_, new_offset)) = self.newline_or_gap(offset) {
@@ -265,7 +281,9 @@ impl Parser<'_> {
         let mut result: Vec<FileElement> = vec![];
         let mut last_newline_or_gap: Option<FileElement> = None;
         loop {
-            if let Some((end_command, offset)) = self.element_t(end_command, offset)? {
+            if let Some((end_command, offset)) =
+                self.command_element_t(Some(end_command), offset)?
+            {
                 return Ok((result, Some(end_command), offset));
             }
 
@@ -305,7 +323,7 @@ impl Parser<'_> {
     fn block_t(
         &self,
         start_node: &Command,
-        end_command: &BlockCommand,
+        end_command: &str,
         offset: usize,
     ) -> Result<(FileElement, usize), Error> {
         let (body, end_command, offset) = self.block_body(end_command, offset)?;
@@ -324,11 +342,7 @@ impl Parser<'_> {
 
     fn block(&self, start_node: Command, offset: usize) -> Result<(FileElement, usize), Error> {
         let start_node_name = start_node.command_name().to_lowercase();
-        if let Some((_, block_end)) = self
-            .blocks
-            .iter()
-            .find(|(block_start, _)| block_start.as_str() == start_node_name)
-        {
+        if let Some(block_end) = self.schemas.block_end(&start_node_name) {
             return self.block_t(&start_node, block_end, offset);
         }
 
@@ -393,10 +407,7 @@ impl Parser<'_> {
             },
             Some(matched) => Ok(Some((
                 Argument::Quoted {
-                    value: {
-                        let result = matched.as_str();
-                        result[1..result.len() - 1].to_string()
-                    },
+                    value: self.span(offset + 1..offset + matched.len() - 1),
                     position: {
                         if compute_position {
                             Some(self.position(offset))
@@ -419,7 +430,7 @@ impl Parser<'_> {
         RE.find(&self.text[offset..]).map(|matched| {
             (
                 Argument::Unquoted {
-                    value: matched.as_str().to_string(),
+                    value: self.span(offset..offset + matched.len()),
                     position: {
                         if compute_position {
                             Some(self.position(offset))
@@ -570,26 +581,25 @@ impl Parser<'_> {
         Ok(Some((result, offset)))
     }
 
-    fn indentation(&self, offset: usize) -> String {
-        let start = match self.text[..offset].rfind('\n') {
-            Some(value) => value + 1,
-            None => 0usize,
+    fn indentation(&self, offset: usize) -> Span {
+        let start = match self.line(offset) {
+            0 => 0usize,
+            line => self.line_offsets[line - 1] + 1,
         };
-        self.text[start..offset].to_string()
+        self.span(start..offset)
     }
 
-    fn formatted_node(&self, start: usize, end: usize) -> String {
-        let value = if start >= end {
-            ""
+    fn formatted_node(&self, start: usize, end: usize) -> Span {
+        if start >= end {
+            Span::empty()
         } else {
-            &self.text[start + 1..end]
-        };
-        value.to_string()
+            self.span(start + 1..end)
+        }
     }
 
     fn create_command_invocation_node(
         &self,
-        identifier: String,
+        identifier: Span,
         arguments: ArgumentsNode,
         initial_offset: usize,
         custom_formatting_start: usize,
@@ -597,21 +607,19 @@ impl Parser<'_> {
     ) -> CommandInvocation {
         {
             {
-                if self.is_known_command(identifier.as_str()) {
+                if self.is_known_command(&identifier) {
                     CommandInvocation::KnownCommand {
                         identifier,
                         arguments,
                     }
                 } else {
-                    let line = self.line(initial_offset) + 1;
-                    let column = self.column(initial_offset);
                     CommandInvocation::CustomCommand {
                         indentation: self.indentation(initial_offset),
                         identifier,
                         arguments,
                         formatted_node: self
                             .formatted_node(custom_formatting_start, custom_formatting_end),
-                        position: Position { line, column },
+                        position: self.position(initial_offset),
                     }
                 }
             }
@@ -620,11 +628,17 @@ impl Parser<'_> {
 
     fn command_invocation_t(
         &self,
-        re: &regex::Regex,
+        expected: Option<&str>,
         offset: usize,
     ) -> Result<Option<(CommandInvocation, usize)>, Error> {
+        static RE: LazyLock<Regex> = LazyLock::new(|| regex(IDENTIFIER_R));
         let initial_offset = offset;
-        Ok(match self.raw_terminal(re, offset) {
+        Ok(match self.raw_terminal(&RE, offset) {
+            Some((matched_identifier, _))
+                if expected.is_some_and(|name| !matched_identifier.eq_ignore_ascii_case(name)) =>
+            {
+                None
+            }
             None => None,
             Some((matched_identifier, identifier_offset)) => {
                 match self.left_paren(identifier_offset) {
@@ -658,11 +672,11 @@ impl Parser<'_> {
 
     fn command_element_t(
         &self,
-        re: &regex::Regex,
+        expected: Option<&str>,
         offset: usize,
     ) -> Result<Option<(Command, usize)>, Error> {
         Ok(self
-            .command_invocation_t(re, offset)?
+            .command_invocation_t(expected, offset)?
             .map(|(command_invocation, offset)| {
                 let (line_comment, offset) = match self.line_comment(offset) {
                     None => (None, offset),
@@ -679,8 +693,7 @@ impl Parser<'_> {
     }
 
     fn command_element(&self, offset: usize) -> Result<Option<(Command, usize)>, Error> {
-        static RE: LazyLock<Regex> = LazyLock::new(|| regex(IDENTIFIER_R));
-        self.command_element_t(&RE, offset)
+        self.command_element_t(None, offset)
     }
 
     fn standalone_identifier(&self, offset: usize) -> Option<(FileElement, usize)> {
@@ -693,24 +706,20 @@ impl Parser<'_> {
         })
     }
 
-    fn bracket_comment(&self, mut offset: usize) -> Result<Option<(BracketComment, usize)>, Error> {
-        if let Some(new_offset) = self.pound_sign(offset) {
-            offset = new_offset;
-        } else {
+    fn bracket_comment(&self, offset: usize) -> Result<Option<(BracketComment, usize)>, Error> {
+        let Some(offset) = self.pound_sign(offset) else {
             return Ok(None);
-        }
+        };
 
-        if let Some((Argument::Bracket(arg), new_offset)) = self.bracket_argument(offset, false)? {
-            offset = new_offset;
-            return Ok(Some((
+        Ok(self.bracket(offset)?.map(|(bracket_width, value)| {
+            let end = value.end + bracket_width + 2;
+            (
                 BracketComment {
-                    value: arg.flatten(),
+                    value: self.span(offset..end),
                 },
-                offset,
-            )));
-        }
-
-        Ok(None)
+                self.skip_space(end),
+            )
+        }))
     }
 
     fn line_comment(&self, offset: usize) -> Option<(LineComment, usize)> {
@@ -719,13 +728,13 @@ impl Parser<'_> {
             match RE.find(&self.text[offset..]) {
                 None => (
                     LineComment {
-                        value: String::new(),
+                        value: Span::empty(),
                     },
                     offset,
                 ),
                 Some(content) => (
                     LineComment {
-                        value: content.as_str().to_string(),
+                        value: self.span(offset..offset + content.len()),
                     },
                     offset + content.len(),
                 ),
@@ -789,15 +798,11 @@ impl Parser<'_> {
             None => None,
             Some(captures) => match captures.get(2) {
                 None => Some((
-                    FileElement::NewlineOrGap {
-                        value: "\n".to_string(),
-                    },
+                    FileElement::NewlineOrGap { value: "\n" },
                     offset + captures.get_match().len(),
                 )),
                 Some(_) => Some((
-                    FileElement::NewlineOrGap {
-                        value: "\n\n".to_string(),
-                    },
+                    FileElement::NewlineOrGap { value: "\n\n" },
                     offset + captures.get_match().len(),
                 )),
             },
@@ -859,33 +864,6 @@ impl Parser<'_> {
     }
 }
 
-fn block_command(name: &str) -> BlockCommand {
-    let pattern = format!("(?i)^({name})[ \t]*");
-    let re = regex(pattern.as_str());
-    BlockCommand { re }
-}
-
-impl CommandSchemas {
-    pub fn prepare_blocks(&self) -> Vec<(String, BlockCommand)> {
-        self.definition_schemas
-            .values()
-            .chain(self.extension_schemas.values())
-            .chain(builtin_schemas().values())
-            .filter_map(|schema| match schema {
-                CommandSchema {
-                    canonical_name: Some(canonical_name),
-                    block_end: Some(block_end),
-                    ..
-                } => Some((
-                    canonical_name.trim().to_lowercase(),
-                    block_command(block_end),
-                )),
-                _ => None,
-            })
-            .collect()
-    }
-}
-
 impl From<Error> for PyErr {
     fn from(error: Error) -> Self {
         let description = match error.error_type {
@@ -1,15 +1,19 @@
 use crate::args::Mode;
-use crate::cache::Cache;
+use crate::cache::{
+    file_entry, output_key, Cache, CacheUpdate, CachedOutput, FileFingerprint, FileToFormat,
+};
 use crate::diff::print_diff;
 use crate::formatter::Formatter;
-use crate::utils::{normalize_newlines, read_code};
-use crate::warning_sink::warn;
+use crate::utils::{normalize_newlines, read_code, thread_pool};
 use crate::{configuration::Configuration, formatter::UnknownCommandsUsed};
 use pyo3::{PyResult, Python};
 use rayon::iter::{IntoParallelIterator, ParallelIterator};
 use std::fmt::Write;
 use std::io::Write as IoWrite;
 use std::path::{Path, PathBuf};
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::mpsc::{channel, Sender};
+use std::sync::Arc;
 
 pub fn is_stdin(path: &Path) -> bool {
     path.to_str().is_some_and(|value| value == "-")
@@ -60,6 +64,18 @@ fn unknown_command_warnings(unknown_commands: UnknownCommandsUsed, path: &str) -
         .collect()
 }
 
+pub fn warnings_about_unknown_commands(
+    configuration: &Configuration,
+    path: &Path,
+    unknown_commands_used: UnknownCommandsUsed,
+) -> Vec<String> {
+    if configuration.outcome.warn_about_unknown_commands {
+        unknown_command_warnings(unknown_commands_used, fromfile(path))
+    } else {
+        Vec::new()
+    }
+}
+
 pub fn fromfile(path: &Path) -> &str {
     if is_stdin(path) {
         "<stdin>"
@@ -76,7 +92,27 @@ pub fn tofile(path: &Path) -> &str {
     }
 }
 
-type TaskResult = (usize, Vec<String>);
+pub type TaskResult = (usize, Vec<String>);
+
+#[derive(Clone, Copy, Default)]
+pub struct SanityCheckReport {
+    pub reformatted: usize,
+    pub verified: usize,
+}
+
+impl SanityCheckReport {
+    fn new(before: &str, after: &str, verified: bool) -> Self {
+        Self {
+            reformatted: usize::from(before != after),
+            verified: usize::from(verified),
+        }
+    }
+
+    pub fn add(&mut self, other: Self) {
+        self.reformatted += other.reformatted;
+        self.verified += other.verified;
+    }
+}
 pub const SUCCESS: usize = 0;
 pub const FAIL: usize = 1;
 const INTERNAL_ERROR: usize = 123;
@@ -86,22 +122,77 @@ pub fn to_stdout(s: &str) -> PyResult<()> {
     Ok(std::io::stdout().flush()?)
 }
 
+struct OutputCache<'a, 's> {
+    cache: &'a Cache,
+    configuration_summary: &'s str,
+    updates: &'a Sender<(&'s str, CacheUpdate)>,
+    hits: &'a AtomicUsize,
+}
+
+impl OutputCache<'_, '_> {
+    fn format(
+        &self,
+        formatter: &Formatter,
+        code: &str,
+    ) -> PyResult<(String, UnknownCommandsUsed, bool)> {
+        let key = output_key(code);
+        if let Some(output) = self.cache.get_output(self.configuration_summary, &key) {
+            self.hits.fetch_add(1, Ordering::Relaxed);
+            let _ = self
+                .updates
+                .send((self.configuration_summary, CacheUpdate::UsedOutput(key)));
+            return Ok(output.restore(code));
+        }
+
+        let (formatted_code, unknown_commands_used, verified) =
+            formatter.format_file(code.to_string())?;
+        let output = CachedOutput::new(code, &formatted_code, &unknown_commands_used, verified);
+        let _ = self
+            .updates
+            .send((self.configuration_summary, CacheUpdate::Output(key, output)));
+        Ok((formatted_code, unknown_commands_used, verified))
+    }
+}
+
+type FormattedFile = (
+    String,
+    String,
+    String,
+    UnknownCommandsUsed,
+    bool,
+    Option<FileFingerprint>,
+);
+
 fn format_file(
     path: &Path,
+    known_fingerprint: Option<&FileFingerprint>,
     formatter: Option<&Formatter>,
-) -> PyResult<(String, String, String, Vec<String>)> {
+    output_cache: Option<&OutputCache>,
+) -> PyResult<FormattedFile> {
     const BOM: char = '\u{feff}';
 
+    let stamp = if output_cache.is_some() && !is_stdin(path) {
+        file_entry(path)
+            .ok()
+            .map(|(_, size, modification_time)| (size, modification_time))
+    } else {
+        None
+    };
     let code = read_code(path)?;
+    let fingerprint =
+        stamp.map(|stamp| FileFingerprint::of_content(stamp, &code, known_fingerprint));
     let (preserve_bom, code) = match code.strip_prefix(BOM) {
         None => (false, code.as_str()),
         Some(code) => (true, code),
     };
     let newlines_style = if code.contains("\r\n") { "\r\n" } else { "\n" };
     let code = normalize_newlines(code);
-    let (formatted_code, unknown_commands_used) = match formatter {
-        None => (code.clone(), vec![]),
-        Some(formatter) => formatter.format(code.clone())?,
+    let (formatted_code, unknown_commands_used, verified) = match formatter {
+        None => (code.clone(), vec![], false),
+        Some(formatter) => match output_cache {
+            None => formatter.format_file(code.clone())?,
+            Some(output_cache) => output_cache.format(formatter, &code)?,
+        },
     };
 
     let formatted_code = if preserve_bom {
@@ -110,12 +201,13 @@ fn format_file(
         formatted_code
     };
 
-    let path = fromfile(path);
     Ok((
         code,
         formatted_code,
         newlines_style.to_string(),
-        unknown_command_warnings(unknown_commands_used, path),
+        unknown_commands_used,
+        verified,
+        fingerprint,
     ))
 }
 
@@ -184,18 +276,26 @@ fn do_nothing() -> TaskResult {
     (SUCCESS, Vec::new())
 }
 
+type TaskOutcome = (
+    TaskResult,
+    SanityCheckReport,
+    UnknownCommandsUsed,
+    Option<FileFingerprint>,
+);
+
 fn run_task_impl(
     configuration: &Configuration,
     mode: &Mode,
     path: &Path,
+    known_fingerprint: Option<&FileFingerprint>,
     formatter: Option<&Formatter>,
-) -> PyResult<(usize, Vec<String>)> {
-    let (before, after, newlines_style, unknown_command_warnings) = format_file(path, formatter)?;
-    let warnings = if configuration.outcome.warn_about_unknown_commands {
-        unknown_command_warnings
-    } else {
-        Vec::new()
-    };
+    output_cache: Option<&OutputCache>,
+) -> PyResult<TaskOutcome> {
+    let (before, after, newlines_style, unknown_commands_used, verified, fingerprint) =
+        format_file(path, known_fingerprint, formatter, output_cache)?;
+    let report = SanityCheckReport::new(&before, &after, verified);
+    let warnings =
+        warnings_about_unknown_commands(configuration, path, unknown_commands_used.clone());
 
     let (code, warnings) = if formatter.is_none() {
         match mode {
@@ -219,16 +319,31 @@ fn run_task_impl(
         }
     };
 
-    Ok((code, warnings))
+    let fingerprint = match mode {
+        Mode::RewriteInPlace if fingerprint.is_some() && before != after => {
+            FileFingerprint::new(path)
+        }
+        _ => fingerprint,
+    };
+    Ok(((code, warnings), report, unknown_commands_used, fingerprint))
 }
 
 fn run_task(
     configuration: &Configuration,
     mode: &Mode,
     path: &Path,
+    known_fingerprint: Option<&FileFingerprint>,
     formatter: Option<&Formatter>,
-) -> (usize, Vec<String>) {
-    match run_task_impl(configuration, mode, path, formatter) {
+    output_cache: Option<&OutputCache>,
+) -> TaskOutcome {
+    match run_task_impl(
+        configuration,
+        mode,
+        path,
+        known_fingerprint,
+        formatter,
+        output_cache,
+    ) {
         Ok(ok) => ok,
         Err(err) => {
             let warning = format!(
@@ -236,7 +351,12 @@ fn run_task(
                 path.to_str().unwrap_or("---"),
                 Python::attach(|py| err.value(py).to_string())
             );
-            (INTERNAL_ERROR, vec![warning])
+            (
+                (INTERNAL_ERROR, vec![warning]),
+                SanityCheckReport::default(),
+                UnknownCommandsUsed::new(),
+                None,
+            )
         }
     }
 }
@@ -244,81 +364,140 @@ fn run_task(
 fn handle_file_to_format(
     configuration: &Configuration,
     mode: &Mode,
-    path: PathBuf,
+    (path, known_fingerprint): FileToFormat,
     formatter: Option<&Formatter>,
-) -> (usize, Option<PathBuf>, Vec<String>) {
-    let (code, warnings) = run_task(configuration, mode, &path, formatter);
-
-    let has_warnings = if configuration.outcome.warn_about_unknown_commands {
-        !warnings.is_empty()
-    } else {
-        false
-    };
-
-    let file_to_cache = if (code == SUCCESS) && (!is_stdin(&path)) && (!has_warnings) {
-        Some(path)
-    } else {
-        None
+    output_cache: Option<&OutputCache>,
+) -> (usize, Option<CacheUpdate>, Vec<String>, SanityCheckReport) {
+    let ((code, warnings), report, unknown_commands_used, fingerprint) = run_task(
+        configuration,
+        mode,
+        &path,
+        known_fingerprint.as_ref(),
+        formatter,
+        output_cache,
+    );
+
+    let is_cacheable_mode = matches!(
+        mode,
+        Mode::CheckFormatting | Mode::CheckFormattingAndShowDiff | Mode::RewriteInPlace
+    );
+    let positions_match_file = unknown_commands_used.is_empty() || report.reformatted == 0;
+    let file_to_cache = match fingerprint {
+        Some(fingerprint) if is_cacheable_mode && (code == SUCCESS) && positions_match_file => {
+            Some(CacheUpdate::FormattedFile(
+                path,
+                fingerprint,
+                unknown_commands_used,
+            ))
+        }
+        _ => None,
     };
 
-    (code, file_to_cache, warnings)
+    (code, file_to_cache, warnings, report)
 }
 
 pub fn handle_already_formatted_files(
     configuration: &Configuration,
     mode: &Mode,
-    files: &[PathBuf],
-) -> Vec<usize> {
+    files: Vec<(PathBuf, UnknownCommandsUsed)>,
+) -> Vec<TaskResult> {
     files
-        .iter()
-        .map(|f| {
-            let (code, warnings) = run_task(configuration, mode, f, None);
-            for warning in warnings {
-                warn(warning);
-            }
-            code
+        .into_iter()
+        .map(|(f, unknown_commands_used)| {
+            let (code, mut warnings) = if matches!(mode, Mode::ForwardToStdout) {
+                let (result, _, _, _) = run_task(configuration, mode, &f, None, None, None);
+                result
+            } else {
+                do_nothing()
+            };
+            warnings.extend(warnings_about_unknown_commands(
+                configuration,
+                &f,
+                unknown_commands_used,
+            ));
+            (code, warnings)
         })
         .collect()
 }
 
+pub struct Job {
+    pub configuration: Configuration,
+    pub configuration_summary: String,
+    pub formatter: Arc<Formatter>,
+    pub files: Vec<FileToFormat>,
+}
+
+pub type FileResult = (usize, Vec<String>, SanityCheckReport);
+
+pub struct JobResults {
+    pub results: Vec<FileResult>,
+    pub output_cache_hits: usize,
+}
+
 pub fn handle_files_to_format(
     py: Python,
-    configuration: &Configuration,
     mode: &Mode,
-    cache: &mut Cache,
-    files: Vec<PathBuf>,
-) -> PyResult<Vec<usize>> {
-    let configuration_summary = configuration.outcome.summarize()?;
-    let formatter = Formatter::new(py, configuration.clone())?;
-    let formatter = Some(&formatter);
-
-    let mut files_to_cache = Vec::<PathBuf>::new();
-    let result: Vec<usize> = py
-        .detach(|| {
-            files
-                .into_par_iter()
-                .panic_fuse()
-                .map(|f| {
-                    Python::attach(|py| py.check_signals().unwrap());
-
-                    handle_file_to_format(configuration, mode, f, formatter)
-                })
-                .collect::<Vec<_>>()
+    cache: &Cache,
+    jobs: &[Job],
+    number_of_workers: usize,
+) -> PyResult<Vec<JobResults>> {
+    let pool = thread_pool(number_of_workers)?;
+    let tasks = jobs
+        .iter()
+        .enumerate()
+        .flat_map(|(index, job)| job.files.iter().map(move |file| (index, file)))
+        .collect::<Vec<_>>();
+    let output_cache_hits = jobs.iter().map(|_| AtomicUsize::new(0)).collect::<Vec<_>>();
+
+    let (cache_updates, received_cache_updates) = channel::<(&str, CacheUpdate)>();
+    let results = py.detach(|| {
+        std::thread::scope(|scope| {
+            scope.spawn(move || {
+                cache.store_in_batches(&received_cache_updates);
+            });
+
+            let cache_updates = cache_updates;
+            let is_cache_enabled = cache.is_enabled();
+            pool.install(|| {
+                tasks
+                    .into_par_iter()
+                    .panic_fuse()
+                    .map(|(index, file)| {
+                        Python::attach(|py| py.check_signals().unwrap());
+
+                        let job = &jobs[index];
+                        let output_cache = is_cache_enabled.then_some(OutputCache {
+                            cache,
+                            configuration_summary: &job.configuration_summary,
+                            updates: &cache_updates,
+                            hits: &output_cache_hits[index],
+                        });
+                        let (code, file_to_cache, warnings, report) = handle_file_to_format(
+                            &job.configuration,
+                            mode,
+                            file.clone(),
+                            Some(job.formatter.as_ref()),
+                            output_cache.as_ref(),
+                        );
+                        if let Some(update) = file_to_cache {
+                            let _ = cache_updates.send((&job.configuration_summary, update));
+                        }
+                        (index, (code, warnings, report))
+                    })
+                    .collect::<Vec<_>>()
+            })
         })
-        .into_iter()
-        .map(|(code, file_to_cache, warnings)| {
-            if let Some(f) = file_to_cache {
-                files_to_cache.push(f);
-            }
-
-            for warning in warnings {
-                warn(warning);
-            }
+    });
 
-            code
+    let mut grouped = output_cache_hits
+        .into_iter()
+        .map(|hits| JobResults {
+            results: Vec::new(),
+            output_cache_hits: hits.into_inner(),
         })
-        .collect();
-
-    cache.store_files(&configuration_summary, &files_to_cache);
-    Ok(result)
+        .collect::<Vec<_>>();
+    for (index, result) in results {
+        grouped[index].results.push(result);
+    }
+    Ok(grouped)
 }
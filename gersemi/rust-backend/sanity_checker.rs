@@ -1,8 +1,12 @@
 use crate::node::{
     Argument, ArgumentsAtom, ArgumentsNode, BracketArgument, Command, CommandInvocation,
-    CommentedArgumentComment, FileElement, LineComment, Start,
+    CommentedArgumentComment, FileElement, LineComment, Span, Start,
 };
+use std::cmp::Ordering;
 use std::collections::BTreeSet;
+use std::hash::{Hash, Hasher};
+use std::iter::zip;
+use xxhash_rust::xxh3::Xxh3Default;
 
 fn simplify_argument(node: Argument) -> Argument {
     match node {
@@ -36,7 +40,7 @@ fn simplify_commented_argument_comment(node: CommentedArgumentComment) -> Commen
         CommentedArgumentComment::LineComment { comment, .. } => {
             CommentedArgumentComment::LineComment {
                 comment: simplify_line_comment(comment),
-                newline: String::new(),
+                newline: Span::empty(),
             }
         }
     }
@@ -75,7 +79,7 @@ fn simplify_command_invocation(node: CommandInvocation) -> CommandInvocation {
             arguments,
             ..
         } => CommandInvocation::KnownCommand {
-            identifier: identifier.to_lowercase(),
+            identifier: Span::from(identifier.to_lowercase()),
             arguments: simplify_arguments(arguments),
         },
     }
@@ -100,7 +104,7 @@ fn simplify_command(node: Command) -> Command {
 fn simplify_line_comment(node: LineComment) -> LineComment {
     let LineComment { value } = node;
     LineComment {
-        value: value.trim_end().to_string(),
+        value: value.without_trailing_whitespace(),
     }
 }
 
@@ -140,3 +144,75 @@ pub fn check_equivalence(before: Start, after: Start) -> bool {
 
     before == after
 }
+
+pub struct ElementFingerprint {
+    hash: u64,
+}
+
+impl ElementFingerprint {
+    fn new(node: &FileElement) -> Self {
+        let mut hasher = Xxh3Default::new();
+        node.hash(&mut hasher);
+        Self {
+            hash: hasher.finish(),
+        }
+    }
+}
+
+pub enum Difference {
+    Before(usize),
+    After(usize),
+}
+
+fn visit_elements(nodes: &[FileElement], visit: &mut impl FnMut(&FileElement)) {
+    for node in nodes {
+        if let FileElement::Block { start, body, end } = node {
+            visit(&FileElement::Command(simplify_command(start.clone())));
+            visit_elements(body, visit);
+            visit(&FileElement::Command(simplify_command(end.clone())));
+        } else {
+            for element in simplify_file_elements(vec![node.clone()]) {
+                visit(&element);
+            }
+        }
+    }
+}
+
+pub fn fingerprint(node: &Start) -> Vec<ElementFingerprint> {
+    let mut result = Vec::new();
+    visit_elements(&node.children, &mut |element| {
+        result.push(ElementFingerprint::new(element));
+    });
+    result
+}
+
+pub fn first_difference(
+    before: &[ElementFingerprint],
+    after: &[ElementFingerprint],
+) -> Option<Difference> {
+    if let Some(index) = zip(before, after).position(|(lhs, rhs)| lhs.hash != rhs.hash) {
+        return Some(Difference::Before(index));
+    }
+
+    match before.len().cmp(&after.len()) {
+        Ordering::Equal => None,
+        Ordering::Greater => Some(Difference::Before(after.len())),
+        Ordering::Less => Some(Difference::After(before.len())),
+    }
+}
+
+pub fn describe_element(node: &Start, index: usize) -> String {
+    let mut description = None;
+    let mut current = 0;
+    visit_elements(&node.children, &mut |element| {
+        if current == index {
+            description = Some(match element {
+                FileElement::Command(command) => format!("{} command", command.command_name()),
+                FileElement::StandaloneIdentifier { value } => format!("{value} identifier"),
+                _ => "comment".to_string(),
+            });
+        }
+        current += 1;
+    });
+    description.unwrap_or_else(|| "end of file".to_string())
+}
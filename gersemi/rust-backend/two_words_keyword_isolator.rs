@@ -11,6 +11,12 @@ pub struct TwoWordKeywordMatcher {
     second: SecondKeyword,
 }
 
+impl TwoWordKeywordMatcher {
+    pub fn new(first: String, second: SecondKeyword) -> Self {
+        Self { first, second }
+    }
+}
+
 impl FromPyObject<'_, '_> for TwoWordKeywordMatcher {
     type Error = PyErr;
 
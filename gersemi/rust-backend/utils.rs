@@ -1,4 +1,4 @@
-use crate::argument_schema::CommandSchemaMapping;
+use crate::argument_schema::{CommandSchemaMapping, SchemaDecoder};
 use crate::configuration::{ControlConfiguration, Extension, OutcomeConfiguration};
 use crate::runner::is_stdin;
 use ignore::types::{Types, TypesBuilder};
@@ -6,12 +6,19 @@ use ignore::WalkBuilder;
 use pyo3::exceptions::PyRuntimeError;
 use pyo3::types::{PyAnyMethods, PyModule};
 use pyo3::{Py, PyAny, PyResult, Python};
+use rayon::{ThreadPool, ThreadPoolBuilder};
+use std::collections::HashMap;
 use std::io::{stdin, Read};
 use std::path::{Path, PathBuf};
-use std::sync::LazyLock;
+use std::sync::{Arc, LazyLock, Mutex};
 
 pub fn builtin_schemas() -> &'static CommandSchemaMapping {
+    static SNAPSHOT: &str = include_str!(concat!(env!("OUT_DIR"), "/builtin_schemas.txt"));
     static RESULT: LazyLock<CommandSchemaMapping> = LazyLock::new(|| {
+        if let Some(schemas) = SchemaDecoder::new(SNAPSHOT).command_schemas() {
+            return schemas;
+        }
+
         Python::attach(|py| {
             PyModule::import(py, "gersemi.builtin_commands")?
                 .getattr("_builtin_commands")?
@@ -22,6 +29,26 @@ pub fn builtin_schemas() -> &'static CommandSchemaMapping {
     &RESULT
 }
 
+pub fn thread_pool(number_of_workers: usize) -> PyResult<Arc<ThreadPool>> {
+    static POOLS: LazyLock<Mutex<HashMap<usize, Arc<ThreadPool>>>> =
+        LazyLock::new(|| Mutex::new(HashMap::new()));
+
+    let fail = || PyRuntimeError::new_err("Failed to create thread pool");
+    let mut pools = POOLS.lock().map_err(|_| fail())?;
+    if let Some(pool) = pools.get(&number_of_workers) {
+        return Ok(pool.clone());
+    }
+
+    let pool = Arc::new(
+        ThreadPoolBuilder::new()
+            .num_threads(number_of_workers)
+            .build()
+            .map_err(|_| fail())?,
+    );
+    pools.insert(number_of_workers, pool.clone());
+    Ok(pool)
+}
+
 pub fn read_code(path: &Path) -> PyResult<String> {
     if is_stdin(path) {
         let mut buf = String::new();
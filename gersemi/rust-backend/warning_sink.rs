@@ -55,5 +55,20 @@ pub fn flush_warnings() -> bool {
 }
 
 pub fn register_warning_sink(sink: WarningSink) {
-    let _ = WARNING_SINK.set(Mutex::new(sink));
+    if let Err(sink) = WARNING_SINK.set(Mutex::new(sink)) {
+        if let (Some(current), Ok(sink)) = (WARNING_SINK.get(), sink.into_inner()) {
+            if let Ok(mut current) = current.lock() {
+                *current = sink;
+            }
+        }
+    }
+}
+
+pub fn take_warnings() -> Vec<String> {
+    if let Some(sink) = WARNING_SINK.get() {
+        if let Ok(mut sink) = sink.lock() {
+            return std::mem::take(&mut sink.records);
+        }
+    }
+    Vec::new()
 }
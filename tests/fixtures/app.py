@@ -79,9 +79,10 @@ HERE = Path(__file__).parent
 
 
 class App:
-    def __init__(self, cache, fallback_cwd):
+    def __init__(self, cache, fallback_cwd, executable="gersemi"):
         self.cache = cache
         self.fallback_cwd = fallback_cwd
+        self.executable = executable
 
     def __call__(self, *args, **kwargs):
         if "cwd" not in kwargs:
@@ -91,7 +92,7 @@ class App:
 
         return outcome(
             subprocess.run(
-                ["gersemi", "--cache-dir", str(self.cache), *map(str, args)],
+                [self.executable, "--cache-dir", str(self.cache), *map(str, args)],
                 check=False,
                 encoding="utf8",
                 text=True,
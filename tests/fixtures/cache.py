@@ -36,10 +36,90 @@ class Cache:
         assert len(self._get_tables()) == 0
 
     def assert_that_has_initialized_tables(self):
-        assert self._get_tables() == ["files", "formatted"]
+        assert self._get_tables() == [
+            "paths",
+            "summaries",
+            "formatted",
+            "contents",
+            "outputs",
+            "last_run",
+        ]
+
+    def get_schema_version(self):
+        ((version,),) = self._execute("PRAGMA user_version")
+        return version
+
+    def create_version_1_tables(self, files, formatted):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(
+            """
+            CREATE TABLE files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                modification_time INTEGER NOT NULL
+            );
+            CREATE TABLE formatted (
+                path TEXT PRIMARY KEY,
+                configuration_summary TEXT NOT NULL,
+                FOREIGN KEY (path) REFERENCES files (path)
+            );
+            """
+        )
+        connection.executemany("INSERT INTO files VALUES (?, ?, ?)", files)
+        connection.executemany("INSERT INTO formatted VALUES (?, ?)", formatted)
+        connection.commit()
+        connection.close()
 
     def get_files(self):
-        return list(self._execute("SELECT * FROM files"))
+        return list(
+            self._execute(
+                """
+                SELECT path, size, modification_time
+                FROM paths
+                ORDER BY path
+                """
+            )
+        )
 
     def get_formatted(self):
-        return list(self._execute("SELECT * FROM formatted"))
+        return list(
+            self._execute(
+                """
+                SELECT paths.path, summaries.configuration_summary
+                FROM formatted
+                JOIN paths ON paths.id = formatted.path_id
+                JOIN summaries ON summaries.id = formatted.summary_id
+                ORDER BY paths.path, summaries.configuration_summary
+                """
+            )
+        )
+
+    def get_contents(self):
+        return list(
+            self._execute(
+                """
+                SELECT contents.hash, summaries.configuration_summary
+                FROM contents
+                JOIN summaries ON summaries.id = contents.summary_id
+                ORDER BY contents.hash, summaries.configuration_summary
+                """
+            )
+        )
+
+    def get_outputs(self):
+        return list(
+            self._execute(
+                """
+                SELECT outputs.hash, summaries.configuration_summary
+                FROM outputs
+                JOIN summaries ON summaries.id = outputs.summary_id
+                ORDER BY outputs.hash, summaries.configuration_summary
+                """
+            )
+        )
+
+    def set_formatted_outputs(self, formatted_code):
+        connection = sqlite3.connect(self.path)
+        connection.execute("UPDATE outputs SET formatted_code = ?", (formatted_code,))
+        connection.commit()
+        connection.close()
@@ -43,6 +43,8 @@ class CustomizedGenerateJsonSchema(GenerateJsonSchema):
         result["$defs"]["Tabs"] = get_representation(Tabs)
 
         result["properties"]["indent"]["anyOf"][0]["minimum"] = 1
+        result["properties"]["sanity_check_sampling"]["minimum"] = 0
+        result["properties"]["sanity_check_sampling"]["maximum"] = 100
 
         return result
 
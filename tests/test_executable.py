@@ -1,15 +1,25 @@
 # pylint: disable=too-many-lines
 import codecs
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack, contextmanager
 import filecmp
 from functools import partial
 from pathlib import Path
+import shutil
 import sqlite3
 from stat import S_IREAD, S_IRGRP, S_IROTH
 import pytest
 import yaml
 from gersemi.return_codes import FAIL, SUCCESS
-from tests.fixtures.app import ExpectedOutcome, fail, match_not, reformatted, success
+from tests.fixtures.app import (
+    App,
+    ExpectedOutcome,
+    fail,
+    match_not,
+    reformatted,
+    success,
+)
+from tests.fixtures.cache import Cache
 
 
 def compare_directories(left, right):
@@ -133,6 +143,14 @@ def test_safe_check_not_formatted_input_from_stdin(app):
     assert app("--check", "--safe", "-", input=inp) == fail()
 
 
+def test_sampled_sanity_checks_are_reported(app):
+    inp = """set(FOO BAR)"""  # missing newline at the end
+    assert app("--safe", "--sanity-check-sampling", "0", "-", input=inp) == success(
+        stdout="set(FOO BAR)\n",
+        stderr="Sanity checks verified 0 of 1 reformatted files\n",
+    )
+
+
 def test_format_formatted_input_from_stdin(app):
     inp = """set(FOO BAR)
 """
@@ -631,7 +649,7 @@ def test_formatted_files_in_cache_dont_get_updated_on_subsequent_run(
     assert formatted_after_first_run == formatted_after_second_run
 
 
-def test_different_configuration_leads_to_overriding_data_stored_in_cache(
+def test_different_configuration_leads_to_storing_additional_data_in_cache(
     app, cache, testfiles
 ):
     d = testfiles / "custom_project" / "not_formatted"
@@ -648,21 +666,285 @@ def test_different_configuration_leads_to_overriding_data_stored_in_cache(
     cache.assert_that_has_initialized_tables()
     assert len(cache.get_files()) > 0
     formatted_after_second_run = cache.get_formatted()
-    assert len(formatted_after_first_run) > 0
+    assert len(formatted_after_second_run) > 0
 
-    only_paths_from_first_run = [path for (path, *_) in formatted_after_first_run]
-    only_paths_from_second_run = [path for (path, *_) in formatted_after_second_run]
+    only_paths_from_first_run = {path for (path, *_) in formatted_after_first_run}
+    only_paths_from_second_run = {path for (path, *_) in formatted_after_second_run}
 
     assert only_paths_from_first_run == only_paths_from_second_run
     assert formatted_after_first_run != formatted_after_second_run
 
 
+def test_alternating_configurations_reuse_data_stored_in_cache(app, cache, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    number_of_files = len(list(d.iterdir()))
+
+    assert app("--check", d) == success()
+    assert len(cache.get_formatted()) == number_of_files
+
+    assert app("--check", d, "--line-length", "81") == success()
+    formatted_after_second_run = cache.get_formatted()
+    assert len(formatted_after_second_run) == 2 * number_of_files
+
+    assert app("--check", d) == success()
+    assert cache.get_formatted() == formatted_after_second_run
+
+
+def test_cache_in_previous_layout_is_replaced(app, cache, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    cache.create_version_1_tables(
+        files=[("foo.cmake", 1, 2), ("bar.cmake", 3, 4)],
+        formatted=[("foo.cmake", "summary")],
+    )
+
+    assert app("--check", d) == success()
+
+    cache.assert_that_has_initialized_tables()
+    assert cache.get_schema_version() == 2
+    assert ("bar.cmake", 3, 4) not in cache.get_files()
+    assert ("foo.cmake", "summary") not in cache.get_formatted()
+    assert len(cache.get_formatted()) == len(list(d.iterdir()))
+
+
+def test_files_known_to_be_formatted_are_not_read_during_check(app, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    assert app("--check", d) == success()
+
+    unreadable = next(d.iterdir())
+    unreadable.chmod(0)
+    try:
+        assert app("--check", d) == success(stderr="")
+    finally:
+        unreadable.chmod(S_IREAD | S_IRGRP | S_IROTH)
+
+
+def test_parallel_invocations_dont_drop_cache_updates(app, cache, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    copies = [testfiles / f"copy_{index}" for index in range(8)]
+    for copy in copies:
+        shutil.copytree(d, copy)
+
+    with ThreadPoolExecutor(max_workers=len(copies)) as executor:
+        outcomes = list(executor.map(lambda copy: app("--check", copy), copies))
+
+    assert all(outcome == success(stderr="") for outcome in outcomes)
+    cached_paths = [path for (path, *_) in cache.get_files()]
+    for copy in copies:
+        assert len([path for path in cached_paths if copy.name in path]) == len(
+            list(copy.iterdir())
+        )
+
+
+def test_read_only_cache_layers_are_consulted_but_not_modified(
+    app, cache, testfiles, tmpdir
+):
+    d = testfiles / "directory_with_formatted_files"
+    number_of_files = len(list(d.iterdir()))
+    seed = Cache(Path(tmpdir.mkdir("seed")))
+    assert App(cache=seed, fallback_cwd=tmpdir)("--check", d) == success()
+    seed_files = seed.get_files()
+    seed.path.chmod(S_IREAD | S_IRGRP | S_IROTH)
+
+    moved = testfiles / "moved_directory_with_formatted_files"
+    shutil.copytree(d, moved)
+    assert app("--check", moved, "--cache-dir", seed) == success(stderr="")
+    assert seed.get_files() == seed_files
+
+    cached_paths = [path for (path, *_) in cache.get_files()]
+    assert len([path for path in cached_paths if moved.name in path]) == number_of_files
+    assert f"Last run: {number_of_files} hits" in app("--cache-stats").stdout
+
+
+def test_cache_stats_report_entries_and_last_run(app, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    number_of_files = len(list(d.iterdir()))
+
+    assert app("--check", d) == success()
+    assert app("--check", d) == success()
+
+    outcome = app("--cache-stats")
+    assert outcome == success(stderr="")
+    assert f"Files: {number_of_files}\n" in outcome.stdout
+    assert f"Files known to be formatted: {number_of_files}\n" in outcome.stdout
+    assert (
+        f"Last run: {number_of_files} hits, 0 misses (100% hit rate)\n"
+        in outcome.stdout
+    )
+    assert "Last cache validation: " in outcome.stdout
+
+
+def test_cache_prune_removes_entries_about_missing_files(app, cache, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    assert app("--check", d) == success()
+    next(d.iterdir()).unlink()
+
+    assert app("--cache-prune") == success(
+        stdout="Pruned 1 missing files and 0 stale configurations\n", stderr=""
+    )
+    assert len(cache.get_files()) == len(list(d.iterdir()))
+    assert len(cache.get_formatted()) == len(list(d.iterdir()))
+
+
+def test_cache_max_size_evicts_least_recently_used_configurations(
+    app, cache, testfiles
+):
+    d = testfiles / "directory_with_formatted_files"
+    number_of_files = len(list(d.iterdir()))
+
+    assert app("--check", d) == success()
+    assert app("--check", d, "--line-length", "81") == success()
+    assert len(cache.get_formatted()) == 2 * number_of_files
+
+    assert app("--check", d, "--cache-max-size", "0") == success()
+    formatted = cache.get_formatted()
+    assert len(formatted) == number_of_files
+    assert len({summary for (_, summary) in formatted}) == 1
+
+
+def test_cache_is_reused_for_moved_files_with_same_content(app, cache, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+
+    assert app("--check", d) == success()
+    contents_after_first_run = cache.get_contents()
+    assert len(contents_after_first_run) > 0
+
+    moved = testfiles / "moved_directory_with_formatted_files"
+    shutil.copytree(d, moved)
+    assert app("--check", moved) == success()
+
+    cached_paths = [path for (path, *_) in cache.get_files()]
+    moved_paths = [path for path in cached_paths if moved.name in path]
+    assert len(moved_paths) == len(list(moved.iterdir()))
+    assert cache.get_contents() == contents_after_first_run
+
+    project = testfiles / "custom_project" / "formatted"
+    assert app("--check", project, "--definitions", project) == success()
+    contents_with_definitions = cache.get_contents()
+
+    moved_project = testfiles / "moved_custom_project"
+    shutil.copytree(project, moved_project)
+    assert app("--check", moved_project, "--definitions", moved_project) == success()
+    assert cache.get_contents() == contents_with_definitions
+
+
+def test_content_before_rewrite_in_place_is_not_stored_as_formatted(
+    app, cache, testfiles
+):
+    not_formatted = """set(FOO
+BAR)
+"""
+    rewritten = testfiles / "rewritten.cmake"
+    rewritten.write_text(not_formatted, encoding="utf-8")
+    assert app("--in-place", rewritten) == success()
+    assert rewritten.read_text(encoding="utf-8") == "set(FOO BAR)\n"
+    contents_after_rewrite = cache.get_contents()
+
+    copy = testfiles / "copy_of_original.cmake"
+    copy.write_text(not_formatted, encoding="utf-8")
+    assert app("--check", copy) == fail()
+    assert cache.get_contents() == contents_after_rewrite
+
+
+def test_changed_definitions_invalidate_data_stored_in_cache(app, cache, testfiles):
+    d = testfiles / "custom_project" / "formatted"
+
+    assert app("--check", d, "--definitions", d) == success()
+    formatted_after_first_run = cache.get_formatted()
+    assert len(formatted_after_first_run) > 0
+
+    definition = d / "back_to_the_future.cmake"
+    with open(definition, "a", encoding="utf-8") as f:
+        f.write("# comment\n")
+
+    assert app("--check", d, "--definitions", d) == success()
+    assert cache.get_formatted() == formatted_after_first_run
+
+    content = definition.read_text(encoding="utf-8")
+    definition.write_text(
+        content.replace("set(options DELOREAN)", "set(options DELOREAN HOVERBOARD)"),
+        encoding="utf-8",
+    )
+
+    assert app("--check", d, "--definitions", d) == success()
+    formatted_after_third_run = cache.get_formatted()
+    assert len(formatted_after_third_run) > 0
+    assert formatted_after_first_run != formatted_after_third_run
+
+
+def test_moving_conflicting_definitions_keeps_data_stored_in_cache(
+    app, cache, testfiles
+):
+    d = testfiles / "custom_project" / "formatted"
+    conflicting = d / "conflicting.cmake"
+    conflicting.write_text(
+        "function(back_to_the_future first_argument)\nendfunction()\n",
+        encoding="utf-8",
+    )
+
+    assert app("--check", d, "--definitions", d) == success(stderr=match_not(""))
+    formatted_after_first_run = cache.get_formatted()
+    assert len(formatted_after_first_run) > 0
+
+    content = conflicting.read_text(encoding="utf-8")
+    conflicting.write_text("# comment\n" + content, encoding="utf-8")
+
+    assert app("--check", d, "--definitions", d) == success(stderr=match_not(""))
+    assert cache.get_formatted() == formatted_after_first_run
+
+
 def test_no_files_are_stored_in_cache_on_diff(app, cache, testfiles):
     d = testfiles / "custom_project" / "not_formatted"
 
     cache.assert_that_has_no_tables()
     assert app("--diff", d, "--definitions", d) == success(stdout=match_not(""))
-    cache.assert_that_has_no_tables()
+    assert len(cache.get_files()) == 0
+    assert len(cache.get_formatted()) == 0
+    assert len(cache.get_outputs()) > 0
+
+
+def test_repeated_diff_is_served_from_cache(app, cache, testfiles):
+    d = testfiles / "custom_project" / "not_formatted"
+
+    first = app("--diff", d, "--definitions", d)
+    assert first == success(stdout=match_not(""))
+    outputs = cache.get_outputs()
+
+    assert app("--diff", d, "--definitions", d) == first
+    assert cache.get_outputs() == outputs
+
+
+def test_formatted_output_for_stdin_is_taken_from_cache(app, cache):
+    inp = """set(FOO
+BAR)
+"""
+    assert app("-", input=inp) == success(stdout="set(FOO BAR)\n")
+    assert len(cache.get_outputs()) == 1
+
+    cache.set_formatted_outputs("set(FROM_CACHE)\n")
+    assert app("-", input=inp) == success(stdout="set(FROM_CACHE)\n")
+    assert app("--no-cache", "-", input=inp) == success(stdout="set(FOO BAR)\n")
+
+
+def test_failing_check_is_repeated_from_cache(app, cache, testfiles):
+    d = testfiles / "custom_project" / "not_formatted"
+
+    first = app("--check", d, "--definitions", d)
+    assert first == fail()
+    assert len(cache.get_formatted()) == 0
+    assert len(cache.get_outputs()) > 0
+
+    assert app("--check", d, "--definitions", d) == first
+
+
+def test_outputs_taken_from_cache_count_as_hits(app, testfiles):
+    d = testfiles / "custom_project" / "not_formatted"
+
+    assert app("--check", d, "--definitions", d) == fail()
+    assert app("--check", d, "--definitions", d) == fail()
+
+    outcome = app("--cache-stats")
+    assert outcome == success(stderr="")
+    assert " hits, 0 misses (100% hit rate)\n" in outcome.stdout
 
 
 def test_when_cache_cant_be_modified_it_is_ignored(app, cache, testfiles):
@@ -699,11 +981,13 @@ def test_cache_is_not_updated_when_input_is_from_stdin(app, cache):
     cache.assert_that_has_initialized_tables()
     assert len(cache.get_files()) == 0
     assert len(cache.get_formatted()) == 0
+    assert len(cache.get_outputs()) == 1
 
     assert app("--check", "-", input=inp) == success()
     cache.assert_that_has_initialized_tables()
     assert len(cache.get_files()) == 0
     assert len(cache.get_formatted()) == 0
+    assert len(cache.get_outputs()) == 1
 
 
 warning_params = [
@@ -750,6 +1034,29 @@ def test_check_project_with_conflicting_command_definitions(
     )
 
 
+def test_conflicting_command_definitions_are_reported_once_for_equal_configurations(
+    app, testfiles
+):
+    base = testfiles / "conflicting_definitions"
+    foo1 = (base / "foo1.cmake").resolve()
+    foo2 = (base / "foo2.cmake").resolve()
+    directories = [testfiles / f"same_configuration_{index}" for index in range(4)]
+    for directory in directories:
+        directory.mkdir()
+        shutil.copy(base / "CMakeLists.txt", directory)
+
+    with create_configuration_files(directories, lambda _: {"line_length": 80}):
+        assert app("--check", *directories, "--definitions", base) == success(
+            stdout="",
+            stderr=f"""Warning: conflicting definitions for 'foo':
+(used)    {foo1}:1:10
+(ignored) {foo2}:1:10
+(ignored) {foo2}:5:10
+(ignored) {foo2}:9:10
+""",
+        )
+
+
 def test_check_project_with_conflicting_command_definitions_dont_warn_when_quiet(
     app, testfiles
 ):
@@ -845,7 +1152,7 @@ def test_warn_about_unknown_commands(  # pylint: disable=too-many-arguments,too-
     if check_cache:
         cache.assert_that_has_no_tables()
 
-    assert app(*args, cmakelists, *warning_args) == ExpectedOutcome(
+    expected = ExpectedOutcome(
         returncode=returncode,
         stderr=f"""Warning: unknown command 'watch_nolan_movies' used at:
 {str(cmakelists.resolve())}:3:1
@@ -857,11 +1164,31 @@ Warning: unknown command 'watch_tarantino_movies' used at:
 
 """,
     )
+    assert app(*args, cmakelists, *warning_args) == expected
 
     if check_cache:
         cache.assert_that_has_initialized_tables()
-        assert len(cache.get_files()) == 0
-        assert len(cache.get_formatted()) == 0
+        assert len(cache.get_files()) > 0
+        assert len(cache.get_formatted()) > 0
+
+    assert app(*args, cmakelists, *warning_args) == expected
+
+
+def test_warnings_about_unknown_commands_are_replayed_for_copied_file(
+    app, testfiles, cache
+):
+    target = testfiles / "warn_about_unknown_commands"
+    cmakelists = target / "CMakeLists.txt"
+    copy = target / "copy.cmake"
+
+    assert app("--check", cmakelists) == success(stderr=match_not(""))
+    shutil.copy(cmakelists, copy)
+
+    outcome = app("--check", copy)
+    assert outcome == success(stderr=match_not(""))
+    assert str(copy.resolve()) in outcome.stderr
+    assert str(cmakelists.resolve()) not in outcome.stderr
+    assert len(cache.get_formatted()) == 2
 
 
 @pytest.mark.parametrize(
@@ -1160,6 +1487,30 @@ def test_each_file_uses_closest_configuration_file_with_some_not_supported_optio
         )
 
 
+def test_many_small_configuration_buckets_are_handled_together(app, testfiles):
+    d = testfiles / "directory_with_formatted_files"
+    root = testfiles / "many_configurations"
+    copies = [root / f"copy_{index}" for index in range(16)]
+    for copy in copies:
+        shutil.copytree(d, copy)
+
+    def line_length(directory):
+        return {"line_length": 80 + copies.index(directory) % 2}
+
+    with create_configuration_files(copies, line_length):
+        assert app("--check", root) == success(stdout="", stderr="")
+
+    def short_lines_in_last_copy(directory):
+        return {"line_length": 30 if directory == copies[-1] else 80}
+
+    with create_configuration_files(copies, short_lines_in_last_copy):
+        outcome = app("--check", root)
+        assert outcome == fail(stdout="")
+        reformatted_files = outcome.stderr.splitlines()
+        assert len(reformatted_files) > 0
+        assert all(copies[-1].name in line for line in reformatted_files)
+
+
 def test_disable_formatting(app, testfiles):
     not_formatted = testfiles / "custom_project" / "not_formatted"
 
@@ -0,0 +1,133 @@
+# pylint: disable=redefined-outer-name
+from pathlib import Path
+import socket
+import subprocess
+import tempfile
+import time
+import pytest
+from gersemi.daemon import SOCKET_ENVIRONMENT_VARIABLE
+from tests.fixtures.app import App, success
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="Daemon requires Unix sockets"
+)
+
+
+def wait_for(path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{path} didn't appear in time")
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def daemon_socket():
+    with tempfile.TemporaryDirectory(prefix="gersemi-") as directory:
+        socket_path = Path(directory) / "daemon.sock"
+        with subprocess.Popen(
+            ["gersemi-daemon", "--socket", str(socket_path)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) as daemon:
+            try:
+                wait_for(socket_path)
+                yield socket_path
+            finally:
+                daemon.terminate()
+                daemon.wait()
+
+
+def client_with_socket(cache, tmpdir, socket_path):
+    app = App(cache=cache, fallback_cwd=tmpdir, executable="gersemi-client")
+
+    def impl(*args, **kwargs):
+        kwargs["env"] = {
+            SOCKET_ENVIRONMENT_VARIABLE: str(socket_path),
+            **kwargs.get("env", {}),
+        }
+        return app(*args, **kwargs)
+
+    return impl
+
+
+@pytest.fixture
+def client(cache, tmpdir, daemon_socket):
+    return client_with_socket(cache, tmpdir, daemon_socket)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ("--check", "directory_with_some_not_formatted_files"),
+        ("--diff", "directory_with_some_not_formatted_files"),
+        ("--check", "--diff", "directory_with_some_not_formatted_files"),
+        ("--no-cache", "not_formatted_file.cmake"),
+        ("--print-config", "minimal", "directory_with_formatted_files"),
+        ("--check", "--line-length", "abc", "formatted_file.cmake"),
+        ("--check", "nonexistent_file.cmake"),
+    ],
+)
+def test_client_behaves_like_gersemi(app, client, testfiles, args):
+    assert client(*args, cwd=testfiles) == app(*args, cwd=testfiles)
+
+
+def test_client_forwards_stdin(app, client):
+    given = "set( FOO BAR )"
+    assert client("-", input=given) == app("-", input=given)
+
+
+def test_client_formats_in_place(client, testfiles):
+    base = testfiles / "directory_with_some_not_formatted_files"
+    assert client("--check", base).returncode == 1
+    assert client("--in-place", base) == success(stdout="", stderr="")
+    assert client("--check", base) == success(stdout="", stderr="")
+
+
+def test_client_warns_about_conflicting_definitions_every_time(app, client, testfiles):
+    base = testfiles / "conflicting_definitions"
+    expected = app("--check", base, "--definitions", base)
+    assert client("--check", base, "--definitions", base) == expected
+    assert client("--check", base, "--definitions", base) == expected
+
+
+def test_daemon_notices_changed_definitions(client, testfiles):
+    definitions = testfiles / "definitions.cmake"
+    arguments = ["A", *["ARGUMENT"] * 5, "C", *["ARGUMENT"] * 5]
+    given = f"foo({' '.join(arguments)})\n"
+
+    definitions.write_text(
+        "function(foo)\ncmake_parse_arguments(THIS_FUNCTION_PREFIX "
+        '"" "" "A;B")\nendfunction()\n',
+        encoding="utf-8",
+    )
+    before = client("--definitions", definitions, "--", "-", input=given)
+
+    definitions.write_text(
+        "function(foo)\ncmake_parse_arguments(THIS_FUNCTION_PREFIX "
+        '"" "" "C;D;E")\nendfunction()\n',
+        encoding="utf-8",
+    )
+    after = client("--definitions", definitions, "--", "-", input=given)
+
+    assert before.returncode == after.returncode == 0
+    assert before.stdout != after.stdout
+
+
+def test_daemon_notices_changed_configuration_file(client, testfiles):
+    base = testfiles / "daemon"
+    base.mkdir()
+    (base / ".gersemirc").write_text("line_length: 80\n", encoding="utf-8")
+    source = base / "CMakeLists.txt"
+    source.write_text("set(FOO A_LONG_VALUE ANOTHER_LONG_VALUE)\n", encoding="utf-8")
+
+    assert client("--check", source) == success(stdout="", stderr="")
+
+    (base / ".gersemirc").write_text("line_length: 20\n", encoding="utf-8")
+    assert client("--check", source).returncode == 1
+
+
+def test_client_works_without_daemon(app, cache, tmpdir, testfiles):
+    client = client_with_socket(cache, tmpdir, Path(tmpdir) / "missing.sock")
+    args = ("--check", "directory_with_some_not_formatted_files")
+    assert client(*args, cwd=testfiles) == app(*args, cwd=testfiles)
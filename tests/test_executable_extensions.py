@@ -199,6 +199,7 @@ extensions:
 indent: 4
 line_length: 80
 list_expansion: favour-inlining
+sanity_check_sampling: 100
 sort_order: case-sensitive
 unsafe: true
 warn_about_unknown_commands: true
@@ -0,0 +1,208 @@
+# pylint: disable=redefined-outer-name
+from pathlib import Path
+import subprocess
+import pytest
+from gersemi.lsp import apply_change, read_message, write_message
+
+
+class LanguageServer:
+    def __init__(self, process):
+        self.process = process
+        self.next_id = 0
+        self.logs = []
+
+    def notify(self, method, params):
+        message = {"jsonrpc": "2.0", "method": method, "params": params}
+        write_message(self.process.stdin, message)
+
+    def request(self, method, params):
+        self.next_id += 1
+        message = {"jsonrpc": "2.0", "id": self.next_id, "method": method}
+        write_message(self.process.stdin, {**message, "params": params})
+        while True:
+            response = read_message(self.process.stdout)
+            if response.get("id") == self.next_id:
+                return response
+            if response.get("method") == "window/logMessage":
+                self.logs.append(response["params"]["message"])
+
+    def open(self, uri, text):
+        self.notify(
+            "textDocument/didOpen",
+            {
+                "textDocument": {
+                    "uri": uri,
+                    "languageId": "cmake",
+                    "version": 1,
+                    "text": text,
+                }
+            },
+        )
+
+    def format(self, uri):
+        return self.request(
+            "textDocument/formatting",
+            {"textDocument": {"uri": uri}, "options": {}},
+        )
+
+
+@pytest.fixture
+def language_server(tmpdir):
+    with subprocess.Popen(
+        ["gersemi", "--lsp"],
+        cwd=tmpdir,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    ) as process:
+        server = LanguageServer(process)
+        response = server.request("initialize", {"capabilities": {}})
+        assert response["result"]["capabilities"]["documentFormattingProvider"]
+        server.notify("initialized", {})
+        try:
+            yield server
+        finally:
+            server.request("shutdown", None)
+            server.notify("exit", None)
+            assert process.wait() == 0
+
+
+@pytest.fixture
+def document(tmpdir):
+    return Path(tmpdir / "CMakeLists.txt").as_uri()
+
+
+def test_format_document(language_server, document):
+    language_server.open(document, "set( FOO BAR )\n")
+    response = language_server.format(document)
+    assert [edit["newText"] for edit in response["result"]] == ["set(FOO BAR)\n"]
+    assert any("textDocument/formatting took" in log for log in language_server.logs)
+
+
+def test_formatted_document_requires_no_edits(language_server, document):
+    language_server.open(document, "set(FOO BAR)\n")
+    assert language_server.format(document)["result"] == []
+
+
+def test_format_document_after_incremental_changes(language_server, document):
+    language_server.open(document, "set(FOO BAR)\n")
+    language_server.notify(
+        "textDocument/didChange",
+        {
+            "textDocument": {"uri": document, "version": 2},
+            "contentChanges": [
+                {
+                    "range": {
+                        "start": {"line": 0, "character": 4},
+                        "end": {"line": 0, "character": 4},
+                    },
+                    "text": "  ",
+                }
+            ],
+        },
+    )
+    response = language_server.format(document)
+    assert [edit["newText"] for edit in response["result"]] == ["set(FOO BAR)\n"]
+
+
+def test_format_range(language_server, document):
+    language_server.open(document, "set( FOO BAR )\nset( FOO BAR )\nset( FOO BAR )\n")
+    response = language_server.request(
+        "textDocument/rangeFormatting",
+        {
+            "textDocument": {"uri": document},
+            "range": {
+                "start": {"line": 1, "character": 0},
+                "end": {"line": 2, "character": 0},
+            },
+            "options": {},
+        },
+    )
+    assert [edit["newText"] for edit in response["result"]] == [
+        "set( FOO BAR )\nset(FOO BAR)\nset( FOO BAR )\n"
+    ]
+
+
+def test_document_with_invalid_code(language_server, document):
+    language_server.open(document, "set(FOO BAR\n")
+    response = language_server.format(document)
+    assert "error" in response
+
+
+def test_warnings_are_logged(language_server, document):
+    language_server.open(document, "foo_bar_baz( FOO BAR )\n")
+    response = language_server.format(document)
+    assert [edit["newText"] for edit in response["result"]] == [
+        "foo_bar_baz(FOO BAR)\n"
+    ]
+    assert any("unknown command 'foo_bar_baz'" in log for log in language_server.logs)
+
+
+def test_document_follows_configuration_file(language_server, document, tmpdir):
+    (tmpdir / ".gersemirc").write_text("indent: 2\n", encoding="utf-8")
+    given = "if(TRUE)\nset(FOO BAR)\nendif()\n"
+    language_server.open(document, given)
+    response = language_server.format(document)
+    assert [edit["newText"] for edit in response["result"]] == [
+        "if(TRUE)\n  set(FOO BAR)\nendif()\n"
+    ]
+
+    (tmpdir / ".gersemirc").write_text("indent: 3\n", encoding="utf-8")
+    response = language_server.format(document)
+    assert [edit["newText"] for edit in response["result"]] == [
+        "if(TRUE)\n   set(FOO BAR)\nendif()\n"
+    ]
+
+
+@pytest.mark.parametrize(
+    ("text", "change", "expected"),
+    [
+        ("abc\ndef\n", {"text": "xyz\n"}, "xyz\n"),
+        (
+            "abc\ndef\n",
+            {
+                "range": {
+                    "start": {"line": 1, "character": 1},
+                    "end": {"line": 1, "character": 2},
+                },
+                "text": "E",
+            },
+            "abc\ndEf\n",
+        ),
+        (
+            "abc\ndef\n",
+            {
+                "range": {
+                    "start": {"line": 0, "character": 3},
+                    "end": {"line": 1, "character": 0},
+                },
+                "text": "",
+            },
+            "abcdef\n",
+        ),
+        (
+            "\U0001f332x\n",
+            {
+                "range": {
+                    "start": {"line": 0, "character": 2},
+                    "end": {"line": 0, "character": 3},
+                },
+                "text": "y",
+            },
+            "\U0001f332y\n",
+        ),
+        (
+            "abc",
+            {
+                "range": {
+                    "start": {"line": 5, "character": 0},
+                    "end": {"line": 5, "character": 0},
+                },
+                "text": "\n",
+            },
+            "abc\n",
+        ),
+    ],
+)
+def test_apply_change(text, change, expected):
+    assert apply_change(text, change) == expected
@@ -226,6 +226,7 @@ def verbose_config(
     indent=4,
     line_length=80,
     list_expansion="favour-inlining",
+    sanity_check_sampling=100,
     sort_order="case-sensitive",
     unsafe="true",
     warn_about_unknown_commands="true",
@@ -236,6 +237,7 @@ extensions:{extensions}
 indent: {indent}
 line_length: {line_length}
 list_expansion: {list_expansion}
+sanity_check_sampling: {sanity_check_sampling}
 sort_order: {sort_order}
 unsafe: {unsafe}
 warn_about_unknown_commands: {warn_about_unknown_commands}"""